@@ -0,0 +1,422 @@
+import os
+import json
+import threading
+from datetime import date
+
+import numpy as np
+
+from database import month_close
+
+# One flat binary file per column, appended to as new ids arrive and memory-mapped for reading
+COLUMNS = (
+    ('id', np.int64),
+    ('amount_cents', np.int64),
+    ('day', np.int32),  # Days since 1970-01-01
+    ('type_id', np.int16),  # 0 marks a row that has been deleted since it was loaded
+    ('category_id', np.int32),
+    ('account_id', np.int32),
+)
+
+SNAPSHOT_VERSION = 2
+
+# Past this share of deleted rows the snapshot is rebuilt instead of carrying the dead rows around
+MAX_DELETED_FRACTION = 0.25
+
+
+def day_number(value):
+    return (date.fromisoformat(value) - date(1970, 1, 1)).days
+
+
+def month_number(year_month):
+    # 'YYYY-MM' -> months since 1970-01
+    year, month = map(int, year_month.split('-'))
+    return (year - 1970) * 12 + month - 1
+
+
+def month_label(number):
+    return f"{1970 + number // 12:04d}-{number % 12 + 1:02d}"
+
+
+def day_months(days):
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the points that carry a line's visible shape, first and last included
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return x, y
+
+    xs = np.asarray(x).astype(np.float64)
+    ys = np.asarray(y, dtype=np.float64)
+    every = (count - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_start = end
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        average_x = xs[next_start:next_end].mean()
+        average_y = ys[next_start:next_end].mean()
+
+        # The point in this bucket making the largest triangle with the previous pick and the next bucket's mean
+        areas = np.abs((xs[previous] - average_x) * (ys[start:end] - ys[previous])
+                       - (xs[previous] - xs[start:end]) * (average_y - ys[previous]))
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+
+    return x[selected], y[selected]
+
+
+class AnalyticsSnapshot:
+    # Transactions as NumPy columns, persisted next to the database and kept current from change notifications
+    def __init__(self, db_manager, directory=None):
+        self.db_manager = db_manager
+        if directory is None and db_manager.db_path != ':memory:':
+            directory = db_manager.db_path + '.analytics'
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.pending = []
+        self.checked = False
+
+        self.load()
+        db_manager.add_listener(self.on_change)
+
+    def on_change(self, change):
+        # Runs on the writing thread; the work happens at the next refresh on whichever thread asks
+        with self.lock:
+            self.pending.append(change)
+
+    def column_path(self, name):
+        return os.path.join(self.directory, name + '.bin')
+
+    def load(self):
+        self.max_id = 0
+        self.count = 0
+        self.deleted = 0
+        self.columns = {name: np.zeros(0, dtype) for name, dtype in COLUMNS}
+        if self.directory is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(os.path.join(self.directory, 'meta.json')) as meta_file:
+                meta = json.load(meta_file)
+            if meta['version'] != SNAPSHOT_VERSION:
+                raise ValueError(meta['version'])
+            count = meta['count']
+            for name, dtype in COLUMNS:
+                # A crash mid-append leaves bytes past the recorded count; a short file means the snapshot is lost
+                size = count * np.dtype(dtype).itemsize
+                if os.path.getsize(self.column_path(name)) < size:
+                    raise ValueError(name)
+                os.truncate(self.column_path(name), size)
+        except (OSError, ValueError, KeyError):
+            self.truncate()
+            return
+
+        self.max_id = meta['max_id']
+        self.count = count
+        self.deleted = meta['deleted']
+        self.open_columns()
+
+    def open_columns(self):
+        if self.directory is None:
+            return
+        self.columns = {name: np.memmap(self.column_path(name), dtype=dtype, mode='r+', shape=(self.count,))
+                        if self.count else np.zeros(0, dtype) for name, dtype in COLUMNS}
+
+    def save_meta(self):
+        if self.directory is None:
+            return
+        for column in self.columns.values():
+            if isinstance(column, np.memmap):
+                column.flush()
+        path = os.path.join(self.directory, 'meta.json')
+        with open(path + '.tmp', 'w') as meta_file:
+            json.dump({'version': SNAPSHOT_VERSION, 'max_id': self.max_id, 'count': self.count,
+                       'deleted': self.deleted}, meta_file)
+        os.replace(path + '.tmp', path)
+
+    def truncate(self):
+        self.max_id = 0
+        self.count = 0
+        self.deleted = 0
+        self.columns = {name: np.zeros(0, dtype) for name, dtype in COLUMNS}
+        if self.directory is not None:
+            for name, _ in COLUMNS:
+                open(self.column_path(name), 'wb').close()
+            self.save_meta()
+
+    def append(self, rows):
+        # rows: an (n, 6) int64 array in COLUMNS order, ids ascending and above max_id
+        new_columns = {name: np.ascontiguousarray(rows[:, index], dtype=dtype)
+                       for index, (name, dtype) in enumerate(COLUMNS)}
+        if self.directory is None:
+            self.columns = {name: np.concatenate([self.columns[name], new_columns[name]]) for name, _ in COLUMNS}
+        else:
+            for name, _ in COLUMNS:
+                with open(self.column_path(name), 'ab') as column_file:
+                    column_file.write(new_columns[name].tobytes())
+        self.count += len(rows)
+        self.max_id = int(rows[-1, 0])
+        self.open_columns()
+
+    def load_rows(self, after_id, chunk_size=200000):
+        # Appends every row past after_id; returns whether there were any
+        loaded = False
+        cursor = self.db_manager.read_cursor()
+        cursor.execute('''
+        SELECT id, amount_cents, CAST(julianday(date) - 2440587.5 AS INTEGER), type_id, category_id, account_id
+        FROM transactions WHERE id > ? ORDER BY id
+        ''', (after_id,))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            self.append(np.array(rows, dtype=np.int64))
+            loaded = True
+        return loaded
+
+    def rebuild(self):
+        self.truncate()
+        self.load_rows(0)
+        self.save_meta()
+
+    def apply_change(self, change):
+        # Deletes and edits of rows already loaded are patched in place; rows past max_id arrive by id
+        if change.rows is None:
+            # No rows to patch: a bulk load only appends past max_id, but a restore can replace any of them, so
+            # the next refresh checks the snapshot against the rollup again and rebuilds if they differ
+            self.checked = False
+            return
+        ids = self.columns['id']
+        positions = np.searchsorted(ids, [row[0] for row in change.rows])
+        for position, (transaction_id, transaction_type, category, amount, transaction_date, _, account_id) in \
+                zip(positions, change.rows):
+            if position >= self.count or ids[position] != transaction_id:
+                continue
+            if change.kind == 'delete':
+                if self.columns['type_id'][position]:
+                    self.columns['type_id'][position] = 0
+                    self.deleted += 1
+            else:
+                type_id = self.db_manager.type_id(transaction_type)
+                category_id = self.db_manager.category_ids.get((type_id, category))
+                if category_id is None:
+                    self.db_manager.load_lookups()
+                    category_id = self.db_manager.category_ids[(type_id, category)]
+                if not self.columns['type_id'][position]:
+                    self.deleted -= 1
+                self.columns['type_id'][position] = type_id
+                self.columns['category_id'][position] = category_id
+                self.columns['amount_cents'][position] = round(amount * 100)
+                self.columns['day'][position] = day_number(transaction_date)
+                self.columns['account_id'][position] = account_id
+
+    def refresh(self):
+        with self.lock:
+            changes, self.pending = self.pending, []
+            for change in changes:
+                self.apply_change(change)
+            if self.load_rows(self.max_id) or changes:
+                self.save_meta()
+
+            # Writes made while the snapshot wasn't listening (another process, an earlier session) show up here
+            if not self.checked:
+                self.checked = True
+                if not self.verify():
+                    self.rebuild()
+            elif self.count and self.deleted > MAX_DELETED_FRACTION * self.count:
+                self.rebuild()
+            return dict(self.columns)
+
+    def verify(self):
+        # The snapshot grouped by (type, category, month) must match the trigger-maintained rollup exactly
+        cursor = self.db_manager.read_cursor()
+        cursor.execute('''
+        SELECT type_id, category_id, year_month, SUM(total_cents), SUM(count) FROM monthly_rollup WHERE count > 0
+        GROUP BY type_id, category_id, year_month
+        ''')
+        rollup = cursor.fetchall()
+
+        live = self.columns['type_id'] != 0
+        months = day_months(np.asarray(self.columns['day'])[live])
+        if not rollup:
+            return not len(months)
+        first_month = min(months.min() if len(months) else 0, min(month_number(row[2]) for row in rollup))
+        keys = ((np.asarray(self.columns['type_id'])[live].astype(np.int64) * 1000003
+                 + np.asarray(self.columns['category_id'])[live]) * 100000 + (months - first_month))
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=np.asarray(self.columns['amount_cents'])[live])
+        counts = np.bincount(inverse)
+
+        expected = sorted(((type_id * 1000003 + category_id) * 100000 + month_number(year_month) - first_month,
+                           total_cents, count) for type_id, category_id, year_month, total_cents, count in rollup)
+        return (len(expected) == len(unique_keys)
+                and np.array_equal(unique_keys, [row[0] for row in expected])
+                and np.array_equal(totals, [row[1] for row in expected])
+                and np.array_equal(counts, [row[2] for row in expected]))
+
+    def select(self, transaction_type=None, start_date=None, end_date=None, account_id=None):
+        # Columns of the live rows for a type, inclusive date range and account (None for every account), plus
+        # 'amount' in cents of the account's currency or, across accounts, of the base currency
+        columns = self.refresh()
+        type_ids = np.asarray(columns['type_id'])
+        mask = type_ids != 0
+        if transaction_type is not None:
+            mask &= type_ids == (self.db_manager.type_id(transaction_type) or -1)
+        if account_id is not None:
+            mask &= np.asarray(columns['account_id']) == account_id
+        days = np.asarray(columns['day'])
+        if start_date:
+            mask &= days >= day_number(start_date)
+        if end_date:
+            mask &= days <= day_number(end_date)
+        rows = {name: np.asarray(column)[mask] for name, column in columns.items()}
+        rows['amount'] = self.converted_amounts(rows, self.db_manager.account_scope(account_id)[1])
+        return rows
+
+    def converted_amounts(self, rows, currency):
+        # Each row's cents converted at its month's closing rate, the way DatabaseManager converts the rollup
+        amounts = rows['amount_cents'].astype(np.float64)
+        if any(account_id not in self.db_manager.accounts for account_id in np.unique(rows['account_id']).tolist()):
+            self.db_manager.load_lookups()
+        accounts = self.db_manager.accounts
+        foreign = [account_id for account_id, (_, account_currency) in accounts.items()
+                   if account_currency != currency]
+        if not foreign or not len(amounts):
+            return amounts
+
+        mask = np.isin(rows['account_id'], foreign)
+        keys = rows['account_id'][mask].astype(np.int64) * 100000 + day_months(rows['day'][mask])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        factors = np.array([self.db_manager.exchange_rate(accounts[key // 100000][1], currency,
+                                                          month_close(month_label(key % 100000)))
+                            for key in unique_keys.tolist()])
+        amounts[mask] *= factors[inverse]
+        return amounts
+
+    def category_names(self, transaction_type):
+        type_id = self.db_manager.type_id(transaction_type)
+        return {category_id: name for (category_type_id, name), category_id in self.db_manager.category_ids.items()
+                if category_type_id == type_id}
+
+    def category_totals(self, transaction_type, start_date=None, end_date=None, account_id=None):
+        # Same answer as DatabaseManager.get_category_totals, from one bincount
+        rows = self.select(transaction_type, start_date, end_date, account_id)
+        if not len(rows['id']):
+            return []
+        totals = np.bincount(rows['category_id'], weights=rows['amount'])
+        counts = np.bincount(rows['category_id'])
+        names = self.category_names(transaction_type)
+        return [(names[category_id], totals[category_id] / 100) for category_id in np.flatnonzero(counts)]
+
+    def monthly_totals(self, start_month=None, end_month=None, account_id=None):
+        # Same answer as DatabaseManager.get_monthly_totals: zero-filled (month, income, expense) tuples
+        rows = self.select(None, start_month and start_month + '-01', None, account_id)
+        months = day_months(rows['day'])
+        if end_month:
+            keep = months <= month_number(end_month)
+            rows = {name: column[keep] for name, column in rows.items()}
+            months = months[keep]
+        if not len(months) and not (start_month and end_month):
+            return []
+
+        first = month_number(start_month) if start_month else int(months.min())
+        last = month_number(end_month) if end_month else int(months.max())
+        series = {}
+        for transaction_type in ("Income", "Expense"):
+            mask = rows['type_id'] == (self.db_manager.type_id(transaction_type) or -1)
+            series[transaction_type] = np.bincount(months[mask] - first, weights=rows['amount'][mask],
+                                                   minlength=last - first + 1)[:last - first + 1] / 100
+        return [(month_label(first + index), series["Income"][index], series["Expense"][index])
+                for index in range(last - first + 1)]
+
+    def daily_net(self, start_date=None, end_date=None, account_id=None):
+        # (days as datetime64, income minus expense per day) over every day from the first to the last
+        rows = self.select(None, start_date, end_date, account_id)
+        if not len(rows['id']):
+            return np.zeros(0, 'datetime64[D]'), np.zeros(0)
+        signs = np.where(rows['type_id'] == self.db_manager.type_id("Income"), 1, -1)
+        first = int(rows['day'].min())
+        net = np.bincount(rows['day'] - first, weights=signs * rows['amount']) / 100
+        return np.arange(first, first + len(net)).astype('datetime64[D]'), net
+
+    def running_balance(self, start_date=None, end_date=None, account_id=None):
+        # Balance at the end of each day; the history before start_date still counts toward it
+        days, net = self.daily_net(None, end_date, account_id)
+        balance = np.cumsum(net)
+        if start_date:
+            keep = days >= np.datetime64(start_date)
+            days, balance = days[keep], balance[keep]
+        return days, balance
+
+    def rolling_average(self, transaction_type, window_days=30, start_date=None, end_date=None, account_id=None):
+        # Trailing mean of daily totals, every day counted including the ones without transactions
+        rows = self.select(transaction_type, start_date, end_date, account_id)
+        if not len(rows['id']):
+            return np.zeros(0, 'datetime64[D]'), np.zeros(0)
+        first = int(rows['day'].min())
+        daily = np.bincount(rows['day'] - first, weights=rows['amount']) / 100
+        sums = np.cumsum(np.concatenate([[0.0], daily]))
+        counts = np.minimum(np.arange(1, len(daily) + 1), window_days)
+        indexes = np.arange(1, len(daily) + 1)
+        averages = (sums[indexes] - sums[np.maximum(indexes - window_days, 0)]) / counts
+        return np.arange(first, first + len(daily)).astype('datetime64[D]'), averages
+
+    def category_percentiles(self, transaction_type, percentiles=(50, 90, 99), start_date=None, end_date=None,
+                             account_id=None):
+        # {category: [amount at each percentile]} over individual transactions
+        rows = self.select(transaction_type, start_date, end_date, account_id)
+        if not len(rows['id']):
+            return {}
+        order = np.lexsort((rows['amount'], rows['category_id']))
+        categories = rows['category_id'][order]
+        amounts = rows['amount'][order] / 100
+        boundaries = np.flatnonzero(np.diff(categories)) + 1
+        names = self.category_names(transaction_type)
+        return {names[int(group_categories[0])]: np.percentile(group_amounts, percentiles).tolist()
+                for group_categories, group_amounts in zip(np.split(categories, boundaries),
+                                                           np.split(amounts, boundaries))}
+
+    def category_month_matrix(self, transaction_type, start_month=None, end_month=None, account_id=None):
+        # (category names, month labels, categories x months totals) for a heatmap
+        rows = self.select(transaction_type, start_month and start_month + '-01', None, account_id)
+        months = day_months(rows['day'])
+        if end_month:
+            keep = months <= month_number(end_month)
+            rows = {name: column[keep] for name, column in rows.items()}
+            months = months[keep]
+        if not len(months):
+            return [], [], np.zeros((0, 0))
+
+        first = month_number(start_month) if start_month else int(months.min())
+        last = month_number(end_month) if end_month else int(months.max())
+        names = self.category_names(transaction_type)
+        category_ids = sorted(set(np.unique(rows['category_id']).tolist()), key=lambda category_id: names[category_id])
+        row_of = np.zeros(max(category_ids) + 1, dtype=np.int64)
+        row_of[category_ids] = np.arange(len(category_ids))
+
+        width = last - first + 1
+        cells = row_of[rows['category_id']] * width + (months - first)
+        matrix = np.bincount(cells, weights=rows['amount'], minlength=len(category_ids) * width) / 100
+        return ([names[category_id] for category_id in category_ids],
+                [month_label(month) for month in range(first, last + 1)],
+                matrix.reshape(len(category_ids), width))
+
+    def year_over_year(self, transaction_type, account_id=None):
+        # (years, years x 12 monthly totals) so the same month can be compared across years
+        rows = self.select(transaction_type, account_id=account_id)
+        if not len(rows['id']):
+            return [], np.zeros((0, 12))
+        months = day_months(rows['day'])
+        first_year = int(months.min()) // 12
+        last_year = int(months.max()) // 12
+        matrix = np.bincount(months - first_year * 12, weights=rows['amount'],
+                             minlength=(last_year - first_year + 1) * 12) / 100
+        return list(range(1970 + first_year, 1970 + last_year + 1)), matrix.reshape(-1, 12)
@@ -0,0 +1,390 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import date, datetime, timedelta
+
+from budgets import BudgetMonitor
+from database import BUDGET_PERIODS, DatabaseManager, period_date_range
+from exporter import export_transactions
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Ten years of history, ending on a fixed day so every run generates the same ledger
+LEDGER_START = date(2015, 1, 1)
+LEDGER_END = date(2024, 12, 31)
+
+# category: (weight, lognormal mu, lognormal sigma, descriptions); rent and salary are booked monthly instead
+EXPENSE_PROFILE = {
+    "Food": (35, 3.0, 0.7, ["Grocery store", "Coffee shop", "Restaurant", "Bakery", "Takeaway"]),
+    "Transport": (20, 2.7, 0.6, ["Bus fare", "Fuel", "Train ticket", "Taxi", "Parking"]),
+    "Shopping": (12, 3.6, 0.9, ["Clothing", "Electronics", "Online order", "Hardware store"]),
+    "Entertainment": (10, 3.2, 0.7, ["Cinema", "Concert tickets", "Streaming subscription", "Books"]),
+    "Utilities": (5, 4.3, 0.4, ["Electricity bill", "Water bill", "Internet", "Phone bill"]),
+    "Healthcare": (4, 3.8, 0.9, ["Pharmacy", "Dentist", "Doctor visit"]),
+    "Education": (2, 4.5, 0.8, ["Course fee", "Textbooks", "Workshop"]),
+    "Other": (4, 3.3, 1.0, ["Cash withdrawal", "Bank fee", "Miscellaneous"]),
+}
+INCOME_PROFILE = {
+    "Freelance": (3, 6.0, 0.8, ["Client invoice", "Consulting"]),
+    "Investment": (2, 4.5, 1.0, ["Dividend", "Interest"]),
+    "Refund": (2, 3.5, 0.8, ["Store refund", "Tax refund"]),
+    "Gift": (1, 4.0, 0.9, ["Birthday gift", "Gift"]),
+    "Other": (1, 3.5, 1.0, ["Sold item", "Cashback"]),
+}
+MONTHLY = [("Income", "Salary", 3200.00, "Monthly salary"), ("Expense", "Rent", 1150.00, "Monthly rent")]
+
+# Extra accounts with --accounts cycle through these currencies, priced against the base one at a drifting rate
+ACCOUNT_CURRENCIES = [("EUR", 1.10), ("GBP", 1.27), ("USD", 1.0)]
+
+
+def generate_ledger(count, seed=0):
+    # Yields exactly count (type, category, amount, date, description) tuples in date order
+    rnd = random.Random(seed)
+    choices = [("Expense", category, profile) for category, profile in EXPENSE_PROFILE.items()]
+    choices += [("Income", category, profile) for category, profile in INCOME_PROFILE.items()]
+    weights = [profile[0] for _, _, profile in choices]
+
+    days = (LEDGER_END - LEDGER_START).days + 1
+    for day in range(days):
+        current = LEDGER_START + timedelta(days=day)
+        transaction_date = current.isoformat()
+        quota = (day + 1) * count // days - day * count // days
+
+        if current.day == 1:
+            for transaction_type, category, amount, description in MONTHLY[:quota]:
+                yield transaction_type, category, amount, transaction_date, description
+            quota -= min(quota, len(MONTHLY))
+
+        # Weekends see more spending on food and entertainment
+        weekend = current.weekday() >= 5
+        for transaction_type, category, profile in rnd.choices(choices, weights, k=quota):
+            _, mu, sigma, descriptions = profile
+            if weekend and category in ("Food", "Entertainment"):
+                mu += 0.3
+            amount = max(0.01, round(rnd.lognormvariate(mu, sigma), 2))
+            yield transaction_type, category, amount, transaction_date, rnd.choice(descriptions)
+
+
+def open_accounts(db_manager, accounts, seed=0):
+    # The default account plus accounts - 1 more, with a rate per month for every foreign currency among them
+    rnd = random.Random(seed)
+    account_ids = [db_manager.get_accounts()[0][0]]
+    for number in range(1, accounts):
+        currency, rate = ACCOUNT_CURRENCIES[(number - 1) % len(ACCOUNT_CURRENCIES)]
+        account_ids.append(db_manager.add_account(f"Account {number + 1}", currency))
+        if currency == db_manager.base_currency or number > len(ACCOUNT_CURRENCIES):
+            continue
+        month = LEDGER_START
+        while month <= LEDGER_END:
+            rate = round(rate * rnd.uniform(0.98, 1.02), 4)
+            db_manager.set_fx_rate(currency, db_manager.base_currency, month.isoformat(), rate)
+            month = (month + timedelta(days=32)).replace(day=1)
+    return account_ids
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def uncached(db_manager, function):
+    # Time SQLite rather than the query cache; the cached path is measured separately
+    def run():
+        db_manager.cache.clear()
+        function()
+    return run
+
+
+def benchmark_methods(db_manager, count, repeat, max_materialize, account_ids=()):
+    this_month = period_date_range("This Month", today=LEDGER_END)
+    last_month = period_date_range("Last Month", today=LEDGER_END)
+    middle_id = count // 2 or 1
+    middle_date = db_manager.get_transaction(middle_id)[4]
+
+    queries = {
+        "get_transaction": lambda: db_manager.get_transaction(middle_id),
+        "get_transactions_page": lambda: db_manager.get_transactions_page(500),
+        "get_transactions_page_after": lambda: db_manager.get_transactions_page(500, (middle_date, middle_id)),
+        "get_transactions_by_date_range": lambda: db_manager.get_transactions_by_date_range(*last_month),
+        "search_transactions": lambda: db_manager.search_transactions("coffee"),
+        "search_transactions_filtered": lambda: db_manager.search_transactions(
+            "coffee shop", "Expense", ('2020-01-01', '2020-12-31'), 100),
+        "get_category_totals_all_time": lambda: db_manager.get_category_totals("Expense"),
+        "get_category_totals_this_month": lambda: db_manager.get_category_totals("Expense", *this_month),
+        "get_category_totals_partial_months": lambda: db_manager.get_category_totals(
+            "Expense", '2019-03-15', '2023-08-20'),
+        "get_total_amount_by_type_all_time": lambda: db_manager.get_total_amount_by_type("Income"),
+        "get_total_amount_by_type_last_month": lambda: db_manager.get_total_amount_by_type("Income", *last_month),
+        "get_monthly_totals_12_months": lambda: db_manager.get_monthly_totals('2024-01', '2024-12'),
+        "get_monthly_totals_all_years": lambda: db_manager.get_monthly_totals(),
+        "get_balance_at": lambda: db_manager.get_balance_at(middle_date),
+        "get_daily_balances_12_months": lambda: db_manager.get_daily_balances('2024-01-01', '2024-12-31'),
+        "get_daily_balances_all_time": lambda: db_manager.get_daily_balances(),
+    }
+    # Full listings hold every row in memory at once
+    full_listings = {
+        "get_all_transactions": db_manager.get_all_transactions,
+        "get_transactions_by_type": lambda: db_manager.get_transactions_by_type("Income"),
+    }
+
+    if len(account_ids) > 1:
+        # One account on its own, and what the dashboard reads when the account selector moves to it
+        account_id = account_ids[-1]
+
+        def switch_account():
+            db_manager.get_total_amount_by_type("Income", account_id=account_id)
+            db_manager.get_total_amount_by_type("Expense", account_id=account_id)
+            db_manager.get_category_totals("Expense", *this_month, account_id)
+            db_manager.get_transactions_page(500, None, account_id)
+
+        queries.update({
+            "get_transactions_page_account": lambda: db_manager.get_transactions_page(500, None, account_id),
+            "get_category_totals_account": lambda: db_manager.get_category_totals("Expense", None, None, account_id),
+            "get_monthly_totals_account": lambda: db_manager.get_monthly_totals(None, None, account_id),
+            "get_daily_balances_account": lambda: db_manager.get_daily_balances(None, None, account_id),
+            "switch_account": switch_account,
+        })
+
+    results = {}
+    for name, function in queries.items():
+        results[name] = measure(uncached(db_manager, function), repeat)
+    for name, function in full_listings.items():
+        if count > max_materialize:
+            results[name] = {"skipped": f"more than {max_materialize:,} rows"}
+        else:
+            results[name] = measure(uncached(db_manager, function), repeat)
+
+    # Exports stream in chunks, so they run at every size; writing to the null device times the encoding alone
+    for file_format in ("csv", "jsonl"):
+        results[f"export_{file_format}"] = measure(
+            lambda: export_transactions(db_manager, os.devnull, file_format), 1)
+
+    # Switching the pie chart between periods should be served from the cache
+    db_manager.get_category_totals("Expense", *this_month)
+    results["get_category_totals_cached"] = measure(
+        lambda: db_manager.get_category_totals("Expense", *this_month), repeat)
+
+    added = []
+    results["add_transaction"] = measure(
+        lambda: added.append(db_manager.add_transaction("Expense", "Food", 12.5, middle_date, "Benchmark")), repeat)
+    results["delete_transaction"] = measure(lambda: db_manager.delete_transaction(added.pop()), repeat)
+
+    # A budget per expense category, period and account (and over every account); writes dated today fall in
+    # every current period, so each one updates its category's budgets
+    budget_ids = [db_manager.add_budget(category, 500.0, period, account_id) for category in EXPENSE_PROFILE
+                  for period in BUDGET_PERIODS for account_id in [None, *account_ids]]
+    monitor = BudgetMonitor(db_manager)
+    results["budget_monitor_reload"] = measure(uncached(db_manager, monitor.reload), repeat)
+    today = date.today().isoformat()
+    results["add_transaction_with_budgets"] = measure(
+        lambda: added.append(db_manager.add_transaction("Expense", "Food", 12.5, today, "Benchmark")), repeat)
+    results["delete_transaction_with_budgets"] = measure(lambda: db_manager.delete_transaction(added.pop()), repeat)
+    results["budget_status"] = measure(monitor.status, repeat)
+    monitor.close()
+    for budget_id in budget_ids:
+        db_manager.delete_budget(budget_id)
+    results["check_query_plans"] = measure(db_manager.check_query_plans, 1)
+    return results
+
+
+def benchmark_views(db_manager, repeat):
+    # The GUI stack is optional; without it the view timings are left out
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt5.QtWidgets import QApplication, QTableView
+        from main import TransactionTableModel
+        from charts import PieChartWidget, BarChartWidget, RunningBalanceChartWidget
+    except ImportError as error:
+        return {"skipped": str(error)}
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    class ImmediateExecutor:
+        # Runs chart and table queries inline so a timing covers query and draw together
+        def submit(self, key, function, callback, failed=None):
+            callback(function(db_manager))
+
+    model = TransactionTableModel(db_manager, ImmediateExecutor())
+    table = QTableView()
+    table.setModel(model)
+    table.resize(1000, 600)
+    table.show()
+
+    def refresh_table():
+        db_manager.cache.clear()
+        model.reload()
+        app.processEvents()
+
+    pie_chart = PieChartWidget(ImmediateExecutor())
+    bar_chart = BarChartWidget(ImmediateExecutor())
+    balance_chart = RunningBalanceChartWidget(ImmediateExecutor())
+    pie_chart.show()
+    bar_chart.show()
+    balance_chart.show()
+    app.processEvents()
+
+    def refresh_chart(chart, period):
+        def run():
+            db_manager.cache.clear()
+            chart.period_combo.setCurrentText(period)
+            chart.refresh()
+            chart.canvas.draw()
+        return run
+
+    results = {
+        "table_refresh": measure(refresh_table, repeat),
+        "table_fetch_more": measure(lambda: model.fetchMore(), repeat),
+        "pie_chart_refresh": measure(refresh_chart(pie_chart, "All Time"), repeat),
+        "pie_chart_period_switch": measure(refresh_chart(pie_chart, "Last Month"), repeat),
+        "bar_chart_refresh_12_months": measure(refresh_chart(bar_chart, "Last 12 Months"), repeat),
+        "bar_chart_refresh_all_years": measure(refresh_chart(bar_chart, "All Years"), repeat),
+        "balance_chart_refresh_all_time": measure(refresh_chart(balance_chart, "All Time"), repeat),
+    }
+
+    table.close()
+    pie_chart.close()
+    bar_chart.close()
+    balance_chart.close()
+    return results
+
+
+def benchmark_size(label, count, args):
+    path = os.path.join(args.db_dir, f"benchmark_{label}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    db_manager = DatabaseManager(path)
+    account_ids = open_accounts(db_manager, args.accounts, args.seed)
+    started = time.perf_counter()
+    inserted = 0
+    for number, account_id in enumerate(account_ids):
+        # Every account gets its own ledger over the same ten years, the first one any remainder
+        share = count // len(account_ids) + (count % len(account_ids) if number == 0 else 0)
+        inserted += db_manager.bulk_insert(generate_ledger(share, args.seed + number), account_id=account_id)
+    seconds = time.perf_counter() - started
+    db_manager.close()
+    print(f"{label}: inserted {inserted:,} rows into {len(account_ids)} accounts in {seconds:.2f}s", file=sys.stderr)
+
+    db_manager = DatabaseManager(path)
+    try:
+        result = {
+            "rows": inserted,
+            "bulk_insert": {
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(inserted / seconds),
+            },
+            "database_bytes": os.path.getsize(path),
+            "methods": benchmark_methods(db_manager, count, args.repeat, args.max_materialize, account_ids),
+        }
+        if not args.no_gui:
+            result["views"] = benchmark_views(db_manager, args.repeat)
+    finally:
+        db_manager.close()
+
+    if not args.keep:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(previous, current):
+    # Median time per method, previous run vs this one, on stderr so stdout stays valid JSON
+    for label, result in current["results"].items():
+        old = previous.get("results", {}).get(label)
+        if not old:
+            continue
+        print(f"\n{label}", file=sys.stderr)
+        for section in ("methods", "views"):
+            for name, timing in result.get(section, {}).items():
+                old_timing = old.get(section, {}).get(name)
+                if not isinstance(timing, dict) or "median_ms" not in timing or \
+                        not isinstance(old_timing, dict) or "median_ms" not in old_timing:
+                    continue
+                ratio = timing["median_ms"] / old_timing["median_ms"] if old_timing["median_ms"] else 1.0
+                flag = "  SLOWER" if ratio > 1.2 else ""
+                print(f"  {name:<40}{old_timing['median_ms']:>10.3f} ->{timing['median_ms']:>10.3f} ms"
+                      f"  x{ratio:.2f}{flag}", file=sys.stderr)
+
+
+def parse_size(value):
+    if value.lower() in SIZES:
+        return value.lower(), SIZES[value.lower()]
+    try:
+        return value, int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size {value!r}, expected one of {', '.join(SIZES)} or a count")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Money Tracker benchmarks")
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[parse_size("10k")], metavar="SIZE",
+                        help="10k, 1m, 10m or a row count (default: 10k)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per measurement (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accounts", type=int, default=1,
+                        help="spread the rows over this many accounts in different currencies (default: %(default)s)")
+    parser.add_argument("--db-dir", default=tempfile.gettempdir(), help="where the benchmark databases go")
+    parser.add_argument("--keep", action="store_true", help="keep the generated databases")
+    parser.add_argument("--no-gui", action="store_true", help="skip the offscreen Qt view timings")
+    parser.add_argument("--max-materialize", type=int, default=2_000_000,
+                        help="skip full listings above this many rows (default: %(default)s)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", metavar="JSON", help="print the change against an earlier results file")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "accounts": args.accounts,
+            "repeat": args.repeat,
+        },
+        "results": {label: benchmark_size(label, count, args) for label, count in args.sizes},
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(json.load(previous_file), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
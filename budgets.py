@@ -0,0 +1,192 @@
+import threading
+from calendar import monthrange
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from database import MissingRateError, month_close
+
+# Alert levels of a budget: under its alert threshold, past it, and at or over the limit
+UNDER, WARNING, OVER = 0, 1, 2
+
+
+def budget_window(period, today):
+    # (start_date, end_date) of the weekly (Monday to Sunday), monthly or yearly period that today falls in
+    if period == "weekly":
+        start = today - timedelta(days=today.weekday())
+        end = start + timedelta(days=6)
+    elif period == "monthly":
+        start = today.replace(day=1)
+        end = today.replace(day=monthrange(today.year, today.month)[1])
+    else:
+        start = today.replace(month=1, day=1)
+        end = today.replace(month=12, day=31)
+    return start.isoformat(), end.isoformat()
+
+
+class BudgetStatus:
+    # One budget and what has been spent against it in the current period
+    def __init__(self, budget_id, category, period, limit, alert_at, account_id, currency, start_date, end_date):
+        self.budget_id = budget_id
+        self.category = category
+        self.period = period
+        self.limit = limit
+        self.alert_at = alert_at
+        self.account_id = account_id  # None for every account in the base currency
+        self.currency = currency
+        self.start_date = start_date
+        self.end_date = end_date
+        self.spent = 0.0  # None when a missing exchange rate leaves it unknown
+
+    @property
+    def level(self):
+        if self.spent is None or self.spent < self.alert_at * self.limit:
+            return UNDER
+        return WARNING if self.spent < self.limit else OVER
+
+
+class BudgetMonitor:
+    # Keeps the spend of every budget's current period up to date from each committed write's rows, so a write
+    # costs a dictionary lookup per row and budget instead of a category total per budget
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.budgets = {}
+        self.by_category = {}  # (category, account_id or None) -> [BudgetStatus]
+        self.today = None
+        self.loaded = False
+        self.reload_lock = threading.Lock()
+        self.reloading = False
+        self.changed_during_reload = False
+        self.reloaded = threading.Condition(self.lock)
+        # Reloads asked for by a write run here; one long-lived thread keeps reusing its pooled read connection
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='budget-reload')
+        db_manager.add_listener(self.on_change)
+
+    def add_listener(self, listener):
+        # listener(status) runs on the writing thread whenever a budget moves up to a higher alert level
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def close(self):
+        self.db_manager.remove_listener(self.on_change)
+        self.executor.shutdown()
+
+    def reload(self):
+        # Budgets and their spend from scratch: one category-total query per period and account. A change
+        # committed while the queries run may or may not be in their results, so it makes the reload start over
+        # instead of being applied on top. After the first load, budgets it pushes to a higher level alert.
+        with self.reload_lock:
+            try:
+                while True:
+                    with self.lock:
+                        self.reloading = True
+                        self.changed_during_reload = False
+                    budgets, by_category, today = self.load()
+                    with self.lock:
+                        if self.changed_during_reload:
+                            continue
+                        before = {budget_id: status.level for budget_id, status in self.budgets.items()}
+                        raised = [status for budget_id, status in budgets.items()
+                                  if self.loaded and status.level > before.get(budget_id, UNDER)]
+                        self.budgets = budgets
+                        self.by_category = by_category
+                        self.today = today
+                        self.loaded = True
+                    break
+            finally:
+                with self.lock:
+                    self.reloading = False
+                    self.reloaded.notify_all()
+        self.alert(raised)
+
+    def reload_in_background(self):
+        # Called with self.lock held. Marking the reload as under way straight away sends every later change
+        # to it and makes status() wait for it.
+        self.reloading = True
+        self.executor.submit(self.reload)
+
+    def load(self):
+        today = date.today()
+        budgets = {}
+        totals = {}
+        for budget_id, category, period, limit, alert_at, account_id in self.db_manager.get_budgets():
+            currency = self.db_manager.account_scope(account_id)[1]
+            status = BudgetStatus(budget_id, category, period, limit, alert_at, account_id, currency,
+                                  *budget_window(period, today))
+            key = (period, account_id)
+            if key not in totals:
+                try:
+                    totals[key] = dict(self.db_manager.get_category_totals(
+                        "Expense", status.start_date, status.end_date, account_id))
+                except MissingRateError:
+                    totals[key] = None
+            status.spent = None if totals[key] is None else totals[key].get(category, 0.0)
+            budgets[budget_id] = status
+
+        by_category = {}
+        for status in budgets.values():
+            by_category.setdefault((status.category, status.account_id), []).append(status)
+        return budgets, by_category, today
+
+    def status(self):
+        # Every budget, by category; a new day first moves the windows of any period that ended
+        if self.loaded and self.today != date.today():
+            self.reload()
+        with self.lock:
+            while self.reloading:
+                self.reloaded.wait()
+            return sorted(self.budgets.values(), key=lambda status: (status.category, status.budget_id))
+
+    def on_change(self, change):
+        # Runs on the writing thread, often the GUI's, so anything more than applying the rows is left to a
+        # reload on the monitor's own thread
+        with self.lock:
+            if self.reloading:
+                self.changed_during_reload = True
+                return
+            if not self.loaded:
+                return  # The first load reads it anyway
+            if change.rows is None or change.kind not in ('insert', 'delete') or self.today != date.today():
+                # Bulk writes, new exchange rates and a new period are a full reload, which raises its own alerts
+                self.reload_in_background()
+                return
+            try:
+                # Under the same lock as the check above, so a reload can't start in between and count them twice
+                raised = self.apply_rows(change.rows, 1 if change.kind == 'insert' else -1)
+            except MissingRateError:
+                self.reload_in_background()
+                return
+        self.alert(raised)
+
+    def alert(self, raised):
+        for status in raised:
+            for listener in list(self.listeners):
+                listener(status)
+
+    def apply_rows(self, rows, sign):
+        # Add (or with sign=-1 take back) each expense row in every budget for its category and account; called
+        # with self.lock held
+        accounts = self.db_manager.accounts
+        base_currency = self.db_manager.base_currency
+        raised = []
+        for _, transaction_type, category, amount, transaction_date, _, account_id in rows:
+            if transaction_type != "Expense":
+                continue
+            currency = accounts[account_id][1]
+            for key in ((category, account_id), (category, None)):
+                for status in self.by_category.get(key, ()):
+                    if status.spent is None or not status.start_date <= transaction_date <= status.end_date:
+                        continue
+                    delta = amount
+                    if status.account_id is None and currency != base_currency:
+                        # Converted the way totals over every account are: at the month's closing rate
+                        delta = self.db_manager.convert(amount, currency, base_currency,
+                                                        month_close(transaction_date[:7]))
+                    level = status.level
+                    status.spent = round(status.spent + sign * delta, 2)
+                    if status.level > level:
+                        raised.append(status)
+        return raised
@@ -0,0 +1,427 @@
+import math
+from datetime import datetime
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QDateEdit
+from PyQt5.QtCore import QDate, QTimer
+import numpy as np
+
+from analytics import lttb
+from budgets import OVER, WARNING
+from database import period_date_range, shift_month
+
+
+class ChartWidget(QWidget):
+    # A matplotlib canvas with a period selector; subclasses implement refresh() and keep their artists
+    PERIODS = []
+
+    def __init__(self, query_executor, parent=None):
+        super().__init__(parent)
+        self.query_executor = query_executor
+        self.update_pending = False
+        self.account_id = None  # None charts every account in the base currency
+        self.layout = QVBoxLayout(self)
+
+        self.figure, self.ax = plt.subplots(figsize=(5, 4), dpi=100)
+        self.canvas = FigureCanvas(self.figure)
+        self.layout.addWidget(self.canvas)
+
+        # Period selection
+        self.period_layout = QHBoxLayout()
+        self.period_combo = QComboBox()
+        self.period_combo.addItems(list(self.PERIODS))
+        self.period_combo.currentIndexChanged.connect(self.update_chart)
+        self.period_layout.addWidget(QLabel("Period:"))
+        self.period_layout.addWidget(self.period_combo)
+        self.period_layout.addStretch()
+
+        self.layout.addLayout(self.period_layout)
+        self.update_chart()
+
+    def update_chart(self):
+        # Any number of requests in one event-loop pass collapse into a single refresh
+        if not self.update_pending:
+            self.update_pending = True
+            QTimer.singleShot(0, self.run_update)
+
+    def run_update(self):
+        self.update_pending = False
+        self.refresh()
+
+    def set_account(self, account_id):
+        self.account_id = account_id
+        self.update_chart()
+
+    def accounts(self):
+        # The account filter for Change.affects
+        return None if self.account_id is None else (self.account_id,)
+
+    def refresh(self):
+        # Subclasses query and draw here; a bare chart has nothing to show
+        pass
+
+    def affected_by(self, change):
+        # Subclasses narrow this to the types, dates and accounts they draw; by default every write redraws
+        return True
+
+    def show_message(self, message):
+        self.ax.clear()
+        self.ax.text(0.5, 0.5, message, horizontalalignment='center', verticalalignment='center')
+        self.canvas.draw_idle()
+
+
+class PieChartWidget(ChartWidget):
+    PERIODS = ["This Month", "Last Month", "This Week", "Last Week", "All Time"]
+
+    def __init__(self, query_executor, parent=None):
+        self.wedges = []
+        self.label_texts = []
+        self.percent_texts = []
+        super().__init__(query_executor, parent)
+
+    def refresh(self):
+        # Get date range based on selected period
+        period = self.period_combo.currentText()
+        start_date, end_date = period_date_range(period)
+        account_id = self.account_id
+
+        # Get expense data
+        self.query_executor.submit(
+            self, lambda db_manager: db_manager.get_category_totals("Expense", start_date, end_date, account_id),
+            lambda expense_data: self.draw_chart(period, expense_data))
+
+    def affected_by(self, change):
+        return change.affects(("Expense",), *period_date_range(self.period_combo.currentText()), self.accounts())
+
+    def draw_chart(self, period, expense_data):
+        # Check if there's any data to display
+        if not expense_data:
+            self.wedges = []
+            self.show_message("No expense data for this period")
+            return
+
+        labels = [category for category, _ in expense_data]
+        amounts = [amount for _, amount in expense_data]
+
+        if len(self.wedges) != len(amounts):
+            # The number of slices changed, so build the artists once
+            self.ax.clear()
+            self.wedges, self.label_texts, self.percent_texts = self.ax.pie(
+                amounts, labels=labels, autopct='%1.1f%%', startangle=90)
+            self.ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle
+        else:
+            # Same slices as last time: move the existing wedges and labels the way ax.pie lays them out
+            total = sum(amounts)
+            theta = 90
+            for wedge, label_text, percent_text, label, amount in zip(
+                    self.wedges, self.label_texts, self.percent_texts, labels, amounts):
+                sweep = 360 * amount / total
+                wedge.set_theta1(theta)
+                wedge.set_theta2(theta + sweep)
+
+                middle = math.radians(theta + sweep / 2)
+                x, y = math.cos(middle), math.sin(middle)
+                label_text.set_position((1.1 * x, 1.1 * y))
+                label_text.set_horizontalalignment('left' if x > 0 else 'right')
+                label_text.set_text(label)
+                percent_text.set_position((0.6 * x, 0.6 * y))
+                percent_text.set_text(f"{100 * amount / total:.1f}%")
+                theta += sweep
+
+        self.ax.set_title(f"Expense Distribution - {period}")
+        self.canvas.draw_idle()
+
+
+class BarChartWidget(ChartWidget):
+    PERIODS = {
+        "Last 6 Months": 6,
+        "Last 12 Months": 12,
+        "Last 24 Months": 24,
+        "Last 60 Months": 60,
+        "All Years": None,
+    }
+
+    def __init__(self, query_executor, parent=None):
+        self.income_bars = None
+        self.expense_bars = None
+        super().__init__(query_executor, parent)
+
+    def refresh(self):
+        # Get month range based on selected period
+        period = self.period_combo.currentText()
+        months = self.PERIODS[period]
+        end_month = datetime.now().strftime('%Y-%m')
+        start_month = shift_month(end_month, 1 - months) if months else None
+        account_id = self.account_id
+
+        self.query_executor.submit(
+            self, lambda db_manager: self.compute_series(db_manager, start_month, end_month, account_id),
+            lambda series: self.draw_chart(period, *series))
+
+    def affected_by(self, change):
+        months = self.PERIODS[self.period_combo.currentText()]
+        start_month = shift_month(datetime.now().strftime('%Y-%m'), 1 - months) if months else None
+        return change.affects(("Income", "Expense"), start_month and start_month + '-01', None, self.accounts())
+
+    @staticmethod
+    def compute_series(db_manager, start_month, end_month, account_id=None):
+        # Runs on the query worker, so the GUI thread only has to draw
+        monthly_totals = db_manager.get_monthly_totals(start_month, end_month, account_id)
+        month_labels = [datetime.strptime(year_month, '%Y-%m').strftime('%b %y')
+                        for year_month, _, _ in monthly_totals]
+        income_data = [income for _, income, _ in monthly_totals]
+        expense_data = [expense for _, _, expense in monthly_totals]
+        return month_labels, income_data, expense_data
+
+    def draw_chart(self, period, month_labels, income_data, expense_data):
+        if not month_labels:
+            self.income_bars = self.expense_bars = None
+            self.show_message("No data for this period")
+            return
+
+        # Set width of the bars
+        x = range(len(month_labels))
+        width = 0.35
+
+        if self.income_bars is None or len(self.income_bars) != len(month_labels):
+            # Plot bars; only a different number of months needs new artists
+            self.ax.clear()
+            self.income_bars = self.ax.bar([i - width / 2 for i in x], income_data, width, label='Income')
+            self.expense_bars = self.ax.bar([i + width / 2 for i in x], expense_data, width, label='Expense')
+            self.ax.legend()
+            relayout = True
+        else:
+            for bar, height in zip(self.income_bars, income_data):
+                bar.set_height(height)
+            for bar, height in zip(self.expense_bars, expense_data):
+                bar.set_height(height)
+            self.ax.relim()
+            self.ax.autoscale_view()
+            relayout = False
+
+        # Customize plot; thin out tick labels so long periods stay readable
+        step = max(1, len(month_labels) // 12)
+        self.ax.set_title(f"Income vs Expenses - {period}")
+        self.ax.set_xticks(x[::step])
+        self.ax.set_xticklabels(month_labels[::step])
+
+        # Rotate x-axis labels for better readability
+        plt.setp(self.ax.get_xticklabels(), rotation=45)
+
+        if relayout:
+            self.figure.tight_layout()
+        self.canvas.draw_idle()
+
+
+class RunningBalanceChartWidget(ChartWidget):
+    PERIODS = {
+        "Last 3 Months": 3,
+        "Last 12 Months": 12,
+        "Last 5 Years": 60,
+        "All Time": None,
+        "Custom Range": None,
+    }
+
+    def __init__(self, query_executor, parent=None):
+        self.line = None
+        super().__init__(query_executor, parent)
+
+        # Only shown for "Custom Range"
+        self.start_picker = QDateEdit(QDate.currentDate().addYears(-1))
+        self.end_picker = QDateEdit(QDate.currentDate())
+        for picker in (self.start_picker, self.end_picker):
+            picker.setCalendarPopup(True)
+            picker.dateChanged.connect(self.update_chart)
+            picker.hide()
+        self.period_layout.insertWidget(2, self.start_picker)
+        self.period_layout.insertWidget(3, self.end_picker)
+
+    def date_range(self):
+        period = self.period_combo.currentText()
+        if period == "Custom Range":
+            return (self.start_picker.date().toString("yyyy-MM-dd"),
+                    self.end_picker.date().toString("yyyy-MM-dd"))
+        months = self.PERIODS[period]
+        today = datetime.now().strftime('%Y-%m-%d')
+        if months is None:
+            return None, today
+        return shift_month(today[:7], 1 - months) + '-01', today
+
+    def refresh(self):
+        period = self.period_combo.currentText()
+        custom = period == "Custom Range"
+        self.start_picker.setVisible(custom)
+        self.end_picker.setVisible(custom)
+
+        start_date, end_date = self.date_range()
+        width = max(self.canvas.width(), 100)
+        account_id = self.account_id
+
+        self.query_executor.submit(
+            self, lambda db_manager: self.compute_series(db_manager, start_date, end_date, width, account_id),
+            lambda series: self.draw_chart(period, *series))
+
+    @staticmethod
+    def compute_series(db_manager, start_date, end_date, points, account_id=None):
+        # The closing balance of each active day, run out to the end of the range and thinned to
+        # about one point per pixel of chart width
+        balances = list(db_manager.get_daily_balances(start_date, end_date, account_id))
+        if not balances:
+            return np.zeros(0, 'datetime64[D]'), np.zeros(0)
+        if end_date and balances[-1][0] < end_date:
+            balances.append((end_date, balances[-1][1]))
+        days = np.array([day for day, _ in balances], dtype='datetime64[D]')
+        values = np.array([balance for _, balance in balances])
+        return lttb(days, values, points)
+
+    def affected_by(self, change):
+        # Every earlier transaction is part of the balance, so any write up to the end of the range moves the line
+        return change.affects(("Income", "Expense"), None, self.date_range()[1], self.accounts())
+
+    def draw_chart(self, period, days, balance):
+        if not len(days):
+            self.line = None
+            self.show_message("No data for this period")
+            return
+
+        if self.line is None:
+            self.ax.clear()
+            self.line, = self.ax.plot(days, balance, color='#1976d2', drawstyle='steps-post')
+            self.ax.axhline(0, color='grey', linewidth=0.8)
+            self.figure.autofmt_xdate()
+        else:
+            self.line.set_data(days, balance)
+            self.ax.relim()
+            self.ax.autoscale_view()
+
+        self.ax.set_title(f"Running Balance - {period}")
+        self.canvas.draw_idle()
+
+
+class CategoryHeatmapWidget(ChartWidget):
+    PERIODS = {
+        "Last 12 Months": 12,
+        "Last 24 Months": 24,
+        "Last 60 Months": 60,
+    }
+
+    def __init__(self, query_executor, analytics, parent=None):
+        self.analytics = analytics
+        self.image = None
+        self.colorbar = None
+        self.labels = None
+        super().__init__(query_executor, parent)
+
+    def month_range(self):
+        months = self.PERIODS[self.period_combo.currentText()]
+        end_month = datetime.now().strftime('%Y-%m')
+        return shift_month(end_month, 1 - months), end_month
+
+    def refresh(self):
+        period = self.period_combo.currentText()
+        start_month, end_month = self.month_range()
+        account_id = self.account_id
+
+        self.query_executor.submit(
+            self, lambda db_manager: self.analytics.category_month_matrix("Expense", start_month, end_month,
+                                                                          account_id),
+            lambda heatmap: self.draw_chart(period, *heatmap))
+
+    def affected_by(self, change):
+        return change.affects(("Expense",), self.month_range()[0] + '-01', None, self.accounts())
+
+    def draw_chart(self, period, categories, months, matrix):
+        if not categories:
+            self.image = None
+            self.show_message("No expense data for this period")
+            return
+
+        if self.image is None or (categories, months) != self.labels:
+            self.ax.clear()
+            self.image = self.ax.imshow(matrix, aspect='auto', cmap='Reds', interpolation='nearest')
+            self.labels = (categories, months)
+
+            # Thin out month labels so long periods stay readable
+            step = max(1, len(months) // 12)
+            self.ax.set_yticks(range(len(categories)))
+            self.ax.set_yticklabels(categories)
+            self.ax.set_xticks(range(0, len(months), step))
+            self.ax.set_xticklabels(
+                [datetime.strptime(month, '%Y-%m').strftime('%b %y') for month in months[::step]], rotation=45)
+
+            # The colorbar keeps its axes across rebuilds and just follows the new image
+            if self.colorbar is None:
+                self.colorbar = self.figure.colorbar(self.image, ax=self.ax)
+            else:
+                self.colorbar.update_normal(self.image)
+        else:
+            self.image.set_data(matrix)
+            self.image.set_clim(0, matrix.max() or 1)
+
+        self.ax.set_title(f"Expenses by Category - {period}")
+        self.canvas.draw_idle()
+
+
+class BudgetChartWidget(ChartWidget):
+    # Spend against limit for every budget, straight from the monitor's counters without a query
+    PERIODS = {
+        "All Budgets": None,
+        "Weekly": "weekly",
+        "Monthly": "monthly",
+        "Yearly": "yearly",
+    }
+    COLORS = {OVER: '#e57373', WARNING: '#ffb74d'}
+
+    def __init__(self, query_executor, budget_monitor, parent=None):
+        self.budget_monitor = budget_monitor
+        self.limit_bars = None
+        self.spent_bars = None
+        self.labels = None
+        super().__init__(query_executor, parent)
+
+    def refresh(self):
+        period = self.period_combo.currentText()
+        budget_period = self.PERIODS[period]
+        account_id = self.account_id
+
+        def budgets(db_manager):
+            # Shares of the limit, so budgets in different currencies and sizes share one axis
+            rows = [status for status in self.budget_monitor.status()
+                    if budget_period in (None, status.period) and account_id in (None, status.account_id)]
+            labels = [f"{status.category} ({status.period})" for status in rows]
+            spent = [100 * (status.spent or 0) / status.limit for status in rows]
+            colors = [self.COLORS.get(status.level, '#81c784') for status in rows]
+            return labels, spent, colors
+
+        self.query_executor.submit(self, budgets, lambda series: self.draw_chart(period, *series))
+
+    def affected_by(self, change):
+        return change.affects(("Expense",), None, None, self.accounts())
+
+    def draw_chart(self, period, labels, spent, colors):
+        if not labels:
+            self.limit_bars = self.spent_bars = self.labels = None
+            self.show_message("No budgets yet; add them under File > Budgets")
+            return
+
+        if self.spent_bars is None or labels != self.labels:
+            # Hundreds of budgets are two bar containers; only a different set of budgets rebuilds them
+            self.ax.clear()
+            y = range(len(labels))
+            self.limit_bars = self.ax.barh(y, [100] * len(labels), color='#eeeeee', height=0.8)
+            self.spent_bars = self.ax.barh(y, spent, color=colors, height=0.5)
+            self.ax.axvline(100, color='grey', linewidth=0.8)
+            step = max(1, len(labels) // 30)
+            self.ax.set_yticks(y[::step])
+            self.ax.set_yticklabels(labels[::step])
+            self.ax.invert_yaxis()
+            self.ax.set_xlabel("% of limit")
+            self.labels = labels
+        else:
+            for bar, width, color in zip(self.spent_bars, spent, colors):
+                bar.set_width(width)
+                bar.set_color(color)
+        self.ax.set_xlim(0, max(110, max(spent) * 1.05))
+
+        self.ax.set_title(f"Budgets - {period}")
+        self.canvas.draw_idle()
@@ -0,0 +1,613 @@
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import date, datetime
+
+from budgets import OVER, WARNING, BudgetMonitor
+from database import (BUDGET_PERIODS, DEFAULT_ACCOUNT_ID, DatabaseManager, ExpenseCategories, IncomeCategories,
+                      MissingRateError, period_date_range, shift_month)
+from maintenance import DEFAULT_KEEP, MAINTENANCE_TASKS, MaintenanceService, SnapshotError, list_snapshots, \
+    verify_snapshot
+from profiling import Profiler, StartupTimer, print_summary
+from recurring import FREQUENCIES
+
+PERIODS = ["This Month", "Last Month", "This Week", "Last Week", "All Time"]
+
+# Larger than any rowid, so a keyset bound of (date, LAST_ID) includes every row on that date
+LAST_ID = 2 ** 63 - 1
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}, expected YYYY-MM-DD")
+
+
+def print_transactions(db_manager, transactions):
+    print(f"{'ID':>8}  {'Date':<10}  {'Account':<14}  {'Type':<7}  {'Category':<13}  {'Amount':>14}  Description")
+    for transaction_id, transaction_type, category, amount, transaction_date, description, account_id in transactions:
+        account, currency = db_manager.accounts[account_id]
+        print(f"{transaction_id:>8}  {transaction_date:<10}  {account[:14]:<14}  {transaction_type:<7}  "
+              f"{category:<13}  {db_manager.format_amount(amount, currency):>14}  {description or ''}")
+
+
+def scope_label(db_manager, account_id):
+    if account_id is None:
+        return f"all accounts in {db_manager.base_currency}"
+    account, currency = db_manager.accounts[account_id]
+    return f"{account} in {currency}"
+
+
+def budget_usage(db_manager, status):
+    if status.spent is None:
+        return "unknown (missing exchange rate)"
+    return (f"{db_manager.format_amount(status.spent, status.currency)} of "
+            f"{db_manager.format_amount(status.limit, status.currency)} ({100 * status.spent / status.limit:.0f}%)")
+
+
+def add_command(db_manager, args):
+    transaction_type = args.type.capitalize()
+    category_class = IncomeCategories if transaction_type == "Income" else ExpenseCategories
+    categories = {category.lower(): category for category in category_class.get_all_categories()}
+
+    category = categories.get(args.category.lower())
+    if category is None:
+        print(f"Unknown {args.type} category {args.category!r}; choose from: "
+              f"{', '.join(category_class.get_all_categories())}", file=sys.stderr)
+        return 1
+    if args.amount <= 0:
+        print("Amount must be greater than zero.", file=sys.stderr)
+        return 1
+
+    # The monitor adds the new expense to every budget it falls in and reports those that cross a threshold
+    alerts = []
+    monitor = None
+    if transaction_type == "Expense":
+        monitor = BudgetMonitor(db_manager)
+        monitor.reload()
+        monitor.add_listener(alerts.append)
+
+    account_id = DEFAULT_ACCOUNT_ID if args.account_id is None else args.account_id
+    transaction_id = db_manager.add_transaction(transaction_type, category, args.amount, args.date,
+                                                args.description, account_id)
+    account, currency = db_manager.accounts[account_id]
+    print(f"Added {args.type} #{transaction_id}: {category} {db_manager.format_amount(args.amount, currency)} "
+          f"on {args.date} to {account}")
+
+    for status in alerts:
+        label = "Over budget" if status.level == OVER else "Budget warning"
+        print(f"{label}: {status.category} {status.period} ({scope_label(db_manager, status.account_id)}) "
+              f"{budget_usage(db_manager, status)}", file=sys.stderr)
+    if monitor:
+        monitor.close()
+    return 0
+
+
+def list_command(db_manager, args):
+    transaction_type = args.type.capitalize() if args.type else None
+
+    if args.search:
+        date_range = (args.start or "0001-01-01", args.end or "9999-12-31") if args.start or args.end else None
+        print_transactions(db_manager, db_manager.search_transactions(args.search, transaction_type, date_range,
+                                                                      args.limit, account_id=args.account_id))
+        return 0
+
+    # Walk the (date, id) keyset from the end of the range, stopping once the start of the range is passed
+    transactions = []
+    after = (args.end, LAST_ID) if args.end else None
+    while len(transactions) < args.limit:
+        page = db_manager.get_transactions_page(500, after, args.account_id)
+        for transaction in page:
+            if args.start and transaction[4] < args.start:
+                page = []
+                break
+            if transaction_type is None or transaction[1] == transaction_type:
+                transactions.append(transaction)
+        if len(page) < 500:
+            break
+        after = (page[-1][4], page[-1][0])
+
+    print_transactions(db_manager, transactions[:args.limit])
+    return 0
+
+
+def totals_command(db_manager, args):
+    if args.start or args.end:
+        start_date, end_date = args.start or "0001-01-01", args.end or "9999-12-31"
+        label = f"{args.start or 'start'} to {args.end or 'today'}"
+    else:
+        start_date, end_date = period_date_range(args.period)
+        label = args.period
+
+    total_income = db_manager.get_total_amount_by_type("Income", start_date, end_date, args.account_id)
+    total_expense = db_manager.get_total_amount_by_type("Expense", start_date, end_date, args.account_id)
+    currency = db_manager.account_scope(args.account_id)[1]
+
+    print(f"{label}, {scope_label(db_manager, args.account_id)}")
+    print(f"  {'Total Income':<16}{db_manager.format_amount(total_income, currency):>14}")
+    print(f"  {'Total Expenses':<16}{db_manager.format_amount(total_expense, currency):>14}")
+    print(f"  {'Net Balance':<16}{db_manager.format_amount(total_income - total_expense, currency):>14}")
+
+    for transaction_type in ("Income", "Expense"):
+        category_totals = db_manager.get_category_totals(transaction_type, start_date, end_date, args.account_id)
+        if not category_totals:
+            continue
+        print(f"\n{transaction_type} by category")
+        for category, amount in sorted(category_totals, key=lambda item: -item[1]):
+            print(f"  {category:<16}{db_manager.format_amount(amount, currency):>14}")
+    return 0
+
+
+def report_command(db_manager, args):
+    end_month = datetime.now().strftime('%Y-%m')
+    start_month = None if args.all else shift_month(end_month, 1 - args.months)
+    monthly_totals = db_manager.get_monthly_totals(start_month, end_month, args.account_id)
+
+    label = scope_label(db_manager, args.account_id)
+    print(label[:1].upper() + label[1:])
+    print(f"{'Month':<8}  {'Income':>14}  {'Expense':>14}  {'Net':>14}")
+    total_income = total_expense = 0
+    for year_month, income, expense in monthly_totals:
+        total_income += income
+        total_expense += expense
+        print(f"{year_month:<8}  {income:>14.2f}  {expense:>14.2f}  {income - expense:>14.2f}")
+    print(f"{'Total':<8}  {total_income:>14.2f}  {total_expense:>14.2f}  {total_income - total_expense:>14.2f}")
+    return 0
+
+
+def import_command(db_manager, args):
+    # Only the import command needs the CSV/OFX readers
+    from importer import import_file
+
+    for path in args.files:
+        started = datetime.now()
+        try:
+            imported, rejected = import_file(
+                db_manager, path, lambda rows: print(f"\r{path}: {rows:,} rows", end="", file=sys.stderr),
+                account_id=args.account_id)
+        except (OSError, ValueError) as error:
+            print(error, file=sys.stderr)
+            return 1
+        seconds = max((datetime.now() - started).total_seconds(), 1e-9)
+        print(f"\r{path}: imported {imported:,} rows in {seconds:.2f}s ({imported / seconds:,.0f} rows/s)",
+              file=sys.stderr)
+        for line, reason in rejected:
+            print(f"{path}:{line}: skipped, {reason}", file=sys.stderr)
+    return 0
+
+
+def export_command(db_manager, args):
+    # Only the export command needs the writers (and pyarrow, for Parquet)
+    from exporter import export_transactions
+
+    transaction_type = args.type.capitalize() if args.type else None
+    category = args.category
+    if category:
+        categories = {name.lower(): name for name in
+                      ExpenseCategories.get_all_categories() + IncomeCategories.get_all_categories()}
+        category = categories.get(category.lower(), category)
+
+    started = datetime.now()
+    try:
+        exported = export_transactions(
+            db_manager, args.file, args.format, transaction_type, category, args.start, args.end,
+            lambda rows: print(f"\r{args.file}: {rows:,} rows", end="", file=sys.stderr), account_id=args.account_id)
+    except (OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    seconds = max((datetime.now() - started).total_seconds(), 1e-9)
+    print(f"\r{args.file}: exported {exported:,} rows in {seconds:.2f}s ({exported / seconds:,.0f} rows/s)",
+          file=sys.stderr)
+    return 0
+
+
+def recurring_command(db_manager, args):
+    if args.action == "add":
+        transaction_type = args.type.capitalize()
+        category_class = IncomeCategories if transaction_type == "Income" else ExpenseCategories
+        categories = {category.lower(): category for category in category_class.get_all_categories()}
+
+        category = categories.get(args.category.lower())
+        if category is None:
+            print(f"Unknown {args.type} category {args.category!r}; choose from: "
+                  f"{', '.join(category_class.get_all_categories())}", file=sys.stderr)
+            return 1
+        if args.amount <= 0:
+            print("Amount must be greater than zero.", file=sys.stderr)
+            return 1
+        if args.every < 1 or (args.end and args.end < args.start):
+            print("A rule has to repeat at least every 1 period and end after it starts.", file=sys.stderr)
+            return 1
+
+        account_id = DEFAULT_ACCOUNT_ID if args.account_id is None else args.account_id
+        rule_id = db_manager.add_recurring_rule(transaction_type, category, args.amount, args.frequency,
+                                                args.start, args.end, args.description, args.every, account_id)
+        account, currency = db_manager.accounts[account_id]
+        print(f"Added rule #{rule_id}: {category} {db_manager.format_amount(args.amount, currency)} "
+              f"{args.frequency} from {args.start} to {account}")
+        booked = db_manager.run_recurring_rules()
+        if booked:
+            print(f"Booked {booked:,} transactions due so far")
+        return 0
+
+    if args.action == "delete":
+        if not db_manager.delete_recurring_rule(args.rule_id):
+            print(f"No recurring rule #{args.rule_id}", file=sys.stderr)
+            return 1
+        print(f"Deleted rule #{args.rule_id}; transactions it already booked are kept")
+        return 0
+
+    if args.action == "run":
+        booked = db_manager.run_recurring_rules(args.today)
+        print(f"Booked {booked:,} recurring transactions")
+        return 0
+
+    print(f"{'ID':>5}  {'Account':<14}  {'Type':<7}  {'Category':<13}  {'Amount':>14}  {'Repeats':<26}  "
+          f"{'Next':<10}  Description")
+    for (rule_id, transaction_type, category, amount, frequency, every, start_date, end_date, next_date,
+         description, account_id) in db_manager.get_recurring_rules():
+        if args.account_id is not None and account_id != args.account_id:
+            continue
+        account, currency = db_manager.accounts[account_id]
+        repeats = frequency if every == 1 else f"{frequency} x{every}"
+        if end_date:
+            repeats += f" to {end_date}"
+        print(f"{rule_id:>5}  {account[:14]:<14}  {transaction_type:<7}  {category:<13}  "
+              f"{db_manager.format_amount(amount, currency):>14}  {repeats:<26}  {next_date or 'ended':<10}  "
+              f"{description or ''}")
+    return 0
+
+
+def budgets_command(db_manager, args):
+    if args.action == "add":
+        categories = {category.lower(): category for category in ExpenseCategories.get_all_categories()}
+        category = categories.get(args.category.lower())
+        if category is None:
+            print(f"Unknown expense category {args.category!r}; choose from: "
+                  f"{', '.join(ExpenseCategories.get_all_categories())}", file=sys.stderr)
+            return 1
+        try:
+            budget_id = db_manager.add_budget(category, args.limit, args.period, args.account_id, args.alert_at / 100)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+        currency = db_manager.account_scope(args.account_id)[1]
+        print(f"Added budget #{budget_id}: {category} {db_manager.format_amount(args.limit, currency)} "
+              f"{args.period} for {scope_label(db_manager, args.account_id)}")
+        return 0
+
+    if args.action == "delete":
+        if not db_manager.delete_budget(args.budget_id):
+            print(f"No budget #{args.budget_id}", file=sys.stderr)
+            return 1
+        print(f"Deleted budget #{args.budget_id}")
+        return 0
+
+    monitor = BudgetMonitor(db_manager)
+    monitor.reload()
+    print(f"{'ID':>5}  {'Category':<13}  {'Period':<8}  {'From':<10}  {'Scope':<24}  Spent")
+    for status in monitor.status():
+        if args.account_id is not None and status.account_id != args.account_id:
+            continue
+        flag = {OVER: "  OVER", WARNING: "  NEAR"}.get(status.level, "")
+        print(f"{status.budget_id:>5}  {status.category:<13}  {status.period:<8}  {status.start_date:<10}  "
+              f"{scope_label(db_manager, status.account_id)[:24]:<24}  {budget_usage(db_manager, status)}{flag}")
+    monitor.close()
+    return 0
+
+
+def accounts_command(db_manager, args):
+    if args.action == "add":
+        try:
+            account_id = db_manager.add_account(args.name, args.currency)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+        print(f"Added account #{account_id}: {args.name} in {db_manager.accounts[account_id][1]}")
+        return 0
+
+    today = date.today().isoformat()
+    print(f"{'ID':>5}  {'Account':<24}  {'Currency':<8}  {'Balance':>16}")
+    for account_id, name, currency in db_manager.get_accounts():
+        balance = db_manager.get_balance_at(today, account_id)
+        print(f"{account_id:>5}  {name:<24}  {currency:<8}  {db_manager.format_amount(balance, currency):>16}")
+    print(f"{'':>5}  {'All accounts':<24}  {db_manager.base_currency:<8}  "
+          f"{db_manager.format_amount(db_manager.get_balance_at(today), db_manager.base_currency):>16}")
+    return 0
+
+
+def rates_command(db_manager, args):
+    if args.action == "set":
+        try:
+            db_manager.set_fx_rate(args.currency, args.quote or db_manager.base_currency, args.date, args.rate)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+        print(f"1 {args.currency.upper()} = {args.rate:g} {(args.quote or db_manager.base_currency).upper()} "
+              f"from {args.date}")
+        return 0
+
+    if args.action == "base":
+        try:
+            db_manager.set_base_currency(args.currency)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+        print(f"Totals across accounts are now in {db_manager.base_currency}")
+        return 0
+
+    print(f"Base currency: {db_manager.base_currency}")
+    print(f"{'Pair':<9}  {'From':<10}  {'Rate':>14}")
+    for currency, quote, day, rate in db_manager.get_fx_rates(args.currency):
+        print(f"{currency}/{quote:<5}  {day:<10}  {rate:>14.6f}")
+    return 0
+
+
+def serve_command(db_manager, args):
+    # Blocks until interrupted; the window and other processes can keep using the same file meanwhile.
+    # asyncio is only imported for this command, which keeps it out of every other command's startup
+    from server import DEFAULT_PORT, HOST, serve
+    serve(db_manager, DEFAULT_PORT if args.port is None else args.port, args.workers,
+          lambda port: print(f"Serving {args.db} on http://{HOST}:{port} (Ctrl+C to stop)", file=sys.stderr))
+    return 0
+
+
+def maintenance_command(db_manager, args):
+    service = MaintenanceService(db_manager, args.dir, args.keep)
+    try:
+        if args.action == "run":
+            names = [task for task, _ in MAINTENANCE_TASKS]
+            unknown = [task for task in args.tasks if task not in names]
+            if unknown:
+                print(f"Unknown task {unknown[0]!r}; choose from: {', '.join(names)}", file=sys.stderr)
+                return 1
+            tasks = args.tasks or (names if args.all else None)
+            results = service.run(tasks, lambda task, done, total: print(
+                f"\r{task}: {done:,}/{total:,} pages", end="", file=sys.stderr, flush=True))
+            print("\r", end="", file=sys.stderr)
+            for task, detail in results:
+                print(f"{task}: {detail}")
+            if not results:
+                print("Nothing is due")
+            return 0
+
+        if args.action == "compact":
+            print(service.compact())
+            return 0
+
+        if args.action == "restore":
+            print(service.restore(args.path))
+            return 0
+
+        if args.action == "verify":
+            failed = 0
+            for path in args.paths or list_snapshots(service.directory, db_manager.db_path):
+                try:
+                    print(f"{path}: ok, {verify_snapshot(path):,} transactions")
+                except SnapshotError as error:
+                    print(f"{path}: FAILED, {error}")
+                    failed += 1
+            return 1 if failed else 0
+    except (OSError, SnapshotError, sqlite3.Error) as error:
+        print(f"\n{error}", file=sys.stderr)
+        return 1
+
+    due = service.due_tasks()
+    print(f"{'Task':<10}  {'Every':<16}  {'Last run':<19}  Due")
+    for task, interval in MAINTENANCE_TASKS:
+        last = service.last_run(task)
+        print(f"{task:<10}  {str(interval):<16}  {last.isoformat(' ') if last else 'never':<19}  "
+              f"{'yes' if task in due else 'no'}")
+    page_size, page_count, free_pages, auto_vacuum = service.space()
+    print(f"\nFile: {page_count * page_size / 1048576:.1f} MB, {free_pages * page_size / 1048576:.1f} MB free"
+          f"{'' if auto_vacuum == 2 else ' (run compact once to enable incremental vacuum)'}")
+    snapshots = list_snapshots(service.directory, db_manager.db_path)
+    print(f"Snapshots: {len(snapshots)} of {args.keep} kept in {service.directory}")
+    for path in snapshots:
+        print(f"  {os.path.basename(path)}  {os.path.getsize(path) / 1048576:.1f} MB")
+    return 0
+
+
+def check_query_plans_command(args):
+    # Plans only depend on the schema, so check against a fresh in-memory database
+    problems = DatabaseManager(':memory:').check_query_plans()
+    for statement, detail in problems:
+        print(f"{detail}: {statement}")
+    return 1 if problems else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="money-tracker", description="Money Tracker")
+    parser.add_argument("--db", default="money_tracker.db", help="database file (default: %(default)s)")
+    parser.add_argument("--profile", action="store_true", help="time every database call and print a summary")
+    parser.add_argument("--trace", metavar="FILE", help="append profiled calls to a JSONL trace (implies --profile)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long each step of opening the desktop app takes")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    commands.add_parser("gui", help="open the desktop app (the default)")
+
+    add_parser = commands.add_parser("add", help="add an income or expense")
+    add_parser.add_argument("type", choices=["income", "expense"])
+    add_parser.add_argument("amount", type=float)
+    add_parser.add_argument("category")
+    add_parser.add_argument("--date", type=parse_date, default=date.today().isoformat(),
+                            help="YYYY-MM-DD (default: today)")
+    add_parser.add_argument("--description", default="")
+    add_parser.add_argument("--account", help="account name (default: the first account)")
+    add_parser.set_defaults(handler=add_command)
+
+    list_parser = commands.add_parser("list", help="list transactions, newest first")
+    list_parser.add_argument("--type", choices=["income", "expense"])
+    list_parser.add_argument("--from", dest="start", type=parse_date, metavar="DATE")
+    list_parser.add_argument("--to", dest="end", type=parse_date, metavar="DATE")
+    list_parser.add_argument("--search", help="full-text search on description and category")
+    list_parser.add_argument("--limit", type=int, default=20)
+    list_parser.add_argument("--account", help="only this account (default: every account)")
+    list_parser.set_defaults(handler=list_command)
+
+    totals_parser = commands.add_parser("totals", help="income, expense and category totals for a period")
+    totals_parser.add_argument("--period", choices=PERIODS, default="This Month")
+    totals_parser.add_argument("--from", dest="start", type=parse_date, metavar="DATE")
+    totals_parser.add_argument("--to", dest="end", type=parse_date, metavar="DATE")
+    totals_parser.add_argument("--account", help="one account in its own currency (default: all, in the base one)")
+    totals_parser.set_defaults(handler=totals_command)
+
+    report_parser = commands.add_parser("report", help="monthly income vs expense report")
+    report_parser.add_argument("--months", type=int, default=12)
+    report_parser.add_argument("--all", action="store_true", help="every month since the first transaction")
+    report_parser.add_argument("--account", help="one account in its own currency (default: all, in the base one)")
+    report_parser.set_defaults(handler=report_command)
+
+    import_parser = commands.add_parser("import", help="bulk import CSV/OFX bank exports")
+    import_parser.add_argument("files", nargs="+", metavar="FILE")
+    import_parser.add_argument("--account", help="account to import into (default: the first account)")
+    import_parser.set_defaults(handler=import_command)
+
+    export_parser = commands.add_parser("export", help="export transactions to CSV, JSON Lines or Parquet")
+    export_parser.add_argument("file", metavar="FILE")
+    export_parser.add_argument("--format", choices=["csv", "jsonl", "parquet"],
+                               help="default: from the file extension, else csv")
+    export_parser.add_argument("--type", choices=["income", "expense"])
+    export_parser.add_argument("--category")
+    export_parser.add_argument("--from", dest="start", type=parse_date, metavar="DATE")
+    export_parser.add_argument("--to", dest="end", type=parse_date, metavar="DATE")
+    export_parser.add_argument("--account", help="only this account (default: every account)")
+    export_parser.set_defaults(handler=export_command)
+
+    recurring_parser = commands.add_parser("recurring", help="manage and book recurring transactions")
+    recurring_parser.set_defaults(handler=recurring_command, action="list")
+    recurring_parser.add_argument("--account", help="the account to list rules of, or to add a rule to")
+    actions = recurring_parser.add_subparsers(dest="action", metavar="ACTION")
+    actions.add_parser("list", help="show every rule and when it is next due (the default)")
+    rule_parser = actions.add_parser("add", help="add a rule; occurrences already due are booked right away")
+    rule_parser.add_argument("type", choices=["income", "expense"])
+    rule_parser.add_argument("amount", type=float)
+    rule_parser.add_argument("category")
+    rule_parser.add_argument("--frequency", choices=FREQUENCIES, default="monthly")
+    rule_parser.add_argument("--every", type=int, default=1, help="repeat every N periods (default: 1)")
+    rule_parser.add_argument("--start", type=parse_date, default=date.today().isoformat(),
+                             help="first occurrence, YYYY-MM-DD (default: today)")
+    rule_parser.add_argument("--end", type=parse_date, help="last day the rule can occur on")
+    rule_parser.add_argument("--description", default="")
+    delete_parser = actions.add_parser("delete", help="stop a rule, keeping what it already booked")
+    delete_parser.add_argument("rule_id", type=int)
+    run_parser = actions.add_parser("run", help="book every occurrence due up to today (safe to repeat)")
+    run_parser.add_argument("--today", type=parse_date, help=argparse.SUPPRESS)
+
+    budgets_parser = commands.add_parser("budgets", help="spending limits per category and how much is left")
+    budgets_parser.set_defaults(handler=budgets_command, action="list")
+    budgets_parser.add_argument("--account", help="only budgets of this account, or the account to add one to "
+                                                  "(default: every account, in the base currency)")
+    actions = budgets_parser.add_subparsers(dest="action", metavar="ACTION")
+    actions.add_parser("list", help="every budget and its spend this period (the default)")
+    budget_parser = actions.add_parser("add", help="limit what an expense category may spend per period")
+    budget_parser.add_argument("category")
+    budget_parser.add_argument("limit", type=float)
+    budget_parser.add_argument("--period", choices=BUDGET_PERIODS, default="monthly")
+    budget_parser.add_argument("--alert-at", type=float, default=80, metavar="PERCENT",
+                               help="warn once this share of the limit is spent (default: %(default)s)")
+    delete_budget_parser = actions.add_parser("delete", help="remove a budget")
+    delete_budget_parser.add_argument("budget_id", type=int, metavar="ID")
+
+    accounts_parser = commands.add_parser("accounts", help="list accounts with their balances, or open one")
+    accounts_parser.set_defaults(handler=accounts_command, action="list")
+    actions = accounts_parser.add_subparsers(dest="action", metavar="ACTION")
+    actions.add_parser("list", help="every account and its balance today (the default)")
+    account_parser = actions.add_parser("add", help="open an account")
+    account_parser.add_argument("name")
+    account_parser.add_argument("--currency", help="ISO code such as EUR (default: the base currency)")
+
+    rates_parser = commands.add_parser("rates", help="exchange rates and the base currency")
+    rates_parser.set_defaults(handler=rates_command, action="list", currency=None)
+    actions = rates_parser.add_subparsers(dest="action", metavar="ACTION")
+    list_rates_parser = actions.add_parser("list", help="every stored rate (the default)")
+    list_rates_parser.add_argument("--currency", help="only rates of this currency")
+    rate_parser = actions.add_parser("set", help="1 CURRENCY is worth RATE of the quote currency from --date on")
+    rate_parser.add_argument("currency")
+    rate_parser.add_argument("rate", type=float)
+    rate_parser.add_argument("--quote", help="default: the base currency")
+    rate_parser.add_argument("--date", type=parse_date, default=date.today().isoformat(),
+                             help="first day the rate applies, YYYY-MM-DD (default: today)")
+    base_parser = actions.add_parser("base", help="the currency totals across accounts are reported in")
+    base_parser.add_argument("currency")
+
+    serve_parser = commands.add_parser("serve", help="answer JSON API requests on 127.0.0.1 until interrupted")
+    serve_parser.add_argument("--port", type=int, help="(default: 8765)")
+    serve_parser.add_argument("--workers", type=int, default=8, help="query threads (default: %(default)s)")
+    serve_parser.set_defaults(handler=serve_command)
+
+    maintenance_parser = commands.add_parser("maintenance", help="snapshots, compaction and planner statistics")
+    maintenance_parser.set_defaults(handler=maintenance_command, action="status")
+    maintenance_parser.add_argument("--dir", help="snapshot directory (default: snapshots/ next to the database)")
+    maintenance_parser.add_argument("--keep", type=int, default=DEFAULT_KEEP,
+                                    help="snapshots kept when a new one is written (default: %(default)s)")
+    actions = maintenance_parser.add_subparsers(dest="action", metavar="ACTION")
+    actions.add_parser("status", help="when each task last ran and is next due, and the snapshots kept (the default)")
+    run_parser = actions.add_parser("run", help="run the tasks that are due; safe to schedule as often as you like")
+    run_parser.add_argument("tasks", nargs="*", metavar="TASK",
+                            help=f"run these whether due or not: {', '.join(task for task, _ in MAINTENANCE_TASKS)}")
+    run_parser.add_argument("--all", action="store_true", help="run every task whether due or not")
+    actions.add_parser("compact", help="rewrite the whole file; blocks writes while it runs")
+    verify_parser = actions.add_parser("verify", help="integrity-check snapshots (default: every kept one)")
+    verify_parser.add_argument("paths", nargs="*", metavar="SNAPSHOT")
+    restore_parser = actions.add_parser("restore", help="replace the ledger with a snapshot, snapshotting it first")
+    restore_parser.add_argument("path", metavar="SNAPSHOT")
+
+    commands.add_parser("check-query-plans", help="report queries that fall back to a full table scan")
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+
+    profiler = None
+    if args.profile or args.trace:
+        profiler = Profiler(args.trace)
+        profiler.enable()
+
+    if args.command in (None, "gui"):
+        # The GUI stack is only imported when the window is actually wanted
+        startup = None
+        if args.profile_startup:
+            startup = StartupTimer(waits_for=("first paint", "dashboard totals", "first transactions page"))
+            startup.mark("command line")
+        from main import run
+        if startup:
+            startup.mark("import GUI modules")
+        return run(args.db, extra, profiler, startup)
+
+    if extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if args.command == "check-query-plans":
+        return check_query_plans_command(args)
+
+    db_manager = DatabaseManager(args.db)
+    if profiler:
+        profiler.instrument_database(db_manager)
+    try:
+        args.account_id = None
+        if getattr(args, "account", None):
+            args.account_id = db_manager.account_id(args.account)
+            if args.account_id is None:
+                print(f"Unknown account {args.account!r}; choose from: "
+                      f"{', '.join(name for name, _ in db_manager.accounts.values())}", file=sys.stderr)
+                return 1
+        return args.handler(db_manager, args)
+    except MissingRateError as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        if profiler:
+            print(file=sys.stderr)
+            print_summary(profiler.summary(), file=sys.stderr)
+            profiler.disable()
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1940 @@
+import re
+import sqlite3
+import threading
+from calendar import monthrange
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from itertools import groupby, islice
+from datetime import datetime, timedelta
+
+from recurring import FREQUENCIES, next_occurrence, occurrences
+
+# Every transaction written before accounts existed belongs to this one
+DEFAULT_ACCOUNT_ID = 1
+BASE_CURRENCY = "USD"
+# Largest amount one transaction can hold; its cents, summed over millions of rows, stay within SQLite's integers
+MAX_AMOUNT = 10 ** 12
+
+BUDGET_PERIODS = ["weekly", "monthly", "yearly"]
+
+# (code, symbol) a new ledger starts with; other ISO codes are added as accounts use them
+CURRENCIES = [("USD", "$"), ("EUR", "€"), ("GBP", "£"), ("JPY", "¥"), ("CHF", None), ("CAD", "CA$"),
+              ("AUD", "A$"), ("INR", "₹"), ("CNY", "CN¥"), ("SEK", None)]
+
+
+class ExpenseCategories:
+    FOOD = "Food"
+    TRANSPORT = "Transport"
+    ENTERTAINMENT = "Entertainment"
+    UTILITIES = "Utilities"
+    RENT = "Rent"
+    SHOPPING = "Shopping"
+    HEALTHCARE = "Healthcare"
+    EDUCATION = "Education"
+    OTHER = "Other"
+
+    @classmethod
+    def get_all_categories(cls):
+        return [cls.FOOD, cls.TRANSPORT, cls.ENTERTAINMENT, cls.UTILITIES,
+                cls.RENT, cls.SHOPPING, cls.HEALTHCARE, cls.EDUCATION, cls.OTHER]
+
+
+class IncomeCategories:
+    SALARY = "Salary"
+    FREELANCE = "Freelance"
+    INVESTMENT = "Investment"
+    GIFT = "Gift"
+    REFUND = "Refund"
+    OTHER = "Other"
+
+    @classmethod
+    def get_all_categories(cls):
+        return [cls.SALARY, cls.FREELANCE, cls.INVESTMENT, cls.GIFT, cls.REFUND, cls.OTHER]
+
+
+def add_transaction_indexes(cursor):
+    # Covers the per-type totals and listings; category and amount ride along so SUMs never touch the table
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_transactions_type_date
+    ON transactions (type, date, category, amount)
+    ''')
+    # Serves the date-ordered listings, date range filters and keyset pagination
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_transactions_date_id
+    ON transactions (date, id)
+    ''')
+
+
+def add_monthly_rollup(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS monthly_rollup (
+        type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        year_month TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (type, year_month, category)
+    ) WITHOUT ROWID
+    ''')
+
+    # Triggers keep the rollup current on every write, whichever connection makes it
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_insert AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO monthly_rollup (type, category, year_month, total, count)
+        VALUES (NEW.type, NEW.category, substr(NEW.date, 1, 7), NEW.amount, 1)
+        ON CONFLICT (type, year_month, category)
+        DO UPDATE SET total = total + excluded.total, count = count + 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_delete AFTER DELETE ON transactions
+    BEGIN
+        UPDATE monthly_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE type = OLD.type AND year_month = substr(OLD.date, 1, 7) AND category = OLD.category;
+        DELETE FROM monthly_rollup
+        WHERE type = OLD.type AND year_month = substr(OLD.date, 1, 7) AND category = OLD.category
+        AND count = 0;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_update
+    AFTER UPDATE OF type, category, amount, date ON transactions
+    BEGIN
+        UPDATE monthly_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE type = OLD.type AND year_month = substr(OLD.date, 1, 7) AND category = OLD.category;
+        DELETE FROM monthly_rollup
+        WHERE type = OLD.type AND year_month = substr(OLD.date, 1, 7) AND category = OLD.category
+        AND count = 0;
+        INSERT INTO monthly_rollup (type, category, year_month, total, count)
+        VALUES (NEW.type, NEW.category, substr(NEW.date, 1, 7), NEW.amount, 1)
+        ON CONFLICT (type, year_month, category)
+        DO UPDATE SET total = total + excluded.total, count = count + 1;
+    END
+    ''')
+
+    # Backfill from the rows that already exist
+    cursor.execute('''
+    INSERT INTO monthly_rollup (type, category, year_month, total, count)
+    SELECT type, category, substr(date, 1, 7), SUM(amount), COUNT(*)
+    FROM transactions GROUP BY type, category, substr(date, 1, 7)
+    ''')
+
+
+def encode_amounts_and_categories(cursor):
+    # Lookup tables for the repeated type and category strings, seeded from the category classes
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS types (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY,
+        type_id INTEGER NOT NULL REFERENCES types (id),
+        name TEXT NOT NULL,
+        UNIQUE (type_id, name)
+    )
+    ''')
+    cursor.executemany('INSERT OR IGNORE INTO types (name) VALUES (?)', [("Income",), ("Expense",)])
+    cursor.execute('INSERT OR IGNORE INTO types (name) SELECT DISTINCT type FROM transactions')
+    for type_name, category_class in (("Income", IncomeCategories), ("Expense", ExpenseCategories)):
+        cursor.executemany('''
+        INSERT OR IGNORE INTO categories (type_id, name)
+        SELECT id, ? FROM types WHERE name = ?
+        ''', [(category, type_name) for category in category_class.get_all_categories()])
+    cursor.execute('''
+    INSERT OR IGNORE INTO categories (type_id, name)
+    SELECT DISTINCT types.id, transactions.category
+    FROM transactions JOIN types ON types.name = transactions.type
+    ''')
+
+    # Rebuild transactions with integer codes and cents, keeping ids and the AUTOINCREMENT high-water mark
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'transactions'")
+    sequence = cursor.fetchone()
+    for trigger in ('trg_transactions_rollup_insert', 'trg_transactions_rollup_delete',
+                    'trg_transactions_rollup_update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    cursor.execute('DROP INDEX IF EXISTS idx_transactions_type_date')
+    cursor.execute('DROP INDEX IF EXISTS idx_transactions_date_id')
+    cursor.execute('DROP TABLE IF EXISTS monthly_rollup')
+
+    cursor.execute('''
+    CREATE TABLE transactions_encoded (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type_id INTEGER NOT NULL REFERENCES types (id),
+        category_id INTEGER NOT NULL REFERENCES categories (id),
+        amount_cents INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        description TEXT
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO transactions_encoded (id, type_id, category_id, amount_cents, date, description)
+    SELECT transactions.id, types.id, categories.id, CAST(ROUND(transactions.amount * 100) AS INTEGER),
+           transactions.date, transactions.description
+    FROM transactions
+    JOIN types ON types.name = transactions.type
+    JOIN categories ON categories.type_id = types.id AND categories.name = transactions.category
+    ''')
+    cursor.execute('DROP TABLE transactions')
+    cursor.execute('ALTER TABLE transactions_encoded RENAME TO transactions')
+    if sequence:
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'transactions'", sequence)
+
+    cursor.execute('''
+    CREATE INDEX idx_transactions_type_date
+    ON transactions (type_id, date, category_id, amount_cents)
+    ''')
+    cursor.execute('''
+    CREATE INDEX idx_transactions_date_id
+    ON transactions (date, id)
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE monthly_rollup (
+        type_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        year_month TEXT NOT NULL,
+        total_cents INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (type_id, year_month, category_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_transactions_rollup_insert AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO monthly_rollup (type_id, category_id, year_month, total_cents, count)
+        VALUES (NEW.type_id, NEW.category_id, substr(NEW.date, 1, 7), NEW.amount_cents, 1)
+        ON CONFLICT (type_id, year_month, category_id)
+        DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_transactions_rollup_delete AFTER DELETE ON transactions
+    BEGIN
+        UPDATE monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+        WHERE type_id = OLD.type_id AND year_month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id;
+        DELETE FROM monthly_rollup
+        WHERE type_id = OLD.type_id AND year_month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id
+        AND count = 0;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_transactions_rollup_update
+    AFTER UPDATE OF type_id, category_id, amount_cents, date ON transactions
+    BEGIN
+        UPDATE monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+        WHERE type_id = OLD.type_id AND year_month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id;
+        DELETE FROM monthly_rollup
+        WHERE type_id = OLD.type_id AND year_month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id
+        AND count = 0;
+        INSERT INTO monthly_rollup (type_id, category_id, year_month, total_cents, count)
+        VALUES (NEW.type_id, NEW.category_id, substr(NEW.date, 1, 7), NEW.amount_cents, 1)
+        ON CONFLICT (type_id, year_month, category_id)
+        DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+    END
+    ''')
+    cursor.execute('''
+    INSERT INTO monthly_rollup (type_id, category_id, year_month, total_cents, count)
+    SELECT type_id, category_id, substr(date, 1, 7), SUM(amount_cents), COUNT(*)
+    FROM transactions GROUP BY type_id, category_id, substr(date, 1, 7)
+    ''')
+
+
+def add_description_search(cursor):
+    # Contentless full-text index over description and category name, keyed by transaction id
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5 (
+        description, category, content = '', prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO transactions_fts (rowid, description, category)
+        VALUES (NEW.id, NEW.description, (SELECT name FROM categories WHERE id = NEW.category_id));
+    END
+    ''')
+    # A contentless table can only forget a row when given the values it indexed
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete AFTER DELETE ON transactions
+    BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+        VALUES ('delete', OLD.id, OLD.description, (SELECT name FROM categories WHERE id = OLD.category_id));
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update
+    AFTER UPDATE OF description, category_id ON transactions
+    BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+        VALUES ('delete', OLD.id, OLD.description, (SELECT name FROM categories WHERE id = OLD.category_id));
+        INSERT INTO transactions_fts (rowid, description, category)
+        VALUES (NEW.id, NEW.description, (SELECT name FROM categories WHERE id = NEW.category_id));
+    END
+    ''')
+    cursor.execute('''
+    INSERT INTO transactions_fts (rowid, description, category)
+    SELECT transactions.id, transactions.description, categories.name
+    FROM transactions JOIN categories ON categories.id = transactions.category_id
+    ''')
+
+
+def refresh_daily_balances(cursor, start_day=None):
+    # Recompute the running balance from start_day on, carrying in the balance of the day before it
+    balance = 0
+    if start_day:
+        cursor.execute('''
+        SELECT balance_cents FROM daily_balance WHERE day < ? ORDER BY day DESC LIMIT 1
+        ''', (start_day,))
+        row = cursor.fetchone()
+        balance = row[0] if row else 0
+
+    cursor.execute('''
+    SELECT day, net_cents FROM daily_balance WHERE day >= ? ORDER BY day
+    ''', (start_day or '',))
+    updates = []
+    for day, net_cents in cursor.fetchall():
+        balance += net_cents
+        updates.append((balance, day))
+    cursor.executemany('UPDATE daily_balance SET balance_cents = ? WHERE day = ?', updates)
+
+
+def add_daily_balance(cursor):
+    # Net change and closing balance per day; the balance column is a prefix sum over net_cents
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS daily_balance (
+        day TEXT PRIMARY KEY,
+        net_cents INTEGER NOT NULL,
+        balance_cents INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+
+    # A write on a day moves the balance of that day and every later one
+    signed_new = '''CASE (SELECT name FROM types WHERE id = NEW.type_id)
+        WHEN 'Income' THEN NEW.amount_cents WHEN 'Expense' THEN -NEW.amount_cents ELSE 0 END'''
+    signed_old = '''CASE (SELECT name FROM types WHERE id = OLD.type_id)
+        WHEN 'Income' THEN OLD.amount_cents WHEN 'Expense' THEN -OLD.amount_cents ELSE 0 END'''
+    add_new = f'''
+        INSERT INTO daily_balance (day, net_cents, balance_cents)
+        VALUES (NEW.date, 0, COALESCE(
+            (SELECT balance_cents FROM daily_balance WHERE day < NEW.date ORDER BY day DESC LIMIT 1), 0))
+        ON CONFLICT (day) DO NOTHING;
+        UPDATE daily_balance SET net_cents = net_cents + {signed_new} WHERE day = NEW.date;
+        UPDATE daily_balance SET balance_cents = balance_cents + {signed_new} WHERE day >= NEW.date;
+    '''
+    remove_old = f'''
+        UPDATE daily_balance SET net_cents = net_cents - {signed_old} WHERE day = OLD.date;
+        UPDATE daily_balance SET balance_cents = balance_cents - {signed_old} WHERE day >= OLD.date;
+    '''
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_balance_insert AFTER INSERT ON transactions
+    BEGIN
+        {add_new}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_balance_delete AFTER DELETE ON transactions
+    BEGIN
+        {remove_old}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_balance_update
+    AFTER UPDATE OF type_id, amount_cents, date ON transactions
+    BEGIN
+        {remove_old}
+        {add_new}
+    END
+    ''')
+
+    # Backfill from the rows that already exist
+    cursor.execute('''
+    INSERT INTO daily_balance (day, net_cents, balance_cents)
+    SELECT transactions.date,
+           SUM(CASE types.name WHEN 'Income' THEN transactions.amount_cents
+                               WHEN 'Expense' THEN -transactions.amount_cents ELSE 0 END), 0
+    FROM transactions JOIN types ON types.id = transactions.type_id
+    GROUP BY transactions.date
+    ''')
+    refresh_daily_balances(cursor)
+
+
+def add_recurring_rules(cursor):
+    # Schedules that expand into ordinary transactions; next_date is the first occurrence not yet booked
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recurring_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type_id INTEGER NOT NULL REFERENCES types (id),
+        category_id INTEGER NOT NULL REFERENCES categories (id),
+        amount_cents INTEGER NOT NULL,
+        description TEXT,
+        frequency TEXT NOT NULL,
+        every INTEGER NOT NULL DEFAULT 1,
+        start_date TEXT NOT NULL,
+        end_date TEXT,
+        next_date TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_recurring_rules_next_date
+    ON recurring_rules (next_date)
+    ''')
+
+    # (rule_id, date) is the idempotency key of a booked occurrence; hand-entered rows leave rule_id NULL
+    cursor.execute('ALTER TABLE transactions ADD COLUMN rule_id INTEGER REFERENCES recurring_rules (id)')
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_rule_date
+    ON transactions (rule_id, date) WHERE rule_id IS NOT NULL
+    ''')
+
+
+def refresh_account_balances(cursor, account_id, start_day=None):
+    # refresh_daily_balances for one account of the per-account daily_balance table
+    balance = 0
+    if start_day:
+        cursor.execute('''
+        SELECT balance_cents FROM daily_balance WHERE account_id = ? AND day < ? ORDER BY day DESC LIMIT 1
+        ''', (account_id, start_day))
+        row = cursor.fetchone()
+        balance = row[0] if row else 0
+
+    cursor.execute('''
+    SELECT day, net_cents FROM daily_balance WHERE account_id = ? AND day >= ? ORDER BY day
+    ''', (account_id, start_day or ''))
+    updates = []
+    for day, net_cents in cursor.fetchall():
+        balance += net_cents
+        updates.append((balance, account_id, day))
+    cursor.executemany('UPDATE daily_balance SET balance_cents = ? WHERE account_id = ? AND day = ?', updates)
+
+
+def add_accounts_and_currencies(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS currencies (
+        code TEXT PRIMARY KEY,
+        symbol TEXT
+    ) WITHOUT ROWID
+    ''')
+    cursor.executemany('INSERT OR IGNORE INTO currencies (code, symbol) VALUES (?, ?)', CURRENCIES)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS settings (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO settings (name, value) VALUES ('base_currency', ?)", (BASE_CURRENCY,))
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        currency TEXT NOT NULL REFERENCES currencies (code)
+    )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO accounts (id, name, currency) VALUES (?, ?, ?)',
+                   (DEFAULT_ACCOUNT_ID, "Main", BASE_CURRENCY))
+    # One unit of currency is worth rate units of quote from day until the pair's next rate
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS fx_rates (
+        currency TEXT NOT NULL,
+        quote TEXT NOT NULL,
+        day TEXT NOT NULL,
+        rate REAL NOT NULL,
+        PRIMARY KEY (currency, quote, day)
+    ) WITHOUT ROWID
+    ''')
+
+    cursor.execute(f'''
+    ALTER TABLE transactions ADD COLUMN account_id INTEGER NOT NULL DEFAULT {DEFAULT_ACCOUNT_ID}
+    REFERENCES accounts (id)
+    ''')
+    cursor.execute(f'''
+    ALTER TABLE recurring_rules ADD COLUMN account_id INTEGER NOT NULL DEFAULT {DEFAULT_ACCOUNT_ID}
+    REFERENCES accounts (id)
+    ''')
+
+    # Account-first indexes, so one account's rows are a contiguous range however many other accounts there are.
+    # The global (date, id) index stays for the all-accounts listing.
+    cursor.execute('DROP INDEX IF EXISTS idx_transactions_type_date')
+    cursor.execute('''
+    CREATE INDEX idx_transactions_account_type_date
+    ON transactions (account_id, type_id, date, category_id, amount_cents)
+    ''')
+    cursor.execute('''
+    CREATE INDEX idx_transactions_account_date_id
+    ON transactions (account_id, date, id)
+    ''')
+
+    # The rollup and the prefix sums are partitioned by account the same way
+    for trigger in ('trg_transactions_rollup_insert', 'trg_transactions_rollup_delete',
+                    'trg_transactions_rollup_update', 'trg_transactions_balance_insert',
+                    'trg_transactions_balance_delete', 'trg_transactions_balance_update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    cursor.execute('DROP TABLE IF EXISTS monthly_rollup')
+    cursor.execute('DROP TABLE IF EXISTS daily_balance')
+
+    cursor.execute('''
+    CREATE TABLE monthly_rollup (
+        account_id INTEGER NOT NULL,
+        type_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        year_month TEXT NOT NULL,
+        total_cents INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (account_id, type_id, year_month, category_id)
+    ) WITHOUT ROWID
+    ''')
+    add_new = '''
+        INSERT INTO monthly_rollup (account_id, type_id, category_id, year_month, total_cents, count)
+        VALUES (NEW.account_id, NEW.type_id, NEW.category_id, substr(NEW.date, 1, 7), NEW.amount_cents, 1)
+        ON CONFLICT (account_id, type_id, year_month, category_id)
+        DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+    '''
+    remove_old = '''
+        UPDATE monthly_rollup SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+        WHERE account_id = OLD.account_id AND type_id = OLD.type_id AND year_month = substr(OLD.date, 1, 7)
+        AND category_id = OLD.category_id;
+        DELETE FROM monthly_rollup
+        WHERE account_id = OLD.account_id AND type_id = OLD.type_id AND year_month = substr(OLD.date, 1, 7)
+        AND category_id = OLD.category_id AND count = 0;
+    '''
+    cursor.execute(f'''
+    CREATE TRIGGER trg_transactions_rollup_insert AFTER INSERT ON transactions
+    BEGIN
+        {add_new}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER trg_transactions_rollup_delete AFTER DELETE ON transactions
+    BEGIN
+        {remove_old}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER trg_transactions_rollup_update
+    AFTER UPDATE OF account_id, type_id, category_id, amount_cents, date ON transactions
+    BEGIN
+        {remove_old}
+        {add_new}
+    END
+    ''')
+    cursor.execute('''
+    INSERT INTO monthly_rollup (account_id, type_id, category_id, year_month, total_cents, count)
+    SELECT account_id, type_id, category_id, substr(date, 1, 7), SUM(amount_cents), COUNT(*)
+    FROM transactions GROUP BY account_id, type_id, category_id, substr(date, 1, 7)
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE daily_balance (
+        account_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        net_cents INTEGER NOT NULL,
+        balance_cents INTEGER NOT NULL,
+        PRIMARY KEY (account_id, day)
+    ) WITHOUT ROWID
+    ''')
+    # A write now only moves the later days of its own account
+    signed_new = '''CASE (SELECT name FROM types WHERE id = NEW.type_id)
+        WHEN 'Income' THEN NEW.amount_cents WHEN 'Expense' THEN -NEW.amount_cents ELSE 0 END'''
+    signed_old = '''CASE (SELECT name FROM types WHERE id = OLD.type_id)
+        WHEN 'Income' THEN OLD.amount_cents WHEN 'Expense' THEN -OLD.amount_cents ELSE 0 END'''
+    add_new = f'''
+        INSERT INTO daily_balance (account_id, day, net_cents, balance_cents)
+        VALUES (NEW.account_id, NEW.date, 0, COALESCE(
+            (SELECT balance_cents FROM daily_balance WHERE account_id = NEW.account_id AND day < NEW.date
+             ORDER BY day DESC LIMIT 1), 0))
+        ON CONFLICT (account_id, day) DO NOTHING;
+        UPDATE daily_balance SET net_cents = net_cents + {signed_new}
+        WHERE account_id = NEW.account_id AND day = NEW.date;
+        UPDATE daily_balance SET balance_cents = balance_cents + {signed_new}
+        WHERE account_id = NEW.account_id AND day >= NEW.date;
+    '''
+    remove_old = f'''
+        UPDATE daily_balance SET net_cents = net_cents - {signed_old}
+        WHERE account_id = OLD.account_id AND day = OLD.date;
+        UPDATE daily_balance SET balance_cents = balance_cents - {signed_old}
+        WHERE account_id = OLD.account_id AND day >= OLD.date;
+    '''
+    cursor.execute(f'''
+    CREATE TRIGGER trg_transactions_balance_insert AFTER INSERT ON transactions
+    BEGIN
+        {add_new}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER trg_transactions_balance_delete AFTER DELETE ON transactions
+    BEGIN
+        {remove_old}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER trg_transactions_balance_update
+    AFTER UPDATE OF account_id, type_id, amount_cents, date ON transactions
+    BEGIN
+        {remove_old}
+        {add_new}
+    END
+    ''')
+    cursor.execute('''
+    INSERT INTO daily_balance (account_id, day, net_cents, balance_cents)
+    SELECT transactions.account_id, transactions.date,
+           SUM(CASE types.name WHEN 'Income' THEN transactions.amount_cents
+                               WHEN 'Expense' THEN -transactions.amount_cents ELSE 0 END), 0
+    FROM transactions JOIN types ON types.id = transactions.type_id
+    GROUP BY transactions.account_id, transactions.date
+    ''')
+    cursor.execute('SELECT DISTINCT account_id FROM daily_balance')
+    for account_id, in cursor.fetchall():
+        refresh_account_balances(cursor, account_id)
+
+
+def add_budgets(cursor):
+    # Spending limits per expense category and period; a NULL account_id budgets every account in the base currency
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS budgets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER NOT NULL REFERENCES categories (id),
+        period TEXT NOT NULL,
+        limit_cents INTEGER NOT NULL,
+        alert_at REAL NOT NULL DEFAULT 0.8,
+        account_id INTEGER REFERENCES accounts (id)
+    )
+    ''')
+
+
+# Schema migrations in order; PRAGMA user_version stores how many have been applied
+MIGRATIONS = [
+    add_transaction_indexes,
+    add_monthly_rollup,
+    encode_amounts_and_categories,
+    add_description_search,
+    add_daily_balance,
+    add_recurring_rules,
+    add_accounts_and_currencies,
+    add_budgets,
+]
+
+
+def fts_query(text):
+    # Quote every word of free text as a prefix term, so user input can never be parsed as FTS5 syntax
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+
+def split_period(start_date, end_date):
+    # Split an inclusive date range into the whole months it covers and the partial-month edges around them
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+
+    if start.day == 1:
+        first_month = start
+    else:
+        first_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    if end.day == monthrange(end.year, end.month)[1]:
+        last_month_end = end
+    else:
+        last_month_end = end.replace(day=1) - timedelta(days=1)
+
+    if first_month > last_month_end:
+        return None, [(start_date, end_date)]
+
+    months = (first_month.strftime('%Y-%m'), last_month_end.strftime('%Y-%m'))
+    edges = []
+    if start < first_month:
+        edges.append((start_date, (first_month - timedelta(days=1)).strftime('%Y-%m-%d')))
+    if last_month_end < end:
+        edges.append(((last_month_end + timedelta(days=1)).strftime('%Y-%m-%d'), end_date))
+    return months, edges
+
+
+def shift_month(year_month, months):
+    # 'YYYY-MM' moved by a signed number of months
+    year, month = map(int, year_month.split('-'))
+    index = year * 12 + month - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def period_date_range(period, today=None):
+    # (start_date, end_date) for the named period; (None, None) means all time
+    today = today or datetime.now().date()
+
+    if period == "This Month":
+        start_date = datetime(today.year, today.month, 1).strftime('%Y-%m-%d')
+        if today.month == 12:
+            end_date = datetime(today.year + 1, 1, 1) - timedelta(days=1)
+        else:
+            end_date = datetime(today.year, today.month + 1, 1) - timedelta(days=1)
+        end_date = end_date.strftime('%Y-%m-%d')
+
+    elif period == "Last Month":
+        if today.month == 1:
+            start_date = datetime(today.year - 1, 12, 1)
+            end_date = datetime(today.year, 1, 1) - timedelta(days=1)
+        else:
+            start_date = datetime(today.year, today.month - 1, 1)
+            end_date = datetime(today.year, today.month, 1) - timedelta(days=1)
+        start_date = start_date.strftime('%Y-%m-%d')
+        end_date = end_date.strftime('%Y-%m-%d')
+
+    elif period == "This Week":
+        start_date = (today - timedelta(days=today.weekday())).strftime('%Y-%m-%d')
+        end_date = today.strftime('%Y-%m-%d')
+
+    elif period == "Last Week":
+        start_date = (today - timedelta(days=today.weekday() + 7)).strftime('%Y-%m-%d')
+        end_date = (today - timedelta(days=today.weekday() + 1)).strftime('%Y-%m-%d')
+
+    else:  # All Time
+        start_date = None
+        end_date = None
+
+    return start_date, end_date
+
+
+def month_close(year_month):
+    # Sorts after every day of the month and before the next one, so it finds the rate in effect at month end
+    return year_month + '-31'
+
+
+# Rows keep their (id, type, category, amount, date, description, account_id) shape however they are stored
+TRANSACTION_SELECT = '''
+SELECT transactions.id, types.name, categories.name, transactions.amount_cents / 100.0,
+       transactions.date, transactions.description, transactions.account_id
+FROM transactions
+JOIN types ON types.id = transactions.type_id
+JOIN categories ON categories.id = transactions.category_id
+'''
+
+
+class Change:
+    # One committed write: which types, dates and accounts it touched, and the rows themselves when there are
+    # few enough
+    def __init__(self, kind, types, start_date, end_date, rows=None, accounts=None):
+        self.kind = kind  # 'insert', 'delete', or 'rates' when exchange rates moved the converted totals
+        self.types = set(types)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.rows = rows  # (id, type, category, amount, date, description, account_id) tuples, or None
+        self.accounts = None if accounts is None else set(accounts)  # None touches every account
+
+    @classmethod
+    def from_rows(cls, kind, rows):
+        dates = [row[4] for row in rows]
+        return cls(kind, {row[1] for row in rows}, min(dates), max(dates), rows, {row[6] for row in rows})
+
+    def affects(self, types, start_date=None, end_date=None, accounts=None):
+        # Whether a view over these types, this inclusive date range (None is open-ended) and these accounts
+        # (None for all of them) could have changed
+        return (not self.types.isdisjoint(types)
+                and (start_date is None or self.end_date >= start_date)
+                and (end_date is None or self.start_date <= end_date)
+                and (accounts is None or self.accounts is None or not self.accounts.isdisjoint(accounts)))
+
+
+class QueryCache:
+    # LRU of read results, each tagged with the types and dates it covers so a write only drops what it touched
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, types, start_date, end_date, compute, accounts=None):
+        # types=None covers every type and accounts=None every account; start_date/end_date=None leave that
+        # end of the range open
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[4]
+            self.misses += 1
+            generation = self.generation
+
+        result = compute()
+        if isinstance(result, list):
+            result = tuple(result)  # Every caller shares the cached result, so none of them may change it
+
+        with self.lock:
+            # A write that committed while this ran may or may not be in the result, so it is not kept
+            if generation == self.generation:
+                self.entries[key] = (types, start_date, end_date, accounts, result)
+                if len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return result
+
+    def invalidate(self, change):
+        with self.lock:
+            self.generation += 1
+            stale = [key for key, (types, start_date, end_date, accounts, _) in self.entries.items()
+                     if change.affects(change.types if types is None else types, start_date, end_date, accounts)]
+            for key in stale:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self.entries),
+            }
+
+
+class MissingRateError(LookupError):
+    pass
+
+
+class ExchangeRates:
+    # Every stored rate in memory as date-sorted lists per pair, with conversions memoized by (pair, day)
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pairs = {}
+        self.memo = {}
+
+    def load(self, rows):
+        # rows: (currency, quote, day, rate) ordered by pair and day
+        pairs = {}
+        for pair, pair_rows in groupby(rows, key=lambda row: (row[0], row[1])):
+            pair_rows = list(pair_rows)
+            pairs[pair] = ([row[2] for row in pair_rows], [row[3] for row in pair_rows])
+        with self.lock:
+            self.pairs = pairs
+            self.memo = {}
+
+    def set(self, currency, quote, day, rate):
+        # True when day is now the pair's first rate, which lookup also applies to every earlier day
+        with self.lock:
+            days, rates = self.pairs.setdefault((currency, quote), ([], []))
+            index = bisect_right(days, day)
+            if index and days[index - 1] == day:
+                rates[index - 1] = rate
+            else:
+                days.insert(index, day)
+                rates.insert(index, rate)
+            self.memo = {}
+            return days[0] == day
+
+    def lookup(self, currency, quote, day):
+        # The pair's rate in effect on day, or its inverse; history before the first rate uses the first rate
+        for pair, invert in (((currency, quote), False), ((quote, currency), True)):
+            entry = self.pairs.get(pair)
+            if entry:
+                days, rates = entry
+                rate = rates[max(bisect_right(days, day) - 1, 0)]
+                return 1 / rate if invert else rate
+        return None
+
+    def rate(self, currency, quote, day, pivot):
+        # Units of quote per unit of currency on day, crossing through the pivot currency when there is no direct rate
+        if currency == quote:
+            return 1.0
+        key = (currency, quote, day)
+        rate = self.memo.get(key)
+        if rate is not None:
+            return rate
+
+        with self.lock:
+            rate = self.lookup(currency, quote, day)
+            if rate is None and pivot not in (currency, quote):
+                to_pivot = self.lookup(currency, pivot, day)
+                from_pivot = self.lookup(pivot, quote, day)
+                if to_pivot is not None and from_pivot is not None:
+                    rate = to_pivot * from_pivot
+            if rate is None:
+                raise MissingRateError(f"no {currency}/{quote} exchange rate; add one to convert {currency} amounts")
+            self.memo[key] = rate
+        return rate
+
+
+class ConnectionPool:
+    # WAL-mode connections: one writer shared under a lock, plus a read connection per thread
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.local = threading.local()
+        self.write_lock = threading.RLock()
+        self.readers = []
+        self.readers_lock = threading.Lock()
+        self.trace_callback = None
+
+        self.writer = self.connect()
+        # Takes effect on a new file, or an old one's next full VACUUM; freed pages can then be returned in steps
+        self.writer.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # An in-memory database only exists on its own connection, so there is nothing to split
+        self.shared = db_path == ':memory:'
+        if not self.shared:
+            self.writer.execute('PRAGMA journal_mode = WAL')
+
+    def connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        # NORMAL is crash-safe under WAL; the page cache and memory map keep hot pages out of read() calls
+        connection.execute('PRAGMA synchronous = NORMAL')
+        connection.execute('PRAGMA cache_size = -65536')
+        connection.execute('PRAGMA mmap_size = 268435456')
+        connection.set_trace_callback(self.trace_callback)
+        return connection
+
+    def reader(self):
+        if self.shared:
+            return self.writer
+
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.connect()
+            connection.execute('PRAGMA query_only = ON')
+            self.local.connection = connection
+            with self.readers_lock:
+                self.readers.append(connection)
+        return connection
+
+    def set_trace_callback(self, callback):
+        # callback(statement) for every statement on every connection, including readers opened later
+        self.trace_callback = callback
+        with self.readers_lock:
+            for connection in [self.writer] + self.readers:
+                connection.set_trace_callback(callback)
+
+    def close(self):
+        with self.readers_lock:
+            for connection in self.readers:
+                connection.close()
+            self.readers = []
+        self.writer.close()
+
+
+class DatabaseManager:
+    def __init__(self, db_path='money_tracker.db'):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        self.write_lock = self.pool.write_lock
+
+        # The writer connection; every write goes through it while holding write_lock
+        self.conn = self.pool.writer
+        self.cursor = self.conn.cursor()
+        self.listeners = []
+        self.cache = QueryCache()
+        self.rates = ExchangeRates()
+        self.create_tables()
+        self.migrate()
+        self.load_lookups()
+
+    def add_listener(self, listener):
+        # listener(change) is called on the writing thread after every committed write
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def notify(self, change):
+        # Also used to pass on changes committed through another DatabaseManager on the same file,
+        # such as an import thread's
+        self.invalidate(change)
+        for listener in list(self.listeners):
+            listener(change)
+
+    def invalidate(self, change):
+        self.cache.invalidate(change)
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    def read_cursor(self):
+        return self.pool.reader().cursor()
+
+    def load_lookups(self):
+        cursor = self.read_cursor()
+        cursor.execute('SELECT name, id FROM types')
+        self.type_ids = dict(cursor.fetchall())
+        cursor.execute('SELECT type_id, name, id FROM categories')
+        self.category_ids = {(type_id, name): category_id for type_id, name, category_id in cursor.fetchall()}
+        cursor.execute('SELECT id, name, currency FROM accounts')
+        self.accounts = {account_id: (name, currency) for account_id, name, currency in cursor.fetchall()}
+        cursor.execute('SELECT code, symbol FROM currencies')
+        self.currency_symbols = dict(cursor.fetchall())
+        cursor.execute("SELECT value FROM settings WHERE name = 'base_currency'")
+        self.base_currency = cursor.fetchone()[0]
+        cursor.execute('SELECT currency, quote, day, rate FROM fx_rates ORDER BY currency, quote, day')
+        self.rates.load(cursor.fetchall())
+
+    def type_id(self, transaction_type):
+        # None for a type that has never been stored, which then matches no rows
+        if transaction_type not in self.type_ids:
+            self.load_lookups()
+        return self.type_ids.get(transaction_type)
+
+    def account_id(self, name):
+        # None for an account that doesn't exist
+        for account_id, (account_name, _) in self.accounts.items():
+            if account_name == name:
+                return account_id
+        self.load_lookups()
+        return next((account_id for account_id, (account_name, _) in self.accounts.items()
+                     if account_name == name), None)
+
+    def account_scope(self, account_id=None):
+        # (account ids, currency of the results): one account in its own currency, or every account in the base one
+        if account_id is None:
+            return sorted(self.accounts), self.base_currency
+        if account_id not in self.accounts:
+            self.load_lookups()
+        if account_id not in self.accounts:
+            return [], self.base_currency
+        return [account_id], self.accounts[account_id][1]
+
+    def exchange_rate(self, currency, quote, day):
+        # Units of quote per unit of currency on day; raises MissingRateError when no stored rate connects them
+        return self.rates.rate(currency, quote, day, self.base_currency)
+
+    def convert(self, amount, currency, quote, day):
+        return round(amount * self.exchange_rate(currency, quote, day), 2)
+
+    def format_amount(self, amount, currency=None):
+        currency = currency or self.base_currency
+        symbol = self.currency_symbols.get(currency)
+        return f"{symbol}{amount:.2f}" if symbol else f"{amount:.2f} {currency}"
+
+    def encode_category(self, transaction_type, category):
+        # (type_id, category_id) for a write; call with write_lock held, unseen names are added to the lookups
+        type_id = self.type_ids.get(transaction_type)
+        if type_id is None:
+            self.cursor.execute('INSERT OR IGNORE INTO types (name) VALUES (?)', (transaction_type,))
+            self.cursor.execute('SELECT id FROM types WHERE name = ?', (transaction_type,))
+            type_id = self.type_ids[transaction_type] = self.cursor.fetchone()[0]
+
+        category_id = self.category_ids.get((type_id, category))
+        if category_id is None:
+            self.cursor.execute('INSERT OR IGNORE INTO categories (type_id, name) VALUES (?, ?)',
+                                (type_id, category))
+            self.cursor.execute('SELECT id FROM categories WHERE type_id = ? AND name = ?', (type_id, category))
+            category_id = self.category_ids[(type_id, category)] = self.cursor.fetchone()[0]
+
+        return type_id, category_id
+
+    def create_tables(self):
+        # Create transactions table
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            date TEXT NOT NULL,
+            description TEXT
+        )
+        ''')
+        self.conn.commit()
+
+    def migrate(self):
+        with self.write_lock:
+            self.cursor.execute('PRAGMA user_version')
+            version = self.cursor.fetchone()[0]
+
+            for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                # Each migration and its version bump commit together, so a failure leaves the old version intact
+                self.cursor.execute('BEGIN')
+                try:
+                    migration(self.cursor)
+                    self.cursor.execute(f'PRAGMA user_version = {target}')
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+
+    def check_query_plans(self):
+        # Run every read query once and collect the SQL that actually reaches SQLite
+        statements = []
+        self.cache.clear()  # Cached results would never reach SQLite
+        connection = self.pool.reader()
+        connection.set_trace_callback(statements.append)
+        try:
+            self.get_all_transactions()
+            self.get_transaction(1)
+            self.get_transactions_page(100)
+            self.get_transactions_page(100, ('2000-01-01', 1))
+            self.get_transactions_page(100, account_id=DEFAULT_ACCOUNT_ID)
+            self.get_transactions_page(100, ('2000-01-01', 1), DEFAULT_ACCOUNT_ID)
+            self.get_transactions_by_type("Expense")
+            list(self.iter_transactions())
+            list(self.iter_transactions("Expense", "Food", '2000-01-01', '2000-12-31'))
+            list(self.iter_transactions("Expense", None, '2000-01-01', '2000-12-31', account_id=DEFAULT_ACCOUNT_ID))
+            self.get_transactions_by_date_range('2000-01-01', '2000-12-31')
+            for account_id in (None, DEFAULT_ACCOUNT_ID):
+                self.get_category_totals("Expense", account_id=account_id)
+                self.get_category_totals("Expense", '2000-01-15', '2000-12-20', account_id)
+                self.get_total_amount_by_type("Income", account_id=account_id)
+                self.get_total_amount_by_type("Income", '2000-01-15', '2000-12-20', account_id)
+                self.get_monthly_totals(account_id=account_id)
+                self.get_monthly_totals('2000-01', '2000-12', account_id)
+                self.get_balance_at('2000-06-30', account_id)
+                self.get_daily_balances('2000-01-01', '2000-12-31', account_id)
+            self.search_transactions("coffee")
+            self.search_transactions("coffee shop", "Expense", ('2000-01-01', '2000-12-31'), 50, 1000)
+            self.search_transactions("coffee", account_id=DEFAULT_ACCOUNT_ID)
+        finally:
+            connection.set_trace_callback(self.pool.trace_callback)
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {name for name, in cursor.fetchall()}
+
+        # A table scan without an index, or a sort the index can't satisfy, means a missing index
+        problems = []
+        for statement in statements:
+            if not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement)
+            for row in cursor.fetchall():
+                detail = row[-1]
+                words = detail.split()
+                full_scan = (words[0] == 'SCAN' and words[1] in tables
+                             and 'USING' not in words and 'VIRTUAL' not in words)
+                if full_scan or 'TEMP B-TREE FOR ORDER BY' in detail:
+                    problems.append((' '.join(statement.split()), detail))
+        return problems
+
+    def add_transaction(self, transaction_type, category, amount, date, description="", account_id=None):
+        account_id = DEFAULT_ACCOUNT_ID if account_id is None else account_id
+        with self.write_lock:
+            type_id, category_id = self.encode_category(transaction_type, category)
+            self.cursor.execute('''
+            INSERT INTO transactions (type_id, category_id, amount_cents, date, description, account_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (type_id, category_id, round(amount * 100), date, description, account_id))
+            self.conn.commit()
+            transaction_id = self.cursor.lastrowid
+
+        self.notify(Change.from_rows('insert', [
+            (transaction_id, transaction_type, category, round(amount * 100) / 100, date, description, account_id)]))
+        return transaction_id
+
+    def bulk_insert(self, transactions, chunk_size=10000, progress=None, account_id=None):
+        # Loads (type, category, amount, date, description) tuples into one account, in chunks inside a single
+        # transaction
+        account_id = DEFAULT_ACCOUNT_ID if account_id is None else account_id
+        with self.write_lock:
+            self.cursor.execute('PRAGMA synchronous')
+            synchronous = self.cursor.fetchone()[0]
+            self.cursor.execute('PRAGMA cache_size')
+            cache_size = self.cursor.fetchone()[0]
+
+            # Nothing is durable until the final commit anyway, so skip the fsyncs and give the load a large page cache
+            self.cursor.execute('PRAGMA synchronous = OFF')
+            self.cursor.execute('PRAGMA cache_size = -262144')
+
+            self.cursor.execute('BEGIN')
+            try:
+                self.cursor.execute('SELECT COALESCE(MAX(id), 0) FROM transactions')
+                first_id = self.cursor.fetchone()[0] + 1
+                self.cursor.execute('SELECT NOT EXISTS (SELECT 1 FROM transactions)')
+                initial_load = self.cursor.fetchone()[0]
+
+                triggers = self.drop_insert_triggers()
+
+                # Into an empty table, building the indexes once at the end beats maintaining them row by row
+                indexes = []
+                if initial_load:
+                    self.cursor.execute('''
+                    SELECT name, sql FROM sqlite_master
+                    WHERE type = 'index' AND tbl_name = 'transactions' AND sql IS NOT NULL
+                    ''')
+                    indexes = self.cursor.fetchall()
+                    for name, _ in indexes:
+                        self.cursor.execute(f'DROP INDEX {name}')
+
+                inserted = 0
+                encoded = ((*self.encode_category(transaction_type, category), round(amount * 100),
+                            transaction_date, description, account_id)
+                           for transaction_type, category, amount, transaction_date, description in transactions)
+                while True:
+                    chunk = list(islice(encoded, chunk_size))
+                    if not chunk:
+                        break
+                    self.cursor.executemany('''
+                    INSERT INTO transactions (type_id, category_id, amount_cents, date, description, account_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ''', chunk)
+                    inserted += len(chunk)
+                    if progress:
+                        progress(inserted)
+
+                for _, sql in indexes:
+                    self.cursor.execute(sql)
+                self.refresh_derived_tables(first_id)
+                for sql in triggers:
+                    self.cursor.execute(sql)
+
+                change = None
+                if inserted:
+                    self.cursor.execute('''
+                    SELECT MIN(date), MAX(date) FROM transactions WHERE id >= ?
+                    ''', (first_id,))
+                    start_date, end_date = self.cursor.fetchone()
+                    # Every type with rows is a safe superset, read from the small rollup instead of the new rows
+                    self.cursor.execute('''
+                    SELECT name FROM types WHERE id IN (SELECT DISTINCT type_id FROM monthly_rollup)
+                    ''')
+                    types = [name for name, in self.cursor.fetchall()]
+                    change = Change('insert', types, start_date, end_date, accounts={account_id})
+
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                self.load_lookups()  # Drop any ids the rollback took back
+                raise
+            finally:
+                self.cursor.execute(f'PRAGMA synchronous = {synchronous}')
+                self.cursor.execute(f'PRAGMA cache_size = {cache_size}')
+
+        if change:
+            self.notify(change)
+        return inserted
+
+    def drop_insert_triggers(self):
+        # Per-row insert triggers are replaced by one set-based refresh once the rows are in; returns their SQL
+        self.cursor.execute('''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'trigger' AND tbl_name = 'transactions' AND sql LIKE '%AFTER INSERT%'
+        ''')
+        triggers = self.cursor.fetchall()
+        for name, _ in triggers:
+            self.cursor.execute(f'DROP TRIGGER {name}')
+        return [sql for _, sql in triggers]
+
+    def drop_balance_trigger(self, event):
+        # The daily_balance trigger for event ('DELETE' or 'UPDATE') moves every later day of the account once per
+        # row; a batch drops it and calls shift_daily_balances instead. Returns its SQL to put it back.
+        name = f'trg_transactions_balance_{event.lower()}'
+        self.cursor.execute('''
+        SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?
+        ''', (name,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        self.cursor.execute(f'DROP TRIGGER {name}')
+        return row[0]
+
+    def shift_daily_balances(self, removed=(), added=()):
+        # Takes the removed rows' net amounts out of their account and day and puts the added rows' in, then
+        # rebuilds each account's running balance once, from the earliest day touched
+        net = defaultdict(int)
+        for sign, transactions in ((-1, removed), (1, added)):
+            for _, transaction_type, _, amount, transaction_date, _, account_id in transactions:
+                if transaction_type == 'Income':
+                    net[account_id, transaction_date] += sign * round(amount * 100)
+                elif transaction_type == 'Expense':
+                    net[account_id, transaction_date] -= sign * round(amount * 100)
+        self.cursor.executemany('''
+        INSERT INTO daily_balance (account_id, day, net_cents, balance_cents) VALUES (?, ?, ?, 0)
+        ON CONFLICT (account_id, day) DO UPDATE SET net_cents = net_cents + excluded.net_cents
+        ''', [(account_id, day, cents) for (account_id, day), cents in net.items()])
+        first_days = {}
+        for account_id, day in net:
+            first_days[account_id] = min(day, first_days.get(account_id, day))
+        for account_id, first_day in first_days.items():
+            refresh_account_balances(self.cursor, account_id, first_day)
+
+    def refresh_derived_tables(self, first_id):
+        # Fold rows inserted without triggers (id >= first_id) into the tables the triggers maintain.
+        # NOT INDEXED keeps the planner on the rowid range; left alone it walks a whole index to skip a sort.
+        self.cursor.execute('''
+        INSERT INTO monthly_rollup (account_id, type_id, category_id, year_month, total_cents, count)
+        SELECT account_id, type_id, category_id, substr(date, 1, 7), SUM(amount_cents), COUNT(*)
+        FROM transactions NOT INDEXED WHERE id >= ?
+        GROUP BY account_id, type_id, category_id, substr(date, 1, 7)
+        ON CONFLICT (account_id, type_id, year_month, category_id)
+        DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + excluded.count
+        ''', (first_id,))
+        self.cursor.execute('''
+        INSERT INTO transactions_fts (rowid, description, category)
+        SELECT transactions.id, transactions.description, categories.name
+        FROM transactions JOIN categories ON categories.id = transactions.category_id
+        WHERE transactions.id >= ?
+        ''', (first_id,))
+        self.cursor.execute('''
+        INSERT INTO daily_balance (account_id, day, net_cents, balance_cents)
+        SELECT transactions.account_id, transactions.date,
+               SUM(CASE types.name WHEN 'Income' THEN transactions.amount_cents
+                                   WHEN 'Expense' THEN -transactions.amount_cents ELSE 0 END), 0
+        FROM transactions NOT INDEXED JOIN types ON types.id = transactions.type_id
+        WHERE transactions.id >= ?
+        GROUP BY transactions.account_id, transactions.date
+        ON CONFLICT (account_id, day) DO UPDATE SET net_cents = net_cents + excluded.net_cents
+        ''', (first_id,))
+        self.cursor.execute('''
+        SELECT account_id, MIN(date) FROM transactions NOT INDEXED WHERE id >= ? GROUP BY account_id
+        ''', (first_id,))
+        for account_id, first_day in self.cursor.fetchall():
+            refresh_account_balances(self.cursor, account_id, first_day)
+
+    def get_transaction(self, transaction_id):
+        cursor = self.read_cursor()
+        cursor.execute(TRANSACTION_SELECT + '''
+        WHERE transactions.id = ?
+        ''', (transaction_id,))
+        return cursor.fetchone()
+
+    def get_all_transactions(self):
+        cursor = self.read_cursor()
+        cursor.execute(TRANSACTION_SELECT + '''
+        ORDER BY transactions.date DESC
+        ''')
+        return cursor.fetchall()
+
+    def iter_transactions(self, transaction_type=None, category=None, start_date=None, end_date=None,
+                          chunk_size=10000, account_id=None):
+        # Oldest first in lists of up to chunk_size rows, so a caller never holds more than one chunk
+        sql = TRANSACTION_SELECT + ' WHERE 1'
+        params = []
+
+        if account_id is not None:
+            sql += ' AND transactions.account_id = ?'
+            params.append(account_id)
+        type_id = self.type_id(transaction_type) if transaction_type else None
+        if transaction_type:
+            # The unary plus keeps the (date, id) index in charge, which streams rows already in order
+            # instead of sorting every row of the type in a temp b-tree before the first one comes back
+            sql += ' AND +transactions.type_id = ?'
+            params.append(type_id)
+        if category:
+            # A category name can exist under both types; another connection may have added it
+            def matching_ids():
+                return [category_id for (category_type_id, name), category_id in self.category_ids.items()
+                        if name == category and (type_id is None or category_type_id == type_id)]
+            category_ids = matching_ids()
+            if not category_ids:
+                self.load_lookups()
+                category_ids = matching_ids()
+            sql += f' AND transactions.category_id IN ({", ".join("?" * len(category_ids)) or "NULL"})'
+            params.extend(category_ids)
+        if start_date:
+            sql += ' AND transactions.date >= ?'
+            params.append(start_date)
+        if end_date:
+            sql += ' AND transactions.date <= ?'
+            params.append(end_date)
+
+        cursor = self.read_cursor()
+        cursor.execute(sql + ' ORDER BY transactions.date, transactions.id', params)
+        try:
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            cursor.close()
+
+    def get_transactions_page(self, limit, after=None, account_id=None):
+        # Keyset pagination: newest first, continuing strictly after the (date, id) of the last row seen.
+        # One account's pages walk its own slice of the (account_id, date, id) index.
+        sql = TRANSACTION_SELECT + ' WHERE 1'
+        params = []
+        if account_id is not None:
+            sql += ' AND transactions.account_id = ?'
+            params.append(account_id)
+        if after is not None:
+            sql += ' AND (transactions.date, transactions.id) < (?, ?)'
+            params.extend(after)
+
+        cursor = self.read_cursor()
+        cursor.execute(sql + ' ORDER BY transactions.date DESC, transactions.id DESC LIMIT ?', params + [limit])
+        return cursor.fetchall()
+
+    def get_transactions_by_type(self, transaction_type):
+        cursor = self.read_cursor()
+        cursor.execute(TRANSACTION_SELECT + '''
+        WHERE transactions.type_id = ? ORDER BY transactions.date DESC
+        ''', (self.type_id(transaction_type),))
+        return cursor.fetchall()
+
+    def get_transactions_by_date_range(self, start_date, end_date):
+        return self.cache.get(('transactions_by_date_range', start_date, end_date), None, start_date, end_date,
+                              lambda: self._transactions_by_date_range(start_date, end_date))
+
+    def _transactions_by_date_range(self, start_date, end_date):
+        cursor = self.read_cursor()
+        cursor.execute(TRANSACTION_SELECT + '''
+        WHERE transactions.date BETWEEN ? AND ? ORDER BY transactions.date DESC
+        ''', (start_date, end_date))
+        return cursor.fetchall()
+
+    def search_transactions(self, query, transaction_type=None, date_range=None, limit=100, before_id=None,
+                            account_id=None):
+        # Full-text match on description and category, newest first; before_id continues from a previous page
+        match = fts_query(query)
+        if not match:
+            return []
+
+        sql = TRANSACTION_SELECT + '''
+        JOIN transactions_fts ON transactions_fts.rowid = transactions.id
+        WHERE transactions_fts MATCH ?
+        '''
+        params = [match]
+
+        if before_id is not None:
+            sql += ' AND transactions_fts.rowid < ?'
+            params.append(before_id)
+        if account_id is not None:
+            sql += ' AND transactions.account_id = ?'
+            params.append(account_id)
+        if transaction_type:
+            sql += ' AND transactions.type_id = ?'
+            params.append(self.type_id(transaction_type))
+        if date_range:
+            sql += ' AND transactions.date BETWEEN ? AND ?'
+            params.extend(date_range)
+
+        # Walking the index in rowid order lets LIMIT stop early instead of ranking every match
+        sql += ' ORDER BY transactions_fts.rowid DESC LIMIT ?'
+        params.append(limit)
+
+        cursor = self.read_cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    def _period_amounts_query(self, transaction_type, start_date, end_date, account_ids):
+        # (account_id, year_month, category_id, amount_cents) rows for the accounts. Whole months come from the
+        # rollup; only the partial months at either edge touch raw rows.
+        type_id = self.type_id(transaction_type)
+        accounts = ', '.join('?' * len(account_ids)) or 'NULL'
+        if not (start_date and end_date):
+            return f'''
+            SELECT account_id, year_month, category_id, total_cents AS amount_cents FROM monthly_rollup
+            WHERE account_id IN ({accounts}) AND type_id = ?
+            ''', [*account_ids, type_id]
+
+        months, edges = split_period(start_date, end_date)
+        parts = []
+        params = []
+
+        if months:
+            parts.append(f'''
+            SELECT account_id, year_month, category_id, total_cents AS amount_cents FROM monthly_rollup
+            WHERE account_id IN ({accounts}) AND type_id = ? AND year_month BETWEEN ? AND ?
+            ''')
+            params.extend([*account_ids, type_id, months[0], months[1]])
+
+        for edge_start, edge_end in edges:
+            parts.append(f'''
+            SELECT account_id, substr(date, 1, 7) AS year_month, category_id, amount_cents FROM transactions
+            WHERE account_id IN ({accounts}) AND type_id = ? AND date BETWEEN ? AND ?
+            ''')
+            params.extend([*account_ids, type_id, edge_start, edge_end])
+
+        return ' UNION ALL '.join(parts), params
+
+    def _converted_totals(self, key, join, amounts_query, params, account_ids, currency):
+        # {key: cents in currency} over a _period_amounts_query. Accounts already in the currency are summed by
+        # SQLite; the others per account and month, each converted at the month's closing rate.
+        native = [account_id for account_id in account_ids if self.accounts[account_id][1] == currency]
+        natives = ', '.join('?' * len(native)) or 'NULL'
+        cursor = self.read_cursor()
+        cursor.execute(f'''
+        SELECT {key}, CASE WHEN amounts.account_id IN ({natives}) THEN NULL ELSE amounts.account_id END,
+               CASE WHEN amounts.account_id IN ({natives}) THEN NULL ELSE amounts.year_month END,
+               SUM(amounts.amount_cents)
+        FROM ({amounts_query}) AS amounts {join}
+        GROUP BY 1, 2, 3
+        ''', native + native + params)
+
+        totals = {}
+        for group, account_id, year_month, cents in cursor.fetchall():
+            if account_id is not None:
+                cents *= self.exchange_rate(self.accounts[account_id][1], currency, month_close(year_month))
+            totals[group] = totals.get(group, 0) + cents
+        return totals
+
+    def get_category_totals(self, transaction_type, start_date=None, end_date=None, account_id=None):
+        # One account in its own currency, or with account_id=None every account in the base currency
+        return self.cache.get(('category_totals', transaction_type, start_date, end_date, account_id),
+                              (transaction_type,), start_date, end_date,
+                              lambda: self._category_totals(transaction_type, start_date, end_date, account_id),
+                              None if account_id is None else (account_id,))
+
+    def _category_totals(self, transaction_type, start_date, end_date, account_id):
+        account_ids, currency = self.account_scope(account_id)
+        amounts_query, params = self._period_amounts_query(transaction_type, start_date, end_date, account_ids)
+        totals = self._converted_totals('categories.name', 'JOIN categories ON categories.id = amounts.category_id',
+                                        amounts_query, params, account_ids, currency)
+        return [(category, round(total / 100, 2)) for category, total in sorted(totals.items())]
+
+    def get_total_amount_by_type(self, transaction_type, start_date=None, end_date=None, account_id=None):
+        return self.cache.get(('total_amount_by_type', transaction_type, start_date, end_date, account_id),
+                              (transaction_type,), start_date, end_date,
+                              lambda: self._total_amount_by_type(transaction_type, start_date, end_date, account_id),
+                              None if account_id is None else (account_id,))
+
+    def _total_amount_by_type(self, transaction_type, start_date, end_date, account_id):
+        account_ids, currency = self.account_scope(account_id)
+        amounts_query, params = self._period_amounts_query(transaction_type, start_date, end_date, account_ids)
+        result = self._converted_totals('NULL', '', amounts_query, params, account_ids, currency).get(None)
+        return round(result / 100, 2) if result else 0
+
+    def get_monthly_totals(self, start_month=None, end_month=None, account_id=None):
+        # Income and expense per 'YYYY-MM' in one grouped query; without a start month, from the first month with data
+        return self.cache.get(('monthly_totals', start_month, end_month, account_id), ("Income", "Expense"),
+                              start_month and start_month + '-01', end_month and end_month + '-31',
+                              lambda: self._monthly_totals(start_month, end_month, account_id),
+                              None if account_id is None else (account_id,))
+
+    def _monthly_totals(self, start_month, end_month, account_id):
+        cursor = self.read_cursor()
+        account_ids, currency = self.account_scope(account_id)
+        native = [account for account in account_ids if self.accounts[account][1] == currency]
+        type_names = {self.type_id("Income"): "Income", self.type_id("Expense"): "Expense"}
+        query = f'''
+        SELECT year_month, type_id, CASE WHEN account_id IN ({', '.join('?' * len(native)) or 'NULL'})
+                                         THEN NULL ELSE account_id END, SUM(total_cents)
+        FROM monthly_rollup
+        WHERE account_id IN ({', '.join('?' * len(account_ids)) or 'NULL'}) AND type_id IN (?, ?)
+        '''
+        params = native + account_ids + list(type_names)
+
+        if start_month:
+            query += ' AND year_month >= ?'
+            params.append(start_month)
+        if end_month:
+            query += ' AND year_month <= ?'
+            params.append(end_month)
+
+        query += ' GROUP BY 1, 2, 3'
+
+        cursor.execute(query, params)
+        totals = {}
+        for year_month, type_id, foreign_account, total_cents in cursor.fetchall():
+            if foreign_account is not None:
+                total_cents *= self.exchange_rate(self.accounts[foreign_account][1], currency, month_close(year_month))
+            month_totals = totals.setdefault(year_month, {})
+            month_totals[type_names[type_id]] = month_totals.get(type_names[type_id], 0) + total_cents
+
+        if not totals and not (start_month and end_month):
+            return []
+
+        # Zero-fill the months that have no transactions
+        first_month = start_month or min(totals)
+        last_month = end_month or max(totals)
+        monthly_totals = []
+        year_month = first_month
+        while year_month <= last_month:
+            month_totals = totals.get(year_month, {})
+            monthly_totals.append((year_month, round(month_totals.get("Income", 0) / 100, 2),
+                                   round(month_totals.get("Expense", 0) / 100, 2)))
+            year_month = shift_month(year_month, 1)
+        return monthly_totals
+
+    def _account_balances(self, cursor, account_ids, day, inclusive=True):
+        # {account_id: closing balance in cents} as of day, one seek per account into its prefix sums
+        balances = {}
+        for account_id in account_ids:
+            cursor.execute(f'''
+            SELECT balance_cents FROM daily_balance WHERE account_id = ? AND day {'<=' if inclusive else '<'} ?
+            ORDER BY day DESC LIMIT 1
+            ''', (account_id, day))
+            row = cursor.fetchone()
+            if row:
+                balances[account_id] = row[0]
+        return balances
+
+    def _held_value(self, held, currency, day):
+        # Cents held per currency, valued in currency at the day's rates
+        return round(sum(cents * self.exchange_rate(held_currency, currency, day)
+                         for held_currency, cents in held.items() if cents) / 100, 2)
+
+    def get_balance_at(self, date, account_id=None):
+        # Closing balance of a day: one seek into each account's prefix sums, however long the history
+        account_ids, currency = self.account_scope(account_id)
+        held = {}
+        for account, cents in self._account_balances(self.read_cursor(), account_ids, date).items():
+            held[self.accounts[account][1]] = held.get(self.accounts[account][1], 0) + cents
+        return self._held_value(held, currency, date)
+
+    def get_daily_balances(self, start_date=None, end_date=None, account_id=None):
+        # (day, balance) at the close of every day with transactions, opening with the balance carried into
+        # start_date; every earlier write moves these, so only the end of the range limits invalidation
+        return self.cache.get(('daily_balances', start_date, end_date, account_id), ("Income", "Expense"),
+                              None, end_date, lambda: self._daily_balances(start_date, end_date, account_id),
+                              None if account_id is None else (account_id,))
+
+    def _daily_balances(self, start_date, end_date, account_id):
+        cursor = self.read_cursor()
+        account_ids, currency = self.account_scope(account_id)
+        if account_id is not None:
+            query = 'SELECT day, balance_cents / 100.0 FROM daily_balance WHERE account_id = ? AND day >= ?'
+            params = [account_id, start_date or '']
+            if end_date:
+                query += ' AND day <= ?'
+                params.append(end_date)
+            cursor.execute(query + ' ORDER BY day', params)
+            balances = cursor.fetchall()
+            if start_date and (not balances or balances[0][0] != start_date):
+                balances.insert(0, (start_date, self.get_balance_at(start_date, account_id)))
+            return balances
+
+        # Every account's closing balances merged by day; each day values what is held in each currency at
+        # that day's rate, so foreign balances are revalued as rates move
+        query = f'''
+        SELECT day, account_id, balance_cents FROM daily_balance
+        WHERE account_id IN ({', '.join('?' * len(account_ids)) or 'NULL'}) AND day >= ?
+        '''
+        params = account_ids + [start_date or '']
+        if end_date:
+            query += ' AND day <= ?'
+            params.append(end_date)
+        cursor.execute(query, params)
+        rows = sorted(cursor.fetchall())
+
+        latest = self._account_balances(cursor, account_ids, start_date, False) if start_date else {}
+        held = {}
+        for account, cents in latest.items():
+            held[self.accounts[account][1]] = held.get(self.accounts[account][1], 0) + cents
+
+        balances = []
+        if start_date and (not rows or rows[0][0] != start_date):
+            balances.append((start_date, self._held_value(held, currency, start_date)))
+        for day, day_rows in groupby(rows, key=lambda row: row[0]):
+            for _, account, cents in day_rows:
+                account_currency = self.accounts[account][1]
+                held[account_currency] = held.get(account_currency, 0) + cents - latest.get(account, 0)
+                latest[account] = cents
+            balances.append((day, self._held_value(held, currency, day)))
+        return balances
+
+    def delete_transaction(self, transaction_id):
+        return self.delete_transactions([transaction_id])
+
+    def _select_for_write(self, transaction_ids):
+        # Current rows for the ids, read on the writer so they match what the write is about to change
+        transactions = []
+        for start in range(0, len(transaction_ids), 500):
+            chunk = transaction_ids[start:start + 500]
+            self.cursor.execute(TRANSACTION_SELECT + f'''
+            WHERE transactions.id IN ({', '.join('?' * len(chunk))})
+            ''', chunk)
+            transactions.extend(self.cursor.fetchall())
+        return transactions
+
+    def delete_transactions(self, transaction_ids):
+        # Every id in one transaction and one change notification; returns how many rows were deleted
+        transaction_ids = list(transaction_ids)
+        with self.write_lock:
+            self.cursor.execute('BEGIN')
+            try:
+                transactions = self._select_for_write(transaction_ids)
+                trigger = self.drop_balance_trigger('DELETE')
+                self.cursor.executemany('''
+                DELETE FROM transactions WHERE id = ?
+                ''', [(transaction[0],) for transaction in transactions])
+                self.shift_daily_balances(removed=transactions)
+                if trigger:
+                    self.cursor.execute(trigger)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+        if transactions:
+            self.notify(Change.from_rows('delete', transactions))
+        return len(transactions)
+
+    def update_transactions(self, transaction_ids, category=None, date=None, account_id=None):
+        # Re-assign the category, date and/or account of every id in one transaction; returns how many rows changed.
+        # A category has to be an existing one of each row's type.
+        transaction_ids = list(transaction_ids)
+        # Only the columns being changed are SET, so the triggers on the others stay quiet
+        assignments = []
+        if category:
+            assignments.append('category_id = ?')
+        if account_id is not None:
+            assignments.append('account_id = ?')
+        if date:
+            # A row moved off its scheduled day stops being that occurrence, which keeps (rule_id, date) unique
+            assignments.append('rule_id = CASE WHEN date = ? THEN rule_id END, date = ?')
+        with self.write_lock:
+            self.cursor.execute('BEGIN')
+            try:
+                old_transactions = self._select_for_write(transaction_ids)
+                new_transactions = []
+                updates = []
+                for (transaction_id, transaction_type, old_category, amount, old_date, description,
+                     old_account_id) in old_transactions:
+                    new_category = category or old_category
+                    new_date = date or old_date
+                    new_account_id = old_account_id if account_id is None else account_id
+                    values = []
+                    if category:
+                        category_id = self.category_ids.get((self.type_ids[transaction_type], category))
+                        if category_id is None:
+                            raise ValueError(f"{transaction_type} has no category {category!r}")
+                        values.append(category_id)
+                    if account_id is not None:
+                        values.append(account_id)
+                    if date:
+                        values.extend((date, date))
+                    updates.append((*values, transaction_id))
+                    new_transactions.append(
+                        (transaction_id, transaction_type, new_category, amount, new_date, description, new_account_id))
+
+                # Only a new date or account moves balances
+                moves = bool(date) or account_id is not None
+                trigger = self.drop_balance_trigger('UPDATE') if moves else None
+                if assignments:
+                    self.cursor.executemany(f'''
+                    UPDATE transactions SET {', '.join(assignments)} WHERE id = ?
+                    ''', updates)
+                if moves:
+                    self.shift_daily_balances(removed=old_transactions, added=new_transactions)
+                if trigger:
+                    self.cursor.execute(trigger)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+        # Listeners see an edit as the old rows leaving and the new ones arriving
+        if old_transactions:
+            self.notify(Change.from_rows('delete', old_transactions))
+            self.notify(Change.from_rows('insert', new_transactions))
+        return len(old_transactions)
+
+    def add_recurring_rule(self, transaction_type, category, amount, frequency, start_date, end_date=None,
+                           description="", every=1, account_id=None):
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"unknown frequency {frequency!r}, expected one of: {', '.join(FREQUENCIES)}")
+        if every < 1:
+            raise ValueError("a rule has to repeat at least every 1 period")
+
+        next_date = next_occurrence(frequency, every, start_date, start_date, end_date)
+        account_id = DEFAULT_ACCOUNT_ID if account_id is None else account_id
+        with self.write_lock:
+            type_id, category_id = self.encode_category(transaction_type, category)
+            self.cursor.execute('''
+            INSERT INTO recurring_rules (type_id, category_id, amount_cents, description, frequency, every,
+                                         start_date, end_date, next_date, account_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (type_id, category_id, round(amount * 100), description, frequency, every, start_date, end_date,
+                  next_date, account_id))
+            self.conn.commit()
+            return self.cursor.lastrowid
+
+    def get_recurring_rules(self):
+        # (id, type, category, amount, frequency, every, start_date, end_date, next_date, description, account_id)
+        cursor = self.read_cursor()
+        cursor.execute('''
+        SELECT recurring_rules.id, types.name, categories.name, recurring_rules.amount_cents / 100.0,
+               recurring_rules.frequency, recurring_rules.every, recurring_rules.start_date,
+               recurring_rules.end_date, recurring_rules.next_date, recurring_rules.description,
+               recurring_rules.account_id
+        FROM recurring_rules
+        JOIN types ON types.id = recurring_rules.type_id
+        JOIN categories ON categories.id = recurring_rules.category_id
+        ORDER BY recurring_rules.id
+        ''')
+        return cursor.fetchall()
+
+    def delete_recurring_rule(self, rule_id):
+        # Transactions the rule already booked stay; only future occurrences are dropped
+        with self.write_lock:
+            self.cursor.execute('DELETE FROM recurring_rules WHERE id = ?', (rule_id,))
+            self.conn.commit()
+            return self.cursor.rowcount
+
+    def run_recurring_rules(self, today=None):
+        # Book every occurrence due up to today in one transaction; returns how many transactions were added
+        today = today or datetime.now().strftime('%Y-%m-%d')
+        tomorrow = (datetime.strptime(today, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+        with self.write_lock:
+            self.cursor.execute('BEGIN')
+            try:
+                self.cursor.execute('''
+                SELECT id, type_id, category_id, amount_cents, description, frequency, every, start_date, end_date,
+                       next_date, account_id
+                FROM recurring_rules WHERE next_date <= ?
+                ''', (today,))
+                rules = self.cursor.fetchall()
+
+                rows = []
+                advances = []
+                dates = {}  # Rules tend to share days, so each ISO string is only built once
+                for (rule_id, type_id, category_id, amount_cents, description, frequency, every, start_date,
+                     end_date, next_date, account_id) in rules:
+                    last_date = min(today, end_date) if end_date else today
+                    rows.extend((type_id, category_id, amount_cents, day, description, rule_id, account_id)
+                                for day in occurrences(frequency, every, start_date, next_date, last_date, dates))
+                    advances.append((next_occurrence(frequency, every, start_date, tomorrow, end_date), rule_id))
+
+                transactions = []
+                if rows:
+                    self.cursor.execute('SELECT COALESCE(MAX(id), 0) FROM transactions')
+                    first_id = self.cursor.fetchone()[0] + 1
+
+                    # Occurrences another run already booked hit the (rule_id, date) index and are skipped
+                    triggers = self.drop_insert_triggers()
+                    self.cursor.executemany('''
+                    INSERT OR IGNORE INTO transactions (type_id, category_id, amount_cents, date, description, rule_id,
+                                                        account_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', rows)
+                    self.refresh_derived_tables(first_id)
+                    for sql in triggers:
+                        self.cursor.execute(sql)
+
+                    self.cursor.execute(TRANSACTION_SELECT + '''
+                    WHERE transactions.id >= ?
+                    ''', (first_id,))
+                    transactions = self.cursor.fetchall()
+
+                self.cursor.executemany('UPDATE recurring_rules SET next_date = ? WHERE id = ?', advances)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+        if transactions:
+            self.notify(Change.from_rows('insert', transactions))
+        return len(transactions)
+
+    def add_budget(self, category, limit, period="monthly", account_id=None, alert_at=0.8):
+        # alert_at is the share of the limit that raises the first alert; reaching the limit raises the second
+        if period not in BUDGET_PERIODS:
+            raise ValueError(f"unknown period {period!r}, expected one of: {', '.join(BUDGET_PERIODS)}")
+        if limit <= 0:
+            raise ValueError("a budget limit has to be greater than zero")
+        if not 0 < alert_at <= 1:
+            raise ValueError("the alert threshold has to be above 0% and at most 100% of the limit")
+
+        with self.write_lock:
+            _, category_id = self.encode_category("Expense", category)
+            self.cursor.execute('''
+            INSERT INTO budgets (category_id, period, limit_cents, alert_at, account_id) VALUES (?, ?, ?, ?, ?)
+            ''', (category_id, period, round(limit * 100), alert_at, account_id))
+            self.conn.commit()
+            return self.cursor.lastrowid
+
+    def get_budgets(self):
+        # (id, category, period, limit, alert_at, account_id), account_id None for a budget over every account
+        cursor = self.read_cursor()
+        cursor.execute('''
+        SELECT budgets.id, categories.name, budgets.period, budgets.limit_cents / 100.0, budgets.alert_at,
+               budgets.account_id
+        FROM budgets JOIN categories ON categories.id = budgets.category_id
+        ORDER BY budgets.id
+        ''')
+        return cursor.fetchall()
+
+    def delete_budget(self, budget_id):
+        with self.write_lock:
+            self.cursor.execute('DELETE FROM budgets WHERE id = ?', (budget_id,))
+            self.conn.commit()
+            return self.cursor.rowcount
+
+    def get_setting(self, name, default=None):
+        cursor = self.read_cursor()
+        cursor.execute('SELECT value FROM settings WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        return default if row is None else row[0]
+
+    def set_setting(self, name, value):
+        with self.write_lock:
+            self.cursor.execute('INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)', (name, value))
+            self.conn.commit()
+
+    def add_currency(self, code, symbol=None):
+        # call with write_lock held; an ISO 4217 code the ledger hasn't seen yet is added without a symbol
+        code = code.upper()
+        if not re.fullmatch(r'[A-Z]{3}', code):
+            raise ValueError(f"invalid currency {code!r}, expected a three-letter ISO code such as USD")
+        if code not in self.currency_symbols:
+            self.cursor.execute('INSERT OR IGNORE INTO currencies (code, symbol) VALUES (?, ?)', (code, symbol))
+            self.currency_symbols[code] = symbol
+        return code
+
+    def add_account(self, name, currency=None):
+        name = name.strip()
+        if not name:
+            raise ValueError("an account needs a name")
+        if self.account_id(name) is not None:
+            raise ValueError(f"there is already an account called {name!r}")
+
+        with self.write_lock:
+            try:
+                currency = self.add_currency(currency or self.base_currency)
+                self.cursor.execute('INSERT INTO accounts (name, currency) VALUES (?, ?)', (name, currency))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                self.load_lookups()
+                raise
+            account_id = self.cursor.lastrowid
+            self.accounts[account_id] = (name, currency)
+        return account_id
+
+    def get_accounts(self):
+        # (id, name, currency) rows in the order the accounts were opened
+        cursor = self.read_cursor()
+        cursor.execute('SELECT id, name, currency FROM accounts ORDER BY id')
+        return cursor.fetchall()
+
+    def set_base_currency(self, currency):
+        # Totals over every account are reported in the base currency from now on
+        with self.write_lock:
+            try:
+                currency = self.add_currency(currency)
+                self.cursor.execute("UPDATE settings SET value = ? WHERE name = 'base_currency'", (currency,))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                self.load_lookups()
+                raise
+            self.base_currency = currency
+        self.notify(Change('rates', ("Income", "Expense"), '0001-01-01', '9999-12-31'))
+
+    def set_fx_rate(self, currency, quote, day, rate):
+        # One unit of currency buys rate units of quote from day on, until the pair's next rate
+        if rate <= 0:
+            raise ValueError("an exchange rate has to be greater than zero")
+        with self.write_lock:
+            try:
+                currency = self.add_currency(currency)
+                quote = self.add_currency(quote)
+                if currency == quote:
+                    raise ValueError("an exchange rate needs two different currencies")
+                self.cursor.execute('''
+                INSERT INTO fx_rates (currency, quote, day, rate) VALUES (?, ?, ?, ?)
+                ON CONFLICT (currency, quote, day) DO UPDATE SET rate = excluded.rate
+                ''', (currency, quote, day, rate))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                self.load_lookups()
+                raise
+            earliest = self.rates.set(currency, quote, day, rate)
+
+        # Converted totals move from the month the rate takes effect in; balances from its day. The pair's
+        # first rate also stands in for all history before it, so a new first rate moves everything.
+        start_date = '0001-01-01' if earliest else day[:7] + '-01'
+        self.notify(Change('rates', ("Income", "Expense"), start_date, '9999-12-31'))
+
+    def get_fx_rates(self, currency=None):
+        # (currency, quote, day, rate) rows, by pair and then day
+        cursor = self.read_cursor()
+        if currency:
+            cursor.execute('''
+            SELECT currency, quote, day, rate FROM fx_rates WHERE currency = ? ORDER BY quote, day
+            ''', (currency.upper(),))
+        else:
+            cursor.execute('SELECT currency, quote, day, rate FROM fx_rates ORDER BY currency, quote, day')
+        return cursor.fetchall()
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,84 @@
+import os
+import csv
+import json
+
+COLUMNS = ("id", "type", "category", "amount", "date", "description", "account", "currency")
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".json": "jsonl", ".parquet": "parquet"}
+
+
+def export_format(path):
+    # Guessed from the file extension, CSV when there is nothing to go on
+    return FORMATS.get(os.path.splitext(path)[1].lower(), "csv")
+
+
+def write_csv(chunks, export_file):
+    # Same header the importer reads, so an export can be imported again as it is
+    writer = csv.writer(export_file)
+    writer.writerow(COLUMNS)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield len(chunk)
+
+
+def write_jsonl(chunks, export_file):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    for chunk in chunks:
+        export_file.write("".join([encode(dict(zip(COLUMNS, row))) + "\n" for row in chunk]))
+        yield len(chunk)
+
+
+def write_parquet(chunks, path):
+    # pyarrow is optional and only needed here
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet export needs pyarrow (pip install pyarrow)") from None
+
+    schema = pa.schema([("id", pa.int64()), ("type", pa.string()), ("category", pa.string()),
+                        ("amount", pa.float64()), ("date", pa.date32()), ("description", pa.string()),
+                        ("account", pa.string()), ("currency", pa.string())])
+
+    # Each chunk becomes one row group, so only a chunk's worth of columns is ever held in memory
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            ids, types, categories, amounts, dates, descriptions, accounts, currencies = zip(*chunk)
+            writer.write_batch(pa.record_batch([
+                pa.array(ids, pa.int64()), pa.array(types, pa.string()), pa.array(categories, pa.string()),
+                pa.array(amounts, pa.float64()), pa.array(dates, pa.string()).cast(pa.date32()),
+                pa.array(descriptions, pa.string()), pa.array(accounts, pa.string()),
+                pa.array(currencies, pa.string()),
+            ], schema=schema))
+            yield len(chunk)
+
+
+def with_accounts(chunks, accounts):
+    # Swaps each row's account id for the account's name and currency, which is what a reader of the file needs
+    for chunk in chunks:
+        yield [(*row[:6], *accounts[row[6]]) for row in chunk]
+
+
+def export_transactions(db_manager, path, file_format=None, transaction_type=None, category=None,
+                        start_date=None, end_date=None, progress=None, chunk_size=10000, account_id=None):
+    # Streams matching transactions, oldest first, to a CSV, JSON Lines or Parquet file; returns the row count
+    file_format = file_format or export_format(path)
+    db_manager.load_lookups()  # Accounts opened through another connection
+    chunks = with_accounts(db_manager.iter_transactions(transaction_type, category, start_date, end_date, chunk_size,
+                                                        account_id), db_manager.accounts)
+
+    exported = 0
+    if file_format == "parquet":
+        for count in write_parquet(chunks, path):
+            exported += count
+            if progress:
+                progress(exported)
+        return exported
+
+    writer = write_csv if file_format == "csv" else write_jsonl
+    with open(path, "w", newline="", encoding="utf-8") as export_file:
+        for count in writer(chunks, export_file):
+            exported += count
+            if progress:
+                progress(exported)
+    return exported
@@ -0,0 +1,126 @@
+import re
+import csv
+import math
+from datetime import date
+from operator import itemgetter
+
+from database import MAX_AMOUNT, ExpenseCategories, IncomeCategories
+
+
+def read_csv_transactions(path):
+    # Yields (line, type, category, amount, date, description) from a CSV file with a header row
+    with open(path, newline='', encoding='utf-8-sig') as csv_file:
+        reader = csv.reader(csv_file)
+        header = [name.strip().lower() for name in next(reader, [])]
+        if "amount" not in header or "date" not in header:
+            raise ValueError(f"{path}: CSV needs at least 'amount' and 'date' columns")
+
+        # Missing columns read from one past the end of a padded record, which is always empty
+        width = len(header)
+        pick = itemgetter(*(header.index(name) if name in header else width
+                            for name in ("type", "category", "amount", "date", "description")))
+        padding = [""] * (width + 1)
+
+        for line, record in enumerate(reader, start=2):
+            if not record:
+                continue
+            if len(record) <= width:
+                record += padding[len(record):]
+            yield (line, *pick(record))
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)')
+
+
+def read_ofx_transactions(path):
+    # OFX statements carry no categories, so every row lands in "Other" and the sign decides the type
+    with open(path, encoding='latin-1') as ofx_file:
+        transaction = None
+        for line_number, line in enumerate(ofx_file, start=1):
+            for closing, tag, value in OFX_TAG.findall(line):
+                tag = tag.upper()
+                if tag == "STMTTRN":
+                    if not closing:
+                        transaction = {"line": line_number}
+                    elif transaction is not None:
+                        description = " - ".join(part for part in (transaction.get("NAME"), transaction.get("MEMO"))
+                                                 if part)
+                        posted = transaction.get("DTPOSTED", "")
+                        posted = f"{posted[0:4]}-{posted[4:6]}-{posted[6:8]}" if len(posted) >= 8 else posted
+                        yield (transaction["line"], "", "Other", transaction.get("TRNAMT", ""), posted, description)
+                        transaction = None
+                elif transaction is not None and not closing:
+                    transaction[tag] = value.strip()
+
+
+def read_transactions_file(path):
+    if path.lower().endswith(('.ofx', '.qfx')):
+        return read_ofx_transactions(path)
+    return read_csv_transactions(path)
+
+
+def validate_transactions(records, rejected):
+    # Normalizes raw records into insertable tuples; failures are appended to rejected as (line, reason)
+    categories = {
+        "Income": {category.lower(): category for category in IncomeCategories.get_all_categories()},
+        "Expense": {category.lower(): category for category in ExpenseCategories.get_all_categories()},
+    }
+    types = {"income": "Income", "expense": "Expense"}
+
+    # Exports repeat the same few types, categories and dates, so each distinct value is only checked once
+    resolved_categories = {}
+    resolved_dates = {}
+
+    for line, transaction_type, category, amount, transaction_date, description in records:
+        try:
+            amount = float(amount)
+        except ValueError:
+            rejected.append((line, f"invalid amount {amount!r}"))
+            continue
+        if not math.isfinite(amount) or abs(amount) > MAX_AMOUNT:
+            rejected.append((line, f"invalid amount {amount!r}"))
+            continue
+
+        # Without an explicit type, a signed amount tells income from expense
+        if not transaction_type:
+            transaction_type = "Expense" if amount < 0 else "Income"
+            amount = abs(amount)
+
+        if amount <= 0:
+            rejected.append((line, "amount must be greater than zero"))
+            continue
+
+        key = (transaction_type, category)
+        resolved = resolved_categories.get(key)
+        if resolved is None:
+            canonical_type = types.get(transaction_type.strip().lower())
+            if canonical_type is None:
+                resolved = (None, "type must be Income or Expense")
+            elif category.strip().lower() not in categories[canonical_type]:
+                resolved = (None, f"unknown {canonical_type.lower()} category")
+            else:
+                resolved = (canonical_type, categories[canonical_type][category.strip().lower()])
+            resolved_categories[key] = resolved
+        if resolved[0] is None:
+            rejected.append((line, resolved[1]))
+            continue
+
+        iso_date = resolved_dates.get(transaction_date)
+        if iso_date is None:
+            try:
+                iso_date = date.fromisoformat(transaction_date.strip()).isoformat()
+            except ValueError:
+                rejected.append((line, f"invalid date {transaction_date!r}"))
+                continue
+            resolved_dates[transaction_date] = iso_date
+
+        yield resolved[0], resolved[1], amount, iso_date, description
+
+
+def import_file(db_manager, path, progress=None, chunk_size=10000, account_id=None):
+    # Streams one CSV/OFX file into an account (the default one if None); returns (imported count, rejected
+    # (line, reason) list)
+    rejected = []
+    transactions = validate_transactions(read_transactions_file(path), rejected)
+    imported = db_manager.bulk_insert(transactions, chunk_size, progress, account_id)
+    return imported, rejected
@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from benchmark import generate_ledger
+from database import DatabaseManager
+from profiling import print_summary, summarize
+
+# (weight, path): mostly dashboard aggregates revalidated with If-None-Match, plus first pages and searches
+REQUESTS = [
+    (30, "/totals/categories?type=expense&start=2024-12-01&end=2024-12-31"),
+    (20, "/totals/monthly?start=2024-01&end=2024-12"),
+    (15, "/totals?type=income"),
+    (10, "/totals/categories?type=expense"),
+    (10, "/balances/daily?start=2024-10-01&end=2024-12-31"),
+    (10, "/transactions?limit=50"),
+    (5, "/search?q=coffee&limit=20"),
+]
+
+
+async def read_response(reader):
+    # (status, headers, body) of one HTTP/1.1 response, Content-Length or chunked
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("server closed the connection")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            body += chunk[:-2]
+        return status, headers, bytes(body)
+    return status, headers, await reader.readexactly(int(headers.get('content-length', 0)))
+
+
+async def client(port, deadline, rnd, timings, statuses, revalidate):
+    # One keep-alive connection sending requests back to back until the deadline
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    paths = [path for _, path in REQUESTS]
+    weights = [weight for weight, _ in REQUESTS]
+    etags = {}
+    try:
+        while time.perf_counter() < deadline:
+            path = rnd.choices(paths, weights)[0]
+            request = f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+            if revalidate and path in etags:
+                request += f"If-None-Match: {etags[path]}\r\n"
+            started = time.perf_counter()
+            writer.write((request + "\r\n").encode('latin-1'))
+            status, headers, _ = await read_response(reader)
+            timings.setdefault(path.split('?')[0], []).append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            if 'etag' in headers:
+                etags[path] = headers['etag']
+    finally:
+        writer.close()
+
+
+async def run_load(port, connections, seconds, seed, revalidate):
+    timings = {}
+    statuses = {}
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, deadline, random.Random(seed + number), timings, statuses, revalidate)
+                           for number in range(connections)))
+    return time.perf_counter() - started, timings, statuses
+
+
+def start_server(db_path, workers):
+    # The server runs in its own process so the clients don't compete with it for the GIL
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+         "--db", db_path, "--port", "0", "--workers", str(workers)],
+        stderr=subprocess.PIPE, text=True)
+    line = process.stderr.readline()
+    if not line.startswith("Serving"):
+        process.kill()
+        raise RuntimeError(f"server failed to start: {line}{process.stderr.read()}")
+    return process, int(line.rsplit(':', 1)[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the Money Tracker JSON API")
+    parser.add_argument("--db", help="database to serve (default: a generated ledger of --rows rows)")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--port", type=int, help="test a server that is already running on this port")
+    parser.add_argument("--workers", type=int, default=8, help="server query threads (default: %(default)s)")
+    parser.add_argument("--connections", type=int, default=32, help="concurrent clients (default: %(default)s)")
+    parser.add_argument("--seconds", type=float, default=10, help="test length (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-revalidate", action="store_true", help="never send If-None-Match")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    process = None
+    db_path = args.db
+    if args.port is None and db_path is None:
+        db_path = os.path.join(tempfile.gettempdir(), f"loadtest_{args.rows}.db")
+        if not os.path.exists(db_path):
+            db_manager = DatabaseManager(db_path)
+            db_manager.bulk_insert(generate_ledger(args.rows, args.seed))
+            db_manager.close()
+    try:
+        port = args.port
+        if port is None:
+            process, port = start_server(db_path, args.workers)
+        seconds, timings, statuses = asyncio.run(
+            run_load(port, args.connections, args.seconds, args.seed, not args.no_revalidate))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    requests = sum(statuses.values())
+    report = {
+        "requests": requests,
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(requests / seconds),
+        "connections": args.connections,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "endpoints": summarize(timings),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{requests:,} requests in {seconds:.1f}s over {args.connections} connections: "
+              f"{report['requests_per_second']:,} requests/s; statuses {report['statuses']}")
+        print_summary(report["endpoints"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
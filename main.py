@@ -1,307 +1,684 @@
 import sys
 import os
+import queue
 import sqlite3
-from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                             QPushButton, QLabel, QLineEdit, QComboBox, QTableWidget,
-                             QTableWidgetItem, QTabWidget, QDateEdit, QMessageBox,
-                             QFrame, QFormLayout, QHeaderView, QSplitter)
-from PyQt5.QtCore import Qt, QDate
+                             QPushButton, QLabel, QLineEdit, QComboBox, QTableView,
+                             QAbstractItemView, QTabWidget, QDateEdit, QMessageBox,
+                             QFrame, QFormLayout, QHeaderView, QSplitter, QAction,
+                             QFileDialog, QDockWidget, QTableWidget, QTableWidgetItem, QCheckBox, QSpinBox,
+                             QSystemTrayIcon, QStyle)
+from PyQt5.QtCore import Qt, QDate, QObject, QTimer, QAbstractTableModel, QModelIndex, QThread, pyqtSignal
 from PyQt5.QtGui import QColor, QFont, QIcon
 
+from budgets import OVER, BudgetMonitor
+from database import (BUDGET_PERIODS, DEFAULT_ACCOUNT_ID, Change, DatabaseManager, ExpenseCategories,
+                      IncomeCategories, MissingRateError)
+from importer import import_file
+from exporter import export_format, export_transactions
+from maintenance import MAINTENANCE_TASKS, SNAPSHOT_SUFFIX, MaintenanceService, SnapshotError, snapshot_directory
+from profiling import Profiler
+from recurring import FREQUENCIES
+
+# Due maintenance runs once nothing has been written for this long; the idle check repeats as often
+MAINTENANCE_IDLE_SECONDS = 5 * 60
+
+
+class TransactionTableModel(QAbstractTableModel):
+    HEADERS = ["ID", "Type", "Category", "Amount", "Date", "Description", "Account"]
+    PAGE_SIZE = 500
+    # At most this many pages keep their rows, so memory stays flat however far the table is scrolled
+    MAX_CACHED_PAGES = 20
+
+    def __init__(self, db_manager, query_executor, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.query_executor = query_executor
+        self.page_loaded = None  # Called on the GUI thread after each page comes in
+        self.search_text = ""
+        self.account_id = None  # None shows every account
+        self.generation = 0  # Bumped by reload so a page read for the old rows is dropped
+        self.reset_pages()
+
+    def reset_pages(self):
+        # Each page is [after, count, rows]: the count rows that follow the key after (None for the top) in the
+        # table's order. Evicted pages keep after and count with rows None and are read back by keyset when
+        # they come into view again.
+        self.pages = []
+        self.starts = []  # First row of each page
+        self.cached = OrderedDict()  # Indexes of the pages holding rows, least recently shown first
+        self.refetching = set()
+        self.row_count = 0
+        self.tail_after = None  # Key of the last row reached; the next page continues after it
+        self.has_more = True
+        self.loading = False  # The next page is being read on the query worker
+
+    def key(self, transaction):
+        # Search results run newest id first, everything else by (date, id) descending
+        return transaction[0] if self.search_text else (transaction[4], transaction[0])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        page_index, offset = self.locate(index.row())
+        rows = self.pages[page_index][2]
+        if rows is None:
+            self.refetch(page_index)  # Blank until the page is back
+            return None
+        self.cached.move_to_end(page_index)
+        transaction = rows[offset]
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            value = transaction[column]
+            if column == 3:
+                # Each row is shown in the currency of its own account
+                return self.db_manager.format_amount(value, self.db_manager.accounts[transaction[6]][1])
+            if column == 6:
+                return self.db_manager.accounts[value][0]
+            return str(value) if value is not None else ""
+
+        if role == Qt.BackgroundRole and column == 1:
+            if transaction[1] == "Income":
+                return QColor(200, 230, 200)  # Light green
+            return QColor(230, 200, 200)  # Light red
+
+        return None
+
+    def locate(self, row):
+        # (page index, offset in the page) of a table row
+        page_index = bisect_right(self.starts, row) - 1
+        return page_index, row - self.starts[page_index]
+
+    def recount(self):
+        # Page starts after a row was inserted or removed somewhere in the middle
+        self.starts = []
+        total = 0
+        for _, count, _ in self.pages:
+            self.starts.append(total)
+            total += count
+        self.row_count = total
+
+    def reader(self, after, limit):
+        # function(db_manager) reading the limit rows that follow after in the current view
+        search_text = self.search_text
+        account_id = self.account_id
+        if search_text:
+            return lambda db_manager: db_manager.search_transactions(
+                search_text, limit=limit, before_id=after, account_id=account_id)
+        return lambda db_manager: db_manager.get_transactions_page(limit, after, account_id)
+
+    def cache_page(self, page_index, rows):
+        self.pages[page_index][2] = rows
+        self.cached[page_index] = None
+        self.cached.move_to_end(page_index)
+        while len(self.cached) > self.MAX_CACHED_PAGES:
+            evicted, _ = self.cached.popitem(last=False)
+            self.pages[evicted][2] = None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        # The next page is read on the query worker, so scrolling never waits on the database
+        if parent.isValid() or self.loading:
+            return
+        self.loading = True
+        generation = self.generation
+        self.query_executor.submit(self, self.reader(self.tail_after, self.PAGE_SIZE),
+                                   lambda page: self.append_page(page, generation),
+                                   lambda message: self.page_failed(generation))
+
+    def page_failed(self, generation):
+        # The view asks for the page again the next time it needs rows
+        if generation == self.generation:
+            self.loading = False
+
+    def append_page(self, page, generation):
+        if generation != self.generation:
+            return
+        self.loading = False
+        self.has_more = len(page) == self.PAGE_SIZE
+        if page:
+            first = self.row_count
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self.pages.append([self.tail_after, len(page), None])
+            self.starts.append(first)
+            self.row_count += len(page)
+            self.cache_page(len(self.pages) - 1, page)
+            self.tail_after = self.key(page[-1])
+            self.endInsertRows()
+        if self.page_loaded:
+            self.page_loaded()
+
+    def refetch(self, page_index):
+        # An evicted page scrolled back into view: the same count of rows after the same key
+        if page_index in self.refetching:
+            return
+        self.refetching.add(page_index)
+        after, count, _ = self.pages[page_index]
+        generation = self.generation
+        self.query_executor.submit((self, page_index), self.reader(after, count),
+                                   lambda rows: self.page_refetched(page_index, rows, generation),
+                                   lambda message: self.refetching.discard(page_index))
+
+    def page_refetched(self, page_index, rows, generation):
+        if generation != self.generation:
+            return
+        self.refetching.discard(page_index)
+        if len(rows) != self.pages[page_index][1]:
+            # Written to by another process while evicted; the counts no longer line up with the rows
+            self.reload()
+            return
+        self.cache_page(page_index, rows)
+        first = self.starts[page_index]
+        self.dataChanged.emit(self.index(first, 0), self.index(first + len(rows) - 1, len(self.HEADERS) - 1))
+
+    def reload(self):
+        # Drop every page; the view pulls the first page back in through fetchMore
+        # A page still being read belongs to the old rows and is dropped when it arrives
+        self.beginResetModel()
+        self.reset_pages()
+        self.generation += 1
+        self.endResetModel()
+
+    def set_search(self, text):
+        self.search_text = text.strip()
+        self.reload()
+
+    def set_account(self, account_id):
+        self.account_id = account_id
+        self.reload()
+
+    def transaction(self, row):
+        # The row's transaction; a row on an evicted page is read back right away, as only user actions on a
+        # selection ask for those
+        page_index, offset = self.locate(row)
+        rows = self.pages[page_index][2]
+        if rows is None:
+            after, count, _ = self.pages[page_index]
+            rows = self.reader(after, count)(self.db_manager)
+            self.cache_page(page_index, rows)
+        return rows[offset]
+
+    def transaction_id(self, row):
+        return self.transaction(row)[0]
+
+    def page_for(self, key):
+        # Index of the page a key falls in, or None past the rows reached so far
+        if self.pages and not (self.has_more and key < self.tail_after):
+            for page_index in range(len(self.pages) - 1, -1, -1):
+                after = self.pages[page_index][0]
+                if after is None or after > key:
+                    return page_index
+        return None
+
+    def insert_transaction(self, transaction):
+        # Search results only change when the search is run again, and other accounts are not shown at all
+        if self.search_text or self.account_id not in (None, transaction[6]):
+            return
+
+        key = self.key(transaction)
+        if not self.pages and not self.has_more:
+            self.pages.append([None, 0, None])
+            self.cache_page(0, [])
+            self.starts.append(0)
+        page_index = self.page_for(key)
+        if page_index is None:
+            return  # Past the rows reached: it arrives with a later fetchMore instead
+
+        # Rows are ordered by key descending, so binary search a loaded page for the insertion point. On an
+        # evicted page the row only adds to the count; the page is read back whole when it is shown.
+        page = self.pages[page_index]
+        offset = 0
+        if page[2] is not None:
+            low, high = 0, len(page[2])
+            while low < high:
+                middle = (low + high) // 2
+                if self.key(page[2][middle]) > key:
+                    low = middle + 1
+                else:
+                    high = middle
+            offset = low
+
+        row = self.starts[page_index] + offset
+        self.beginInsertRows(QModelIndex(), row, row)
+        if page[2] is not None:
+            page[2].insert(offset, transaction)
+        page[1] += 1
+        if not self.has_more and page_index == len(self.pages) - 1 and key < self.tail_after:
+            self.tail_after = key
+        self.recount()
+        self.endInsertRows()
+
+    def remove_transaction(self, transaction):
+        # Returns False when the row may or may not be shown and only a reload can tell
+        if self.account_id not in (None, transaction[6]):
+            return True
+        page_index = self.page_for(self.key(transaction))
+        if page_index is None:
+            return True
+
+        page = self.pages[page_index]
+        if page[2] is None:
+            if self.search_text:
+                return False  # Whether it matched the search is only known to the evicted rows
+            offset = 0
+        else:
+            offset = next((offset for offset, shown in enumerate(page[2]) if shown[0] == transaction[0]), None)
+            if offset is None:
+                return True
+
+        row = self.starts[page_index] + offset
+        self.beginRemoveRows(QModelIndex(), row, row)
+        if page[2] is not None:
+            del page[2][offset]
+        page[1] -= 1
+        self.recount()
+        self.endRemoveRows()
+        return True
+
+    def apply_changes(self, changes):
+        # Small deletes and inserts are patched into their pages; a bulk load, a large burst of writes or an
+        # insert under a search is cheaper to page in again
+        inserts = [change for change in changes if change.kind == 'insert']
+        if any(change.rows is None for change in changes) or (inserts and self.search_text) or \
+                sum(len(change.rows) for change in changes) > self.PAGE_SIZE:
+            self.reload()
+            return
+
+        for change in changes:
+            for transaction in change.rows:
+                if change.kind == 'insert':
+                    self.insert_transaction(transaction)
+                elif not self.remove_transaction(transaction):
+                    self.reload()
+                    return
+
+
+class QueryWorker(QThread):
+    result_ready = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
 
-class ExpenseCategories:
-    FOOD = "Food"
-    TRANSPORT = "Transport"
-    ENTERTAINMENT = "Entertainment"
-    UTILITIES = "Utilities"
-    RENT = "Rent"
-    SHOPPING = "Shopping"
-    HEALTHCARE = "Healthcare"
-    EDUCATION = "Education"
-    OTHER = "Other"
-
-    @classmethod
-    def get_all_categories(cls):
-        return [cls.FOOD, cls.TRANSPORT, cls.ENTERTAINMENT, cls.UTILITIES,
-                cls.RENT, cls.SHOPPING, cls.HEALTHCARE, cls.EDUCATION, cls.OTHER]
-
-
-class IncomeCategories:
-    SALARY = "Salary"
-    FREELANCE = "Freelance"
-    INVESTMENT = "Investment"
-    GIFT = "Gift"
-    REFUND = "Refund"
-    OTHER = "Other"
-
-    @classmethod
-    def get_all_categories(cls):
-        return [cls.SALARY, cls.FREELANCE, cls.INVESTMENT, cls.GIFT, cls.REFUND, cls.OTHER]
-
-
-class DatabaseManager:
-    def __init__(self, db_path='money_tracker.db'):
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
-
-    def create_tables(self):
-        # Create transactions table
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT NOT NULL,
-            category TEXT NOT NULL,
-            amount REAL NOT NULL,
-            date TEXT NOT NULL,
-            description TEXT
-        )
-        ''')
-        self.conn.commit()
-
-    def add_transaction(self, transaction_type, category, amount, date, description=""):
-        self.cursor.execute('''
-        INSERT INTO transactions (type, category, amount, date, description)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (transaction_type, category, amount, date, description))
-        self.conn.commit()
-
-    def get_all_transactions(self):
-        self.cursor.execute('''
-        SELECT * FROM transactions ORDER BY date DESC
-        ''')
-        return self.cursor.fetchall()
-
-    def get_transactions_by_type(self, transaction_type):
-        self.cursor.execute('''
-        SELECT * FROM transactions WHERE type = ? ORDER BY date DESC
-        ''', (transaction_type,))
-        return self.cursor.fetchall()
-
-    def get_transactions_by_date_range(self, start_date, end_date):
-        self.cursor.execute('''
-        SELECT * FROM transactions WHERE date BETWEEN ? AND ? ORDER BY date DESC
-        ''', (start_date, end_date))
-        return self.cursor.fetchall()
-
-    def get_category_totals(self, transaction_type, start_date=None, end_date=None):
-        query = '''
-        SELECT category, SUM(amount) FROM transactions 
-        WHERE type = ?
-        '''
-        params = [transaction_type]
-
-        if start_date and end_date:
-            query += ' AND date BETWEEN ? AND ?'
-            params.extend([start_date, end_date])
-
-        query += ' GROUP BY category'
-
-        self.cursor.execute(query, params)
-        return self.cursor.fetchall()
-
-    def get_total_amount_by_type(self, transaction_type, start_date=None, end_date=None):
-        query = '''
-        SELECT SUM(amount) FROM transactions WHERE type = ?
-        '''
-        params = [transaction_type]
-
-        if start_date and end_date:
-            query += ' AND date BETWEEN ? AND ?'
-            params.extend([start_date, end_date])
-
-        self.cursor.execute(query, params)
-        result = self.cursor.fetchone()[0]
-        return result if result else 0
-
-    def delete_transaction(self, transaction_id):
-        self.cursor.execute('''
-        DELETE FROM transactions WHERE id = ?
-        ''', (transaction_id,))
-        self.conn.commit()
-
-    def close(self):
-        self.conn.close()
-
-
-class PieChartWidget(QWidget):
     def __init__(self, db_manager, parent=None):
         super().__init__(parent)
         self.db_manager = db_manager
-        self.layout = QVBoxLayout(self)
-
-        self.figure, self.ax = plt.subplots(figsize=(5, 4), dpi=100)
-        self.canvas = FigureCanvas(self.figure)
-        self.layout.addWidget(self.canvas)
-
-        # Period selection
-        period_layout = QHBoxLayout()
-        self.period_combo = QComboBox()
-        self.period_combo.addItems(["This Month", "Last Month", "This Week", "Last Week", "All Time"])
-        self.period_combo.currentIndexChanged.connect(self.update_chart)
-        period_layout.addWidget(QLabel("Period:"))
-        period_layout.addWidget(self.period_combo)
-        period_layout.addStretch()
-
-        self.layout.addLayout(period_layout)
-        self.update_chart()
-
-    def update_chart(self):
-        self.ax.clear()
-
-        # Get date range based on selected period
-        today = datetime.now().date()
-        period = self.period_combo.currentText()
-
-        if period == "This Month":
-            start_date = datetime(today.year, today.month, 1).strftime('%Y-%m-%d')
-            if today.month == 12:
-                end_date = datetime(today.year + 1, 1, 1) - timedelta(days=1)
-            else:
-                end_date = datetime(today.year, today.month + 1, 1) - timedelta(days=1)
-            end_date = end_date.strftime('%Y-%m-%d')
+        self.jobs = queue.Queue()
+        self.cancelled = set()
+        self.current_request = None
+        self.last_started = 0
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def submit(self, request_id, function):
+        self.jobs.put((request_id, function))
+
+    def cancel(self, request_id):
+        # Jobs run in request order, so anything at or below last_started has already been picked up
+        with self.lock:
+            if self.current_request == request_id:
+                self.cancelled.add(request_id)
+                self.connection.interrupt()  # Abort the statement that is running right now
+            elif request_id > self.last_started:
+                self.cancelled.add(request_id)
+
+    def stop(self):
+        self.jobs.put(None)
+
+    def run(self):
+        # Reads made from this thread go through its own pooled read connection
+        self.connection = self.db_manager.pool.reader()
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            request_id, function = job
+            with self.lock:
+                self.last_started = request_id
+                if request_id in self.cancelled:
+                    self.cancelled.discard(request_id)
+                    continue
+                self.current_request = request_id
 
-        elif period == "Last Month":
-            if today.month == 1:
-                start_date = datetime(today.year - 1, 12, 1)
-                end_date = datetime(today.year, 1, 1) - timedelta(days=1)
+            try:
+                result = function(self.db_manager)
+            except (sqlite3.Error, MissingRateError, ValueError) as error:
+                with self.lock:
+                    interrupted = request_id in self.cancelled
+                if not interrupted:
+                    self.failed.emit(request_id, str(error))
             else:
-                start_date = datetime(today.year, today.month - 1, 1)
-                end_date = datetime(today.year, today.month, 1) - timedelta(days=1)
-            start_date = start_date.strftime('%Y-%m-%d')
-            end_date = end_date.strftime('%Y-%m-%d')
-
-        elif period == "This Week":
-            start_date = (today - timedelta(days=today.weekday())).strftime('%Y-%m-%d')
-            end_date = today.strftime('%Y-%m-%d')
-
-        elif period == "Last Week":
-            start_date = (today - timedelta(days=today.weekday() + 7)).strftime('%Y-%m-%d')
-            end_date = (today - timedelta(days=today.weekday() + 1)).strftime('%Y-%m-%d')
-
-        else:  # All Time
-            start_date = None
-            end_date = None
-
-        # Get expense data
-        expense_data = self.db_manager.get_category_totals("Expense", start_date, end_date)
-
-        # Check if there's any data to display
-        if not expense_data:
-            self.ax.text(0.5, 0.5, "No expense data for this period",
-                         horizontalalignment='center', verticalalignment='center')
-            self.canvas.draw()
+                self.result_ready.emit(request_id, result)
+            finally:
+                with self.lock:
+                    self.current_request = None
+                    self.cancelled.discard(request_id)
+
+
+class QueryExecutor(QObject):
+    # Runs database reads off the GUI thread and hands results back to callbacks on the GUI thread
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.next_request_id = 0
+        self.latest_requests = {}
+        self.callbacks = {}
+
+        self.worker = QueryWorker(db_manager, self)
+        self.worker.result_ready.connect(self.deliver)
+        self.worker.failed.connect(self.deliver_failure)
+        self.worker.start()
+
+    def submit(self, key, function, callback, failed=None):
+        # function(db_manager) runs on the worker; a newer request with the same key makes older ones stale.
+        # failed(message), when given, runs on the GUI thread if function raises, as well as the failed signal.
+        self.next_request_id += 1
+        request_id = self.next_request_id
+
+        previous = self.latest_requests.get(key)
+        if previous is not None:
+            self.callbacks.pop(previous, None)
+            self.worker.cancel(previous)
+
+        self.latest_requests[key] = request_id
+        self.callbacks[request_id] = (key, callback, failed)
+        self.worker.submit(request_id, function)
+        return request_id
+
+    def deliver(self, request_id, result):
+        entry = self.callbacks.pop(request_id, None)
+        if entry is None:
+            return  # Superseded while it was running
+
+        key, callback, _ = entry
+        if self.latest_requests.get(key) == request_id:
+            del self.latest_requests[key]
+        callback(result)
+
+    def deliver_failure(self, request_id, message):
+        entry = self.callbacks.pop(request_id, None)
+        if entry is None:
             return
 
-        labels = [category for category, _ in expense_data]
-        amounts = [amount for _, amount in expense_data]
+        key, _, failed = entry
+        if self.latest_requests.get(key) == request_id:
+            del self.latest_requests[key]
+        self.failed.emit(message)
+        if failed:
+            failed(message)  # After the signal, so a more specific status message wins
 
-        # Create pie chart
-        self.ax.pie(amounts, labels=labels, autopct='%1.1f%%', startangle=90)
-        self.ax.set_title(f"Expense Distribution - {period}")
-        self.ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle
+    def shutdown(self):
+        self.worker.stop()
+        self.worker.wait()
 
-        self.canvas.draw()
 
+class RefreshScheduler(QObject):
+    # Collects database changes and refreshes each affected view once per event-loop pass
+    changed = pyqtSignal(object)
 
-class BarChartWidget(QWidget):
     def __init__(self, db_manager, parent=None):
         super().__init__(parent)
-        self.db_manager = db_manager
-        self.layout = QVBoxLayout(self)
-
-        self.figure, self.ax = plt.subplots(figsize=(5, 4), dpi=100)
-        self.canvas = FigureCanvas(self.figure)
-        self.layout.addWidget(self.canvas)
-
-        # Period selection
-        period_layout = QHBoxLayout()
-        self.period_combo = QComboBox()
-        self.period_combo.addItems(["Last 6 Months", "Last 12 Months"])
-        self.period_combo.currentIndexChanged.connect(self.update_chart)
-        period_layout.addWidget(QLabel("Period:"))
-        period_layout.addWidget(self.period_combo)
-        period_layout.addStretch()
-
-        self.layout.addLayout(period_layout)
-        self.update_chart()
-
-    def update_chart(self):
-        self.ax.clear()
-
-        # Get date range based on selected period
-        today = datetime.now().date()
-        months = 6 if self.period_combo.currentText() == "Last 6 Months" else 12
-
-        month_labels = []
-        income_data = []
-        expense_data = []
-
-        for i in range(months, 0, -1):
-            # Calculate month
-            if today.month - i + 1 <= 0:
-                year = today.year - 1
-                month = today.month - i + 1 + 12
-            else:
-                year = today.year
-                month = today.month - i + 1
+        self.views = {}
+        self.pending = []
+        self.dirty = {}
 
-            # Start of the month
-            start_date = datetime(year, month, 1).strftime('%Y-%m-%d')
+        # Queued through a signal, so writes on other threads are delivered on the GUI thread
+        self.changed.connect(self.queue_change)
+        db_manager.add_listener(self.changed.emit)
 
-            # End of the month
-            if month == 12:
-                end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
-            else:
-                end_date = datetime(year, month + 1, 1) - timedelta(days=1)
-            end_date = end_date.strftime('%Y-%m-%d')
+    def register(self, name, refresh, affected_by, is_visible):
+        # refresh(changes) brings the view up to date; hidden views are only marked dirty until shown
+        self.views[name] = (refresh, affected_by, is_visible)
 
-            # Add month label
-            month_name = datetime(year, month, 1).strftime('%b %y')
-            month_labels.append(month_name)
+    def queue_change(self, change):
+        self.pending.append(change)
+        if len(self.pending) == 1:
+            QTimer.singleShot(0, self.flush)
 
-            # Get income and expense for the month
-            income = self.db_manager.get_total_amount_by_type("Income", start_date, end_date)
-            expense = self.db_manager.get_total_amount_by_type("Expense", start_date, end_date)
+    def flush(self):
+        changes, self.pending = self.pending, []
+        for name, (refresh, affected_by, is_visible) in self.views.items():
+            affecting = [change for change in changes if affected_by(change)]
+            if affecting:
+                self.dirty.setdefault(name, []).extend(affecting)
+        self.refresh_visible()
 
-            income_data.append(income)
-            expense_data.append(expense)
+    def refresh_visible(self):
+        for name in list(self.dirty):
+            refresh, _, is_visible = self.views[name]
+            if is_visible():
+                refresh(self.dirty.pop(name))
 
-        # Set width of the bars
-        x = range(len(month_labels))
-        width = 0.35
 
-        # Plot bars
-        self.ax.bar([i - width / 2 for i in x], income_data, width, label='Income')
-        self.ax.bar([i + width / 2 for i in x], expense_data, width, label='Expense')
+class ImportCancelled(Exception):
+    pass
 
-        # Customize plot
-        self.ax.set_title(f"Income vs Expenses - {self.period_combo.currentText()}")
-        self.ax.set_xticks(x)
-        self.ax.set_xticklabels(month_labels)
-        self.ax.legend()
 
-        # Rotate x-axis labels for better readability
-        plt.setp(self.ax.get_xticklabels(), rotation=45)
+class ImportWorker(QThread):
+    progress = pyqtSignal(int)
+    changed = pyqtSignal(object)
+    completed = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
 
-        self.figure.tight_layout()
-        self.canvas.draw()
+    def __init__(self, db_path, paths, account_id, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.paths = paths
+        self.account_id = account_id
+        self.cancelled = False
+
+    def cancel(self):
+        # Stops at the next chunk; the file being loaded rolls back as a whole
+        self.cancelled = True
+
+    def report_progress(self, rows):
+        if self.cancelled:
+            raise ImportCancelled()
+        self.progress.emit(rows)
+
+    def run(self):
+        # SQLite connections belong to the thread that opened them, so the worker uses its own
+        db_manager = DatabaseManager(self.db_path)
+        db_manager.add_listener(self.changed.emit)
+        imported = 0
+        rejected = 0
+        try:
+            for path in self.paths:
+                if self.cancelled:
+                    return
+                count, errors = import_file(db_manager, path,
+                                            lambda rows: self.report_progress(imported + rows),
+                                            account_id=self.account_id)
+                imported += count
+                rejected += len(errors)
+        except ImportCancelled:
+            return
+        except (OSError, ValueError, OverflowError, sqlite3.Error) as error:
+            self.failed.emit(str(error))
+            return
+        finally:
+            db_manager.close()
+
+        self.completed.emit(imported, rejected)
+
+
+class ExportWorker(QThread):
+    progress = pyqtSignal(int)
+    completed = pyqtSignal(int, str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_path, path, filters, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.path = path
+        self.filters = filters
+
+    def run(self):
+        # Rows stream chunk by chunk from the worker's own connection, so the window stays responsive
+        db_manager = DatabaseManager(self.db_path)
+        try:
+            exported = export_transactions(db_manager, self.path, progress=self.progress.emit, **self.filters)
+        except (OSError, ValueError, sqlite3.Error) as error:
+            self.failed.emit(str(error))
+            return
+        finally:
+            db_manager.close()
+
+        self.completed.emit(exported, self.path)
+
+
+class MaintenanceWorker(QThread):
+    progress = pyqtSignal(str, int, int)
+    completed = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_path, action, argument=None, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.action = action  # 'run' with a list of tasks (None for the due ones), 'compact', or 'restore' a path
+        self.argument = argument
+
+    def run(self):
+        # Backups and vacuum steps read and write through the worker's own connections, a slice at a time,
+        # so neither the window nor its own writes wait for more than one step
+        db_manager = DatabaseManager(self.db_path)
+        service = MaintenanceService(db_manager)
+        try:
+            if self.action == 'run':
+                results = service.run(self.argument, self.progress.emit)
+            elif self.action == 'compact':
+                results = [('compact', service.compact())]
+            else:
+                results = [('restore', service.restore(self.argument))]
+        except (OSError, SnapshotError, sqlite3.Error) as error:
+            self.failed.emit(str(error))
+            return
+        finally:
+            db_manager.close()
+
+        self.completed.emit(results)
+
+
+class ProfilerDock(QDockWidget):
+    # Latency percentiles per profiled call, refreshed once a second while the dock is open
+    COLUMNS = ["Call", "Count", "p50 ms", "p95 ms", "p99 ms", "Max ms", "Rows"]
+
+    def __init__(self, profiler, db_manager, parent=None):
+        super().__init__("Profiler", parent)
+        self.profiler = profiler
+        self.db_manager = db_manager
+
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+
+        self.cache_label = QLabel()
+        layout.addWidget(self.cache_label)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(self.clear)
+        layout.addWidget(clear_btn)
+
+        self.setWidget(widget)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def clear(self):
+        self.profiler.clear()
+        self.refresh()
+
+    def refresh(self):
+        stats = self.db_manager.cache_stats()
+        self.cache_label.setText(f"Query cache: {stats['hit_rate']:.0%} hits "
+                                 f"({stats['hits']:,} of {stats['hits'] + stats['misses']:,}), "
+                                 f"{stats['size']} entries")
+
+        # The latest call of each name supplies its row count and the SQL shown as a tooltip
+        latest = {call['name']: call for call in self.profiler.recent_calls()}
+        summary = sorted(self.profiler.summary().items(), key=lambda item: -item[1]['total_ms'])
+
+        self.table.setRowCount(len(summary))
+        for row, (name, summary_stats) in enumerate(summary):
+            call = latest.get(name, {})
+            rows = call.get('rows')
+            values = [name, str(summary_stats['count']), f"{summary_stats['p50_ms']:.2f}",
+                      f"{summary_stats['p95_ms']:.2f}", f"{summary_stats['p99_ms']:.2f}",
+                      f"{summary_stats['max_ms']:.2f}", "" if rows is None else str(rows)]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                if call.get('sql'):
+                    item.setToolTip('\n\n'.join(call['sql']))
+                self.table.setItem(row, column, item)
 
 
 class MoneyTracker(QMainWindow):
-    def __init__(self):
+    # Budget alerts come from whichever thread wrote the transaction
+    budget_alert = pyqtSignal(object)
+
+    def __init__(self, db_path='money_tracker.db', profiler=None, startup=None):
         super().__init__()
-        self.db_manager = DatabaseManager()
+        self.profiler = profiler or Profiler()
+        self.startup = startup  # StartupTimer while --profile-startup is on
+        self.painted = False
+        self.db_manager = DatabaseManager(db_path)
+        self.mark_startup("open database")
+        self.query_executor = QueryExecutor(self.db_manager, self)
+        self.query_executor.failed.connect(lambda message: self.statusBar().showMessage(message, 5000))
+        self.refresh_scheduler = RefreshScheduler(self.db_manager, self)
+        self.account_id = None  # The account every view shows; None rolls them all up in the base currency
+
+        # Budget spend follows every write incrementally once the first load has run on the query worker
+        self.budget_monitor = BudgetMonitor(self.db_manager)
+        self.budget_monitor.add_listener(self.budget_alert.emit)
+        self.budget_alert.connect(self.show_budget_alert)
+        self.tray_icon = None
 
         self.init_ui()
+        self.mark_startup("build window")
 
     def init_ui(self):
         self.setWindowTitle("Money Tracker")
         self.setGeometry(100, 100, 1000, 700)
 
+        self.create_menu()
+
         # Create central widget and layout
         central_widget = QWidget()
         main_layout = QVBoxLayout(central_widget)
@@ -318,19 +695,115 @@ class MoneyTracker(QMainWindow):
         self.create_transactions_tab(transactions_layout)
         tabs.addTab(transactions_tab, "Transactions")
 
-        # Analytics tab
-        analytics_tab = QWidget()
-        analytics_layout = QVBoxLayout(analytics_tab)
-        self.create_analytics_tab(analytics_layout)
-        tabs.addTab(analytics_tab, "Analytics")
+        # Analytics tab; the charts are only built the first time the tab is opened
+        self.analytics_tab = QWidget()
+        self.analytics_layout = QVBoxLayout(self.analytics_tab)
+        self.analytics = None
+        self.charts = {}
+        tabs.addTab(self.analytics_tab, "Analytics")
+        tabs.currentChanged.connect(self.tab_changed)
+        self.tabs = tabs
 
         main_layout.addWidget(tabs)
 
         self.setCentralWidget(central_widget)
 
-        # Initialize data
+        # Profiling from the command line covers startup as well
+        self.profiler_dock = ProfilerDock(self.profiler, self.db_manager, self)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.profiler_dock)
+        self.profiler_dock.setFeatures(QDockWidget.DockWidgetMovable | QDockWidget.DockWidgetFloatable)
+        self.profiler_dock.setVisible(self.profiler.enabled)
+        self.instrument_views()
+
+        # The totals are read on the query worker; the table reads its first page once it is shown
+        self.transaction_model.page_loaded = lambda: self.mark_startup("first transactions page")
         self.update_dashboard()
-        self.update_transactions_table()
+
+        # From here on, views refresh themselves from database changes
+        self.refresh_scheduler.register(
+            "dashboard", lambda changes: self.update_dashboard(),
+            lambda change: change.affects(("Income", "Expense"), accounts=self.accounts()), lambda: True)
+        # Rows are shown in their own currency, so new rates leave the table as it is
+        self.refresh_scheduler.register(
+            "transactions", self.transaction_model.apply_changes,
+            lambda change: change.kind != 'rates', self.transaction_table.isVisible)
+
+        self.recurring_timer = QTimer(self)
+        self.recurring_timer.timeout.connect(self.run_recurring_rules)
+
+        # Snapshots, vacuum and planner statistics catch up in the background whenever the ledger is left alone
+        self.maintenance_worker = None
+        self.last_write = time.monotonic()
+        self.db_manager.add_listener(self.note_write)
+        self.maintenance_timer = QTimer(self)
+        self.maintenance_timer.timeout.connect(self.run_idle_maintenance)
+
+    def mark_startup(self, name):
+        if self.startup:
+            self.startup.mark(name)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            self.mark_startup("first paint")
+            QTimer.singleShot(0, self.start_background_work)
+
+    def start_background_work(self):
+        # Work the first frame doesn't need waits until the window is on screen, then runs on the query worker:
+        # the budget spend loads, and recurring transactions missed while the app was closed are booked
+        self.query_executor.submit("budgets", lambda db_manager: self.budget_monitor.reload(), lambda _: None)
+        self.run_recurring_rules()
+        self.recurring_timer.start(60 * 60 * 1000)
+        self.maintenance_timer.start(MAINTENANCE_IDLE_SECONDS * 1000)
+
+    def create_menu(self):
+        file_menu = self.menuBar().addMenu("File")
+
+        import_action = QAction("Import Transactions...", self)
+        import_action.triggered.connect(self.show_import_dialog)
+        file_menu.addAction(import_action)
+
+        export_action = QAction("Export Transactions...", self)
+        export_action.triggered.connect(self.show_export_dialog)
+        file_menu.addAction(export_action)
+
+        file_menu.addSeparator()
+
+        recurring_action = QAction("Recurring Transactions...", self)
+        recurring_action.triggered.connect(self.show_recurring_dialog)
+        file_menu.addAction(recurring_action)
+
+        budgets_action = QAction("Budgets...", self)
+        budgets_action.triggered.connect(self.show_budgets_dialog)
+        file_menu.addAction(budgets_action)
+
+        accounts_action = QAction("Accounts && Currencies...", self)
+        accounts_action.triggered.connect(self.show_accounts_dialog)
+        file_menu.addAction(accounts_action)
+
+        file_menu.addSeparator()
+
+        maintenance_menu = file_menu.addMenu("Maintenance")
+        for title, action, argument in (("Back Up Now", 'run', ['snapshot']),
+                                        ("Run All Maintenance Now", 'run', [task for task, _ in MAINTENANCE_TASKS]),
+                                        ("Compact Database", 'compact', None)):
+            menu_action = QAction(title, self)
+            menu_action.triggered.connect(lambda _, action=action, argument=argument:
+                                          self.start_maintenance(action, argument))
+            maintenance_menu.addAction(menu_action)
+
+        restore_action = QAction("Restore Snapshot...", self)
+        restore_action.triggered.connect(self.show_restore_dialog)
+        maintenance_menu.addAction(restore_action)
+
+        view_menu = self.menuBar().addMenu("View")
+
+        self.profiler_action = QAction("Profiler", self)
+        self.profiler_action.setCheckable(True)
+        self.profiler_action.setChecked(self.profiler.enabled)
+        self.profiler_action.toggled.connect(self.toggle_profiler)
+        view_menu.addAction(self.profiler_action)
 
     def create_dashboard(self, parent_layout):
         dashboard_frame = QFrame()
@@ -343,6 +816,16 @@ class MoneyTracker(QMainWindow):
         title_label.setAlignment(Qt.AlignCenter)
         dashboard_layout.addWidget(title_label)
 
+        # Account selector; every view follows it
+        account_layout = QHBoxLayout()
+        self.account_combo = QComboBox()
+        self.load_accounts()
+        self.account_combo.currentIndexChanged.connect(self.account_changed)
+        account_layout.addWidget(QLabel("Account:"))
+        account_layout.addWidget(self.account_combo)
+        account_layout.addStretch()
+        dashboard_layout.addLayout(account_layout)
+
         # Summary cards
         cards_layout = QHBoxLayout()
 
@@ -411,43 +894,158 @@ class MoneyTracker(QMainWindow):
         parent_layout.addWidget(dashboard_frame)
 
     def create_transactions_tab(self, parent_layout):
-        # Create transaction table
-        self.transaction_table = QTableWidget()
-        self.transaction_table.setColumnCount(6)
-        self.transaction_table.setHorizontalHeaderLabels(["ID", "Type", "Category", "Amount", "Date", "Description"])
+        # Search box; the query runs once typing pauses
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search descriptions and categories...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_input.textChanged.connect(lambda: self.search_timer.start())
+
+        # Create transaction table backed by a lazily paged model
+        self.transaction_model = TransactionTableModel(self.db_manager, self.query_executor, self)
+        self.transaction_table = QTableView()
+        self.transaction_table.setModel(self.transaction_model)
+        self.transaction_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.transaction_table.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.transaction_table.horizontalHeader().setSectionResizeMode(5, QHeaderView.Stretch)
+        self.transaction_table.hideColumn(0)  # Hide ID column
 
-        # Add delete button
-        delete_btn = QPushButton("Delete Selected Transaction")
-        delete_btn.clicked.connect(self.delete_selected_transaction)
+        # Add edit and delete buttons; both act on every selected row
+        buttons_layout = QHBoxLayout()
+
+        edit_btn = QPushButton("Edit Selected Transactions")
+        edit_btn.clicked.connect(self.show_bulk_edit_dialog)
+
+        delete_btn = QPushButton("Delete Selected Transactions")
+        delete_btn.clicked.connect(self.delete_selected_transactions)
+
+        buttons_layout.addWidget(edit_btn)
+        buttons_layout.addWidget(delete_btn)
+
+        self.search_timer.timeout.connect(lambda: self.transaction_model.set_search(self.search_input.text()))
 
+        parent_layout.addWidget(self.search_input)
         parent_layout.addWidget(self.transaction_table)
-        parent_layout.addWidget(delete_btn)
+        parent_layout.addLayout(buttons_layout)
 
     def create_analytics_tab(self, parent_layout):
+        # matplotlib and numpy are only imported here, so they stay out of startup until the tab is opened
+        from analytics import AnalyticsSnapshot
+        from charts import (BarChartWidget, BudgetChartWidget, CategoryHeatmapWidget, PieChartWidget,
+                            RunningBalanceChartWidget)
+
+        # The columnar snapshot behind the deeper charts; it fills in on the query worker on first use
+        self.analytics = AnalyticsSnapshot(self.db_manager)
+
         # Create a splitter for charts
-        splitter = QSplitter(Qt.Horizontal)
+        splitter = QSplitter(Qt.Vertical)
+        top_splitter = QSplitter(Qt.Horizontal)
+        bottom_splitter = QSplitter(Qt.Horizontal)
 
         # Add pie chart for expense categories
-        pie_chart = PieChartWidget(self.db_manager)
-        splitter.addWidget(pie_chart)
+        self.charts["pie_chart"] = PieChartWidget(self.query_executor)
+        top_splitter.addWidget(self.charts["pie_chart"])
 
         # Add bar chart for income vs expenses
-        bar_chart = BarChartWidget(self.db_manager)
-        splitter.addWidget(bar_chart)
+        self.charts["bar_chart"] = BarChartWidget(self.query_executor)
+        top_splitter.addWidget(self.charts["bar_chart"])
+
+        # Add running balance from the daily prefix sums and category heatmap from the snapshot
+        self.charts["balance_chart"] = RunningBalanceChartWidget(self.query_executor)
+        bottom_splitter.addWidget(self.charts["balance_chart"])
+
+        self.charts["heatmap_chart"] = CategoryHeatmapWidget(self.query_executor, self.analytics)
+        bottom_splitter.addWidget(self.charts["heatmap_chart"])
+
+        self.charts["budget_chart"] = BudgetChartWidget(self.query_executor, self.budget_monitor)
+        bottom_splitter.addWidget(self.charts["budget_chart"])
 
+        splitter.addWidget(top_splitter)
+        splitter.addWidget(bottom_splitter)
         parent_layout.addWidget(splitter)
 
+        for name, chart in self.charts.items():
+            chart.set_account(self.account_id)
+            self.refresh_scheduler.register(name, lambda changes, chart=chart: chart.update_chart(),
+                                            chart.affected_by, chart.isVisible)
+        self.instrument_views()
+
+    def accounts(self):
+        # The account filter for Change.affects
+        return None if self.account_id is None else (self.account_id,)
+
+    def load_accounts(self):
+        # Refill the selector after an account is opened, keeping the current choice
+        self.account_combo.blockSignals(True)
+        self.account_combo.clear()
+        self.account_combo.addItem(f"All Accounts ({self.db_manager.base_currency})", None)
+        for account_id, name, currency in self.db_manager.get_accounts():
+            self.account_combo.addItem(f"{name} ({currency})", account_id)
+        self.account_combo.setCurrentIndex(max(0, self.account_combo.findData(self.account_id)))
+        self.account_combo.blockSignals(False)
+
+    def account_combo_for(self, selected=None):
+        # A combo of every account for the dialogs, on the account the window shows or the default one
+        combo = QComboBox()
+        for account_id, name, currency in self.db_manager.get_accounts():
+            combo.addItem(f"{name} ({currency})", account_id)
+        combo.setCurrentIndex(max(0, combo.findData(selected or self.account_id or DEFAULT_ACCOUNT_ID)))
+        return combo
+
+    def account_changed(self):
+        # Every account has its own indexes and cached totals, so switching is a handful of indexed reads
+        self.account_id = self.account_combo.currentData()
+        self.update_dashboard()
+        self.transaction_table.setColumnHidden(6, self.account_id is not None)
+        self.transaction_model.set_account(self.account_id)
+        for chart in self.charts.values():
+            chart.set_account(self.account_id)
+
+    def tab_changed(self, index):
+        if self.tabs.widget(index) is self.analytics_tab and not self.charts:
+            self.create_analytics_tab(self.analytics_layout)
+        # Views that changed while hidden catch up as they come into view
+        QTimer.singleShot(0, self.refresh_scheduler.refresh_visible)
+
+    def toggle_profiler(self, checked):
+        # Instrumentation only exists while the profiler is on; turning it off restores the plain methods
+        if checked:
+            self.profiler.enable()
+            self.instrument_views()
+        else:
+            self.profiler.disable()
+        self.profiler_dock.setVisible(checked)
+
+    def instrument_views(self):
+        self.profiler.instrument_database(self.db_manager)
+        self.profiler.instrument(self, 'window', ['update_dashboard', 'show_dashboard_totals',
+                                                  'update_transactions_table'])
+        self.profiler.instrument(self.transaction_model, 'table', ['reload', 'fetchMore', 'apply_changes'])
+        self.profiler.instrument(self.budget_monitor, 'budgets', ['reload', 'status', 'apply_rows'])
+        if self.analytics is not None:
+            self.profiler.instrument(self.analytics, 'analytics', [
+                'refresh', 'category_totals', 'monthly_totals', 'running_balance', 'rolling_average',
+                'category_percentiles', 'category_month_matrix', 'year_over_year'])
+        for name, chart in self.charts.items():
+            self.profiler.instrument(chart, name, ['update_chart', 'refresh', 'draw_chart'])
+            self.profiler.instrument(chart.canvas, name + '.canvas', ['draw'])
+
     def show_add_income_dialog(self):
         dialog = QWidget()
         dialog.setWindowTitle("Add Income")
         dialog.setGeometry(300, 300, 400, 300)
         layout = QFormLayout(dialog)
 
-        # Amount input
+        # Account selection
+        account_combo = self.account_combo_for()
+        layout.addRow("Account:", account_combo)
+
+        # Amount input, in the currency of the account
         amount_input = QLineEdit()
         amount_input.setPlaceholderText("Enter amount")
-        layout.addRow("Amount ($):", amount_input)
+        layout.addRow("Amount:", amount_input)
 
         # Category selection
         category_combo = QComboBox()
@@ -479,9 +1077,8 @@ class MoneyTracker(QMainWindow):
                 date = date_picker.date().toString("yyyy-MM-dd")
                 description = description_input.text()
 
-                self.db_manager.add_transaction("Income", category, amount, date, description)
-                self.update_dashboard()
-                self.update_transactions_table()
+                self.db_manager.add_transaction("Income", category, amount, date, description,
+                                                account_combo.currentData())
                 dialog.close()
 
             except ValueError:
@@ -498,10 +1095,14 @@ class MoneyTracker(QMainWindow):
         dialog.setGeometry(300, 300, 400, 300)
         layout = QFormLayout(dialog)
 
-        # Amount input
+        # Account selection
+        account_combo = self.account_combo_for()
+        layout.addRow("Account:", account_combo)
+
+        # Amount input, in the currency of the account
         amount_input = QLineEdit()
         amount_input.setPlaceholderText("Enter amount")
-        layout.addRow("Amount ($):", amount_input)
+        layout.addRow("Amount:", amount_input)
 
         # Category selection
         category_combo = QComboBox()
@@ -533,9 +1134,8 @@ class MoneyTracker(QMainWindow):
                 date = date_picker.date().toString("yyyy-MM-dd")
                 description = description_input.text()
 
-                self.db_manager.add_transaction("Expense", category, amount, date, description)
-                self.update_dashboard()
-                self.update_transactions_table()
+                self.db_manager.add_transaction("Expense", category, amount, date, description,
+                                                account_combo.currentData())
                 dialog.close()
 
             except ValueError:
@@ -546,15 +1146,583 @@ class MoneyTracker(QMainWindow):
 
         dialog.show()
 
+    def show_import_dialog(self):
+        if getattr(self, 'import_worker', None) and self.import_worker.isRunning():
+            QMessageBox.information(self, "Import Running", "Please wait for the current import to finish.")
+            return
+
+        paths, _ = QFileDialog.getOpenFileNames(self, "Import Transactions", "",
+                                                "Bank exports (*.csv *.ofx *.qfx);;All files (*)")
+        if not paths:
+            return
+
+        # Bank files land in the account on screen, or the default one while every account is shown
+        self.import_worker = ImportWorker(self.db_manager.db_path, paths, self.account_id or DEFAULT_ACCOUNT_ID, self)
+        self.import_worker.changed.connect(self.db_manager.notify)
+        self.import_worker.progress.connect(
+            lambda rows: self.statusBar().showMessage(f"Importing... {rows:,} rows"))
+        self.import_worker.completed.connect(self.import_completed)
+        self.import_worker.failed.connect(self.import_failed)
+        self.import_worker.start()
+
+    def import_completed(self, imported, rejected):
+        self.statusBar().showMessage(f"Imported {imported:,} transactions", 5000)
+
+        message = f"Imported {imported:,} transactions."
+        if rejected:
+            message += f"\n{rejected:,} rows were skipped because they failed validation."
+        QMessageBox.information(self, "Import Complete", message)
+
+    def import_failed(self, message):
+        self.statusBar().clearMessage()
+        QMessageBox.warning(self, "Import Failed", message)
+
+    def show_export_dialog(self):
+        if getattr(self, 'export_worker', None) and self.export_worker.isRunning():
+            QMessageBox.information(self, "Export Running", "Please wait for the current export to finish.")
+            return
+
+        dialog = QWidget()
+        dialog.setWindowTitle("Export Transactions")
+        dialog.setGeometry(300, 300, 400, 200)
+        layout = QFormLayout(dialog)
+
+        # Type and category filters
+        type_combo = QComboBox()
+        type_combo.addItems(["All", "Income", "Expense"])
+        layout.addRow("Type:", type_combo)
+
+        category_combo = QComboBox()
+        layout.addRow("Category:", category_combo)
+
+        def update_categories():
+            transaction_type = type_combo.currentText()
+            categories = IncomeCategories.get_all_categories() if transaction_type == "Income" else \
+                ExpenseCategories.get_all_categories() if transaction_type == "Expense" else \
+                list(dict.fromkeys(ExpenseCategories.get_all_categories() + IncomeCategories.get_all_categories()))
+            category_combo.clear()
+            category_combo.addItem("All")
+            category_combo.addItems(categories)
+
+        type_combo.currentIndexChanged.connect(update_categories)
+        update_categories()
+
+        account_combo = self.account_combo_for()
+        account_combo.insertItem(0, "All", None)
+        account_combo.setCurrentIndex(max(0, account_combo.findData(self.account_id)))
+        layout.addRow("Account:", account_combo)
+
+        # Date range, only applied when ticked
+        range_check = QCheckBox("Only")
+        start_picker = QDateEdit(QDate.currentDate().addYears(-1))
+        end_picker = QDateEdit(QDate.currentDate())
+        for picker in (start_picker, end_picker):
+            picker.setCalendarPopup(True)
+            picker.setEnabled(False)
+            range_check.toggled.connect(picker.setEnabled)
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(range_check)
+        range_layout.addWidget(start_picker)
+        range_layout.addWidget(QLabel("to"))
+        range_layout.addWidget(end_picker)
+        layout.addRow("Dates:", range_layout)
+
+        # Export button
+        export_button = QPushButton("Export...")
+
+        def start_export():
+            path, selected_filter = QFileDialog.getSaveFileName(
+                dialog, "Export Transactions", "transactions.csv",
+                "CSV (*.csv);;JSON Lines (*.jsonl);;Parquet (*.parquet)")
+            if not path:
+                return
+            # Without an extension the chosen file type decides the format
+            file_format = export_format(path) if os.path.splitext(path)[1] else \
+                {"JSON Lines": "jsonl", "Parquet": "parquet"}.get(selected_filter.split(" (")[0], "csv")
+
+            filters = {
+                "file_format": file_format,
+                "transaction_type": type_combo.currentText() if type_combo.currentIndex() > 0 else None,
+                "category": category_combo.currentText() if category_combo.currentIndex() > 0 else None,
+                "start_date": start_picker.date().toString("yyyy-MM-dd") if range_check.isChecked() else None,
+                "end_date": end_picker.date().toString("yyyy-MM-dd") if range_check.isChecked() else None,
+                "account_id": account_combo.currentData(),
+            }
+            self.export_worker = ExportWorker(self.db_manager.db_path, path, filters, self)
+            self.export_worker.progress.connect(
+                lambda rows: self.statusBar().showMessage(f"Exporting... {rows:,} rows"))
+            self.export_worker.completed.connect(self.export_completed)
+            self.export_worker.failed.connect(self.export_failed)
+            self.export_worker.start()
+            dialog.close()
+
+        export_button.clicked.connect(start_export)
+        layout.addRow("", export_button)
+
+        dialog.show()
+
+    def export_completed(self, exported, path):
+        self.statusBar().showMessage(f"Exported {exported:,} transactions to {path}", 5000)
+
+    def export_failed(self, message):
+        self.statusBar().clearMessage()
+        QMessageBox.warning(self, "Export Failed", message)
+
+    def start_maintenance(self, action, argument=None, idle=False):
+        # Menu actions report back in a message box; the idle timer's runs only show in the status bar
+        if self.maintenance_worker and self.maintenance_worker.isRunning():
+            if not idle:
+                QMessageBox.information(self, "Maintenance Running", "Please wait for the current run to finish.")
+            return
+
+        self.maintenance_worker = MaintenanceWorker(self.db_manager.db_path, action, argument, self)
+        self.maintenance_worker.progress.connect(
+            lambda task, done, total: self.statusBar().showMessage(f"Maintenance: {task} {done * 100 // total}%"))
+        self.maintenance_worker.completed.connect(
+            lambda results: self.maintenance_completed(action, results, idle))
+        self.maintenance_worker.failed.connect(lambda message: self.maintenance_failed(message, idle))
+        self.maintenance_worker.start()
+
+    def run_idle_maintenance(self):
+        # Whatever is due runs once nothing has been written for a while
+        if time.monotonic() - self.last_write >= MAINTENANCE_IDLE_SECONDS:
+            self.start_maintenance('run', None, idle=True)
+
+    def note_write(self, change):
+        self.last_write = time.monotonic()
+
+    def maintenance_completed(self, action, results, idle):
+        if action == 'restore':
+            # The rows came in through the worker's connection; lookups and views start over from them
+            self.db_manager.load_lookups()
+            self.load_accounts()
+            self.db_manager.notify(Change('insert', ("Income", "Expense"), '0001-01-01', '9999-12-31'))
+
+        summary = "; ".join(f"{task}: {detail}" for task, detail in results)
+        if not results:
+            self.statusBar().clearMessage()
+        elif idle:
+            self.statusBar().showMessage(f"Maintenance: {summary}", 5000)
+        else:
+            self.statusBar().clearMessage()
+            QMessageBox.information(self, "Maintenance Complete",
+                                    "\n".join(f"{task.capitalize()}: {detail}" for task, detail in results))
+
+    def maintenance_failed(self, message, idle):
+        self.statusBar().showMessage(f"Maintenance failed: {message}", 5000)
+        if not idle:
+            QMessageBox.warning(self, "Maintenance Failed", message)
+
+    def show_restore_dialog(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Restore Snapshot", snapshot_directory(self.db_manager.db_path),
+                                              f"Snapshots (*{SNAPSHOT_SUFFIX})")
+        if not path:
+            return
+        answer = QMessageBox.question(
+            self, "Restore Snapshot",
+            f"Replace every transaction, account and setting with {os.path.basename(path)}?\n"
+            "The ledger as it is now is snapshotted first.")
+        if answer == QMessageBox.Yes:
+            self.start_maintenance('restore', path)
+
+    def run_recurring_rules(self):
+        # Catching up after a long break can book many rows, so it runs on the query worker, never the GUI thread
+        self.query_executor.submit(
+            "recurring", lambda db_manager: db_manager.run_recurring_rules(), self.recurring_rules_booked,
+            lambda message: self.statusBar().showMessage(f"Recurring transactions failed: {message}", 5000))
+
+    def recurring_rules_booked(self, booked):
+        if booked:
+            self.statusBar().showMessage(f"Booked {booked:,} recurring transactions", 5000)
+
+    def show_recurring_dialog(self):
+        dialog = QWidget()
+        dialog.setWindowTitle("Recurring Transactions")
+        dialog.setGeometry(300, 300, 700, 500)
+        layout = QVBoxLayout(dialog)
+
+        # Existing rules
+        columns = ["ID", "Account", "Type", "Category", "Amount", "Repeats", "Next", "Description"]
+        rules_table = QTableWidget(0, len(columns))
+        rules_table.setHorizontalHeaderLabels(columns)
+        rules_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        rules_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        rules_table.verticalHeader().hide()
+        rules_table.horizontalHeader().setSectionResizeMode(len(columns) - 1, QHeaderView.Stretch)
+        layout.addWidget(rules_table)
+
+        def load_rules():
+            rules = self.db_manager.get_recurring_rules()
+            rules_table.setRowCount(len(rules))
+            for row, (rule_id, transaction_type, category, amount, frequency, every, start_date, end_date,
+                      next_date, description, account_id) in enumerate(rules):
+                repeats = frequency if every == 1 else f"{frequency} (every {every})"
+                if end_date:
+                    repeats += f" until {end_date}"
+                account, currency = self.db_manager.accounts[account_id]
+                values = [str(rule_id), account, transaction_type, category,
+                          self.db_manager.format_amount(amount, currency), repeats, next_date or "Ended",
+                          description or ""]
+                for column, value in enumerate(values):
+                    rules_table.setItem(row, column, QTableWidgetItem(value))
+
+        delete_button = QPushButton("Delete Selected Rule")
+
+        def delete_rule():
+            rows = sorted({index.row() for index in rules_table.selectedIndexes()})
+            if not rows:
+                QMessageBox.warning(dialog, "No Selection", "Please select a rule to delete.")
+                return
+            for row in rows:
+                self.db_manager.delete_recurring_rule(int(rules_table.item(row, 0).text()))
+            load_rules()
+
+        delete_button.clicked.connect(delete_rule)
+        layout.addWidget(delete_button)
+
+        # New rule
+        form = QFormLayout()
+
+        account_combo = self.account_combo_for()
+        form.addRow("Account:", account_combo)
+
+        type_combo = QComboBox()
+        type_combo.addItems(["Expense", "Income"])
+        form.addRow("Type:", type_combo)
+
+        category_combo = QComboBox()
+        form.addRow("Category:", category_combo)
+
+        def update_categories():
+            category_class = IncomeCategories if type_combo.currentText() == "Income" else ExpenseCategories
+            category_combo.clear()
+            category_combo.addItems(category_class.get_all_categories())
+
+        type_combo.currentIndexChanged.connect(update_categories)
+        update_categories()
+
+        amount_input = QLineEdit()
+        amount_input.setPlaceholderText("Enter amount")
+        form.addRow("Amount:", amount_input)
+
+        frequency_combo = QComboBox()
+        frequency_combo.addItems(FREQUENCIES)
+        frequency_combo.setCurrentText("monthly")
+        every_spin = QSpinBox()
+        every_spin.setRange(1, 99)
+        every_spin.setPrefix("every ")
+        frequency_layout = QHBoxLayout()
+        frequency_layout.addWidget(frequency_combo)
+        frequency_layout.addWidget(every_spin)
+        form.addRow("Repeats:", frequency_layout)
+
+        start_picker = QDateEdit(QDate.currentDate())
+        start_picker.setCalendarPopup(True)
+        form.addRow("Starting:", start_picker)
+
+        # End date, only applied when ticked
+        end_check = QCheckBox("Until")
+        end_picker = QDateEdit(QDate.currentDate().addYears(1))
+        end_picker.setCalendarPopup(True)
+        end_picker.setEnabled(False)
+        end_check.toggled.connect(end_picker.setEnabled)
+        end_layout = QHBoxLayout()
+        end_layout.addWidget(end_check)
+        end_layout.addWidget(end_picker)
+        form.addRow("Ends:", end_layout)
+
+        description_input = QLineEdit()
+        description_input.setPlaceholderText("Enter description (optional)")
+        form.addRow("Description:", description_input)
+
+        add_button = QPushButton("Add Rule")
+
+        def add_rule():
+            try:
+                amount = float(amount_input.text())
+            except ValueError:
+                QMessageBox.warning(dialog, "Invalid Input", "Please enter a valid amount.")
+                return
+            if amount <= 0:
+                QMessageBox.warning(dialog, "Invalid Input", "Amount must be greater than zero.")
+                return
+
+            start_date = start_picker.date().toString("yyyy-MM-dd")
+            end_date = end_picker.date().toString("yyyy-MM-dd") if end_check.isChecked() else None
+            if end_date and end_date < start_date:
+                QMessageBox.warning(dialog, "Invalid Input", "The rule has to end after it starts.")
+                return
+
+            self.db_manager.add_recurring_rule(type_combo.currentText(), category_combo.currentText(), amount,
+                                               frequency_combo.currentText(), start_date, end_date,
+                                               description_input.text(), every_spin.value(),
+                                               account_combo.currentData())
+            # A rule starting in the past books its backlog straight away
+            self.run_recurring_rules()
+            amount_input.clear()
+            description_input.clear()
+            load_rules()
+
+        add_button.clicked.connect(add_rule)
+        form.addRow("", add_button)
+        layout.addLayout(form)
+
+        load_rules()
+        dialog.show()
+
+    def show_accounts_dialog(self):
+        dialog = QWidget()
+        dialog.setWindowTitle("Accounts & Currencies")
+        dialog.setGeometry(300, 300, 600, 600)
+        layout = QVBoxLayout(dialog)
+
+        # Accounts
+        accounts_table = QTableWidget(0, 3)
+        accounts_table.setHorizontalHeaderLabels(["ID", "Account", "Currency"])
+        accounts_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        accounts_table.verticalHeader().hide()
+        accounts_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(accounts_table)
+
+        account_form = QFormLayout()
+        name_input = QLineEdit()
+        name_input.setPlaceholderText("Enter account name")
+        account_form.addRow("Name:", name_input)
+        currency_combo = QComboBox()
+        currency_combo.setEditable(True)  # Any ISO code, not just the ones the ledger already knows
+        account_form.addRow("Currency:", currency_combo)
+        add_account_button = QPushButton("Open Account")
+        account_form.addRow("", add_account_button)
+        layout.addLayout(account_form)
+
+        # Exchange rates, each valid from its day until the pair's next one
+        rates_table = QTableWidget(0, 3)
+        rates_table.setHorizontalHeaderLabels(["Pair", "From", "Rate"])
+        rates_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        rates_table.verticalHeader().hide()
+        rates_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        layout.addWidget(rates_table)
+
+        rate_form = QFormLayout()
+        rate_currency_combo = QComboBox()
+        rate_currency_combo.setEditable(True)
+        rate_input = QLineEdit()
+        rate_label = QLabel()
+        rate_layout = QHBoxLayout()
+        rate_layout.addWidget(QLabel("1"))
+        rate_layout.addWidget(rate_currency_combo)
+        rate_layout.addWidget(QLabel("="))
+        rate_layout.addWidget(rate_input)
+        rate_layout.addWidget(rate_label)
+        rate_form.addRow("Rate:", rate_layout)
+        rate_date_picker = QDateEdit(QDate.currentDate())
+        rate_date_picker.setCalendarPopup(True)
+        rate_form.addRow("From:", rate_date_picker)
+        set_rate_button = QPushButton("Set Rate")
+        rate_form.addRow("", set_rate_button)
+
+        base_combo = QComboBox()
+        base_combo.setEditable(True)
+        base_button = QPushButton("Set Base Currency")
+        base_layout = QHBoxLayout()
+        base_layout.addWidget(base_combo)
+        base_layout.addWidget(base_button)
+        rate_form.addRow("Base currency:", base_layout)
+        layout.addLayout(rate_form)
+
+        def load():
+            accounts = self.db_manager.get_accounts()
+            accounts_table.setRowCount(len(accounts))
+            for row, values in enumerate(accounts):
+                for column, value in enumerate(values):
+                    accounts_table.setItem(row, column, QTableWidgetItem(str(value)))
+
+            rates = self.db_manager.get_fx_rates()
+            rates_table.setRowCount(len(rates))
+            for row, (currency, quote, day, rate) in enumerate(rates):
+                for column, value in enumerate([f"{currency}/{quote}", day, f"{rate:.6f}"]):
+                    rates_table.setItem(row, column, QTableWidgetItem(value))
+
+            currencies = sorted(self.db_manager.currency_symbols)
+            for combo in (currency_combo, rate_currency_combo, base_combo):
+                combo.clear()
+                combo.addItems(currencies)
+                combo.setCurrentText(self.db_manager.base_currency)
+            rate_label.setText(self.db_manager.base_currency)
+
+        def add_account():
+            try:
+                self.db_manager.add_account(name_input.text(), currency_combo.currentText())
+            except (ValueError, sqlite3.Error) as error:
+                QMessageBox.warning(dialog, "Invalid Input", str(error))
+                return
+            name_input.clear()
+            self.load_accounts()
+            load()
+
+        def set_rate():
+            try:
+                rate = float(rate_input.text())
+                self.db_manager.set_fx_rate(rate_currency_combo.currentText(), self.db_manager.base_currency,
+                                            rate_date_picker.date().toString("yyyy-MM-dd"), rate)
+            except ValueError as error:
+                QMessageBox.warning(dialog, "Invalid Input", str(error))
+                return
+            except sqlite3.Error as error:
+                QMessageBox.warning(dialog, "Rate Failed", str(error))
+                return
+            rate_input.clear()
+            load()
+
+        def set_base_currency():
+            try:
+                self.db_manager.set_base_currency(base_combo.currentText())
+            except (ValueError, sqlite3.Error) as error:
+                QMessageBox.warning(dialog, "Invalid Input", str(error))
+                return
+            self.load_accounts()
+            load()
+
+        add_account_button.clicked.connect(add_account)
+        set_rate_button.clicked.connect(set_rate)
+        base_button.clicked.connect(set_base_currency)
+
+        load()
+        dialog.show()
+
+    def show_budget_alert(self, status):
+        scope = self.db_manager.accounts[status.account_id][0] if status.account_id else "all accounts"
+        title = "Over Budget" if status.level == OVER else "Budget Warning"
+        message = (f"{status.category} ({status.period}, {scope}): "
+                   f"{self.db_manager.format_amount(status.spent, status.currency)} of "
+                   f"{self.db_manager.format_amount(status.limit, status.currency)} spent")
+        self.statusBar().showMessage(f"{title}: {message}", 10000)
+
+        # A desktop notification where there is a system tray; the status bar alone otherwise
+        if QSystemTrayIcon.isSystemTrayAvailable():
+            if self.tray_icon is None:
+                self.tray_icon = QSystemTrayIcon(self.style().standardIcon(QStyle.SP_MessageBoxWarning), self)
+                self.tray_icon.show()
+            icon = QSystemTrayIcon.Critical if status.level == OVER else QSystemTrayIcon.Warning
+            self.tray_icon.showMessage(title, message, icon, 10000)
+
+    def show_budgets_dialog(self):
+        dialog = QWidget()
+        dialog.setWindowTitle("Budgets")
+        dialog.setGeometry(300, 300, 700, 500)
+        layout = QVBoxLayout(dialog)
+
+        # Existing budgets with this period's spend
+        columns = ["ID", "Account", "Category", "Period", "Spent", "Limit", "Alert at"]
+        budgets_table = QTableWidget(0, len(columns))
+        budgets_table.setHorizontalHeaderLabels(columns)
+        budgets_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        budgets_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        budgets_table.verticalHeader().hide()
+        budgets_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        layout.addWidget(budgets_table)
+
+        def load_budgets():
+            budgets = self.budget_monitor.status()
+            budgets_table.setRowCount(len(budgets))
+            for row, status in enumerate(budgets):
+                account = self.db_manager.accounts[status.account_id][0] if status.account_id else "All accounts"
+                spent = "?" if status.spent is None else self.db_manager.format_amount(status.spent, status.currency)
+                values = [str(status.budget_id), account, status.category, status.period, spent,
+                          self.db_manager.format_amount(status.limit, status.currency), f"{status.alert_at:.0%}"]
+                for column, value in enumerate(values):
+                    item = QTableWidgetItem(value)
+                    if column == 4 and status.level:
+                        item.setBackground(QColor(230, 200, 200) if status.level == OVER else QColor(255, 236, 179))
+                    budgets_table.setItem(row, column, item)
+
+        def budgets_changed():
+            # Budget edits are not transaction writes, so the monitor and its chart are brought up to date here
+            self.budget_monitor.reload()
+            load_budgets()
+            if "budget_chart" in self.charts:
+                self.charts["budget_chart"].update_chart()
+
+        delete_button = QPushButton("Delete Selected Budget")
+
+        def delete_budget():
+            rows = sorted({index.row() for index in budgets_table.selectedIndexes()})
+            if not rows:
+                QMessageBox.warning(dialog, "No Selection", "Please select a budget to delete.")
+                return
+            for row in rows:
+                self.db_manager.delete_budget(int(budgets_table.item(row, 0).text()))
+            budgets_changed()
+
+        delete_button.clicked.connect(delete_budget)
+        layout.addWidget(delete_button)
+
+        # New budget
+        form = QFormLayout()
+
+        account_combo = self.account_combo_for()
+        account_combo.insertItem(0, f"All accounts ({self.db_manager.base_currency})", None)
+        account_combo.setCurrentIndex(max(0, account_combo.findData(self.account_id)))
+        form.addRow("Account:", account_combo)
+
+        category_combo = QComboBox()
+        category_combo.addItems(ExpenseCategories.get_all_categories())
+        form.addRow("Category:", category_combo)
+
+        period_combo = QComboBox()
+        period_combo.addItems(BUDGET_PERIODS)
+        period_combo.setCurrentText("monthly")
+        form.addRow("Period:", period_combo)
+
+        limit_input = QLineEdit()
+        limit_input.setPlaceholderText("Enter limit")
+        form.addRow("Limit:", limit_input)
+
+        alert_spin = QSpinBox()
+        alert_spin.setRange(1, 100)
+        alert_spin.setValue(80)
+        alert_spin.setSuffix("% of the limit")
+        form.addRow("Warn at:", alert_spin)
+
+        add_button = QPushButton("Add Budget")
+
+        def add_budget():
+            try:
+                limit = float(limit_input.text())
+            except ValueError:
+                QMessageBox.warning(dialog, "Invalid Input", "Please enter a valid limit.")
+                return
+            try:
+                self.db_manager.add_budget(category_combo.currentText(), limit, period_combo.currentText(),
+                                           account_combo.currentData(), alert_spin.value() / 100)
+            except ValueError as error:
+                QMessageBox.warning(dialog, "Invalid Input", str(error))
+                return
+            limit_input.clear()
+            budgets_changed()
+
+        add_button.clicked.connect(add_budget)
+        form.addRow("", add_button)
+        layout.addLayout(form)
+
+        load_budgets()
+        dialog.show()
+
     def update_dashboard(self):
-        # Get totals
-        total_income = self.db_manager.get_total_amount_by_type("Income")
-        total_expense = self.db_manager.get_total_amount_by_type("Expense")
+        # Get totals, in the account's own currency or the base currency across every account
+        account_id = self.account_id
+        self.query_executor.submit(
+            "dashboard", lambda db_manager: (db_manager.get_total_amount_by_type("Income", account_id=account_id),
+                                             db_manager.get_total_amount_by_type("Expense", account_id=account_id),
+                                             db_manager.account_scope(account_id)[1]),
+            lambda totals: self.show_dashboard_totals(*totals))
+
+    def show_dashboard_totals(self, total_income, total_expense, currency=None):
         net_balance = total_income - total_expense
 
         # Update labels
-        self.income_amount.setText(f"${total_income:.2f}")
-        self.expense_amount.setText(f"${total_expense:.2f}")
+        self.income_amount.setText(self.db_manager.format_amount(total_income, currency))
+        self.expense_amount.setText(self.db_manager.format_amount(total_expense, currency))
 
         # Set balance color based on value
         if net_balance >= 0:
@@ -562,69 +1730,144 @@ class MoneyTracker(QMainWindow):
         else:
             self.balance_amount.setStyleSheet("color: red;")
 
-        self.balance_amount.setText(f"${net_balance:.2f}")
+        self.balance_amount.setText(self.db_manager.format_amount(net_balance, currency))
+        self.mark_startup("dashboard totals")
 
     def update_transactions_table(self):
-        transactions = self.db_manager.get_all_transactions()
+        self.transaction_model.reload()
+
+    def selected_rows(self):
+        return sorted(index.row() for index in self.transaction_table.selectionModel().selectedRows())
 
-        self.transaction_table.setRowCount(len(transactions))
+    def show_bulk_edit_dialog(self):
+        rows = self.selected_rows()
+        if not rows:
+            QMessageBox.warning(self, "No Selection", "Please select the transactions to edit.")
+            return
 
-        for row, transaction in enumerate(transactions):
-            transaction_id, transaction_type, category, amount, date, description = transaction
+        transaction_ids = [self.transaction_model.transaction_id(row) for row in rows]
+        transaction_types = {self.transaction_model.transaction(row)[1] for row in rows}
 
-            # Set ID (hidden)
-            id_item = QTableWidgetItem(str(transaction_id))
-            self.transaction_table.setItem(row, 0, id_item)
+        # A mixed selection can only move to categories that both types have
+        categories = None
+        for transaction_type in transaction_types:
+            category_class = IncomeCategories if transaction_type == "Income" else ExpenseCategories
+            type_categories = category_class.get_all_categories()
+            categories = type_categories if categories is None else \
+                [category for category in categories if category in type_categories]
 
-            # Set type with color coding
-            type_item = QTableWidgetItem(transaction_type)
-            if transaction_type == "Income":
-                type_item.setBackground(QColor(200, 230, 200))  # Light green
-            else:
-                type_item.setBackground(QColor(230, 200, 200))  # Light red
-            self.transaction_table.setItem(row, 1, type_item)
+        dialog = QWidget()
+        dialog.setWindowTitle(f"Edit {len(rows):,} Transactions")
+        dialog.setGeometry(300, 300, 400, 200)
+        layout = QFormLayout(dialog)
 
-            # Set category
-            self.transaction_table.setItem(row, 2, QTableWidgetItem(category))
+        # Category selection
+        category_combo = QComboBox()
+        category_combo.addItem("(unchanged)")
+        category_combo.addItems(categories)
+        layout.addRow("Category:", category_combo)
 
-            # Set amount
-            amount_item = QTableWidgetItem(f"${amount:.2f}")
-            self.transaction_table.setItem(row, 3, amount_item)
+        # Date selection, only applied when ticked
+        date_check = QCheckBox("Move to")
+        date_picker = QDateEdit()
+        date_picker.setDate(QDate.currentDate())
+        date_picker.setCalendarPopup(True)
+        date_picker.setEnabled(False)
+        date_check.toggled.connect(date_picker.setEnabled)
+        date_layout = QHBoxLayout()
+        date_layout.addWidget(date_check)
+        date_layout.addWidget(date_picker)
+        layout.addRow("Date:", date_layout)
+
+        # Account selection; amounts move as they are, in the currency of the new account
+        account_combo = self.account_combo_for()
+        account_combo.insertItem(0, "(unchanged)", None)
+        account_combo.setCurrentIndex(0)
+        layout.addRow("Account:", account_combo)
+
+        # Apply button
+        apply_button = QPushButton("Apply")
+
+        def apply_edit():
+            category = category_combo.currentText() if category_combo.currentIndex() > 0 else None
+            date = date_picker.date().toString("yyyy-MM-dd") if date_check.isChecked() else None
+            account_id = account_combo.currentData()
+            if category is None and date is None and account_id is None:
+                QMessageBox.warning(dialog, "Nothing to Change", "Choose a new category, date or account.")
+                return
+
+            def edited(updated):
+                self.statusBar().showMessage(f"Updated {updated:,} transactions", 5000)
+                dialog.close()
 
-            # Set date
-            self.transaction_table.setItem(row, 4, QTableWidgetItem(date))
+            def edit_failed(message):
+                apply_button.setEnabled(True)
+                QMessageBox.warning(dialog, "Edit Failed", message)
 
-            # Set description
-            self.transaction_table.setItem(row, 5, QTableWidgetItem(description))
+            # A large batch takes a while to write, so it runs on the query worker; a key of its own means no
+            # later request can supersede it
+            apply_button.setEnabled(False)
+            self.query_executor.submit(
+                object(),
+                lambda db_manager: db_manager.update_transactions(transaction_ids, category, date, account_id),
+                edited, edit_failed)
 
-        self.transaction_table.hideColumn(0)  # Hide ID column
+        apply_button.clicked.connect(apply_edit)
+        layout.addRow("", apply_button)
 
-    def delete_selected_transaction(self):
-        selected_rows = self.transaction_table.selectedIndexes()
-        if not selected_rows:
+        dialog.show()
+
+    def delete_selected_transactions(self):
+        rows = self.selected_rows()
+        if not rows:
             QMessageBox.warning(self, "No Selection", "Please select a transaction to delete.")
             return
 
-        row = selected_rows[0].row()
-        transaction_id = int(self.transaction_table.item(row, 0).text())
+        transaction_ids = [self.transaction_model.transaction_id(row) for row in rows]
 
         # Ask for confirmation
-        reply = QMessageBox.question(self, "Confirm Deletion",
-                                     "Are you sure you want to delete this transaction?",
+        if len(transaction_ids) == 1:
+            question = "Are you sure you want to delete this transaction?"
+        else:
+            question = f"Are you sure you want to delete these {len(transaction_ids):,} transactions?"
+        reply = QMessageBox.question(self, "Confirm Deletion", question,
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
-            self.db_manager.delete_transaction(transaction_id)
-            self.update_dashboard()
-            self.update_transactions_table()
+            # One transaction and one change notification, so the views refresh once for the whole batch; written on
+            # the query worker like the bulk edit
+            self.query_executor.submit(
+                object(), lambda db_manager: db_manager.delete_transactions(transaction_ids),
+                lambda deleted: self.statusBar().showMessage(f"Deleted {deleted:,} transactions", 5000),
+                lambda message: self.statusBar().showMessage(f"Delete failed: {message}", 5000))
 
     def closeEvent(self, event):
+        import_worker = getattr(self, 'import_worker', None)
+        if import_worker:
+            import_worker.cancel()
+            import_worker.wait()
+        export_worker = getattr(self, 'export_worker', None)
+        if export_worker:
+            export_worker.wait()  # A half-written export file would look complete
+        if self.maintenance_worker:
+            self.maintenance_worker.wait()  # A snapshot or vacuum step finishes before the database closes
+        self.query_executor.shutdown()
+        self.budget_monitor.close()
+        self.profiler.disable()  # Writes the summary line to the trace file
         self.db_manager.close()
         event.accept()
 
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = MoneyTracker()
+def run(db_path='money_tracker.db', qt_args=(), profiler=None, startup=None):
+    app = QApplication(sys.argv[:1] + list(qt_args))
+    if startup:
+        startup.mark("QApplication")
+    window = MoneyTracker(db_path, profiler, startup)
     window.show()
-    sys.exit(app.exec_())
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    # python main.py takes the same options as the money-tracker command, which opens this window by default
+    from cli import main
+    sys.exit(main())
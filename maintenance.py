@@ -0,0 +1,286 @@
+import os
+import gzip
+import time
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+
+from database import Change
+
+# (task, how often it falls due); a task that has never run is always due
+MAINTENANCE_TASKS = [
+    ("optimize", timedelta(hours=6)),
+    ("vacuum", timedelta(days=1)),
+    ("snapshot", timedelta(days=1)),
+    ("analyze", timedelta(days=7)),
+]
+
+# Pages per step: the backup reads and the vacuum frees this many pages before letting writers back in
+BACKUP_STEP_PAGES = 1024
+VACUUM_STEP_PAGES = 256
+# Rows ANALYZE samples per index, which keeps it to a fraction of a second on any ledger
+ANALYSIS_LIMIT = 1000
+SNAPSHOT_SUFFIX = ".db.gz"
+DEFAULT_KEEP = 7
+
+
+class SnapshotError(RuntimeError):
+    # A snapshot that failed its integrity check, or that can't be read back at all
+    pass
+
+
+def snapshot_directory(db_path):
+    # Snapshots sit next to the ledger by default
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), "snapshots")
+
+
+def snapshot_stem(db_path):
+    # money_tracker.db -> money_tracker; an in-memory ledger's snapshots are named memory-...
+    return os.path.splitext(os.path.basename(db_path))[0].strip(':')
+
+
+def list_snapshots(directory, db_path):
+    # Snapshot paths of this ledger, newest first; the timestamp, down to the microsecond, in the name sorts them
+    prefix = snapshot_stem(db_path) + "-"
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith(SNAPSHOT_SUFFIX)]
+    return [os.path.join(directory, name) for name in sorted(names, reverse=True)]
+
+
+def check_integrity(connection):
+    # Raises SnapshotError with SQLite's first complaints unless the database checks out
+    problems = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+    if problems != ['ok']:
+        raise SnapshotError("integrity check failed: " + "; ".join(problems[:5]))
+
+
+def copy_database(source, path, pages=BACKUP_STEP_PAGES, progress=None):
+    # Online backup of source into a new file at path, a step of pages at a time. The source holds one read
+    # transaction throughout, so the copy is a consistent point in time and writers carry on under WAL
+    # instead of restarting the backup with every commit.
+    destination = sqlite3.connect(path)
+    try:
+        in_transaction = source.in_transaction
+        if not in_transaction:
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        try:
+            source.backup(destination, pages=pages,
+                          progress=None if progress is None else lambda status, remaining, total:
+                          progress(total - remaining, total))
+        finally:
+            if not in_transaction:
+                source.execute('COMMIT')
+        # A snapshot is a single self-contained file
+        destination.execute('PRAGMA journal_mode = DELETE')
+        check_integrity(destination)
+    finally:
+        destination.close()
+
+
+def compress(path, target):
+    # gzip path into target through a temporary name, so a half-written snapshot is never picked up
+    partial = target + ".partial"
+    with open(path, 'rb') as source, gzip.open(partial, 'wb', compresslevel=6) as compressed:
+        shutil.copyfileobj(source, compressed, 1024 * 1024)
+    os.replace(partial, target)
+
+
+def expand(path, target):
+    # Decompressing reads the whole file, so a truncated or corrupted snapshot fails its CRC here
+    try:
+        with gzip.open(path, 'rb') as compressed, open(target, 'wb') as expanded:
+            shutil.copyfileobj(compressed, expanded, 1024 * 1024)
+    except (OSError, EOFError) as error:
+        raise SnapshotError(f"{path} is not a readable snapshot: {error}") from error
+
+
+def verify_snapshot(path):
+    # Expands the snapshot to a scratch file and runs the integrity check on it; returns its transaction count
+    scratch = path + ".verify"
+    try:
+        expand(path, scratch)
+        connection = sqlite3.connect(scratch)
+        try:
+            try:
+                check_integrity(connection)
+                return connection.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+            except sqlite3.DatabaseError as error:
+                raise SnapshotError(f"{path} is not a Money Tracker database: {error}") from error
+        finally:
+            connection.close()
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+
+
+class MaintenanceService:
+    # Backups, compaction and planner statistics for one ledger. Every step is short: backups copy a slice of
+    # pages at a time from their own connection, and the vacuum frees a slice of pages per write transaction,
+    # so the app keeps reading and writing the whole way through.
+    def __init__(self, db_manager, directory=None, keep=DEFAULT_KEEP):
+        self.db_manager = db_manager
+        self.directory = directory or snapshot_directory(db_manager.db_path)
+        self.keep = keep
+
+    def last_run(self, task):
+        value = self.db_manager.get_setting(f"maintenance.{task}")
+        return None if value is None else datetime.fromisoformat(value)
+
+    def due_tasks(self, now=None):
+        now = now or datetime.now()
+        due = []
+        for task, interval in MAINTENANCE_TASKS:
+            last = self.last_run(task)
+            if last is None or now - last >= interval:
+                due.append(task)
+        return due
+
+    def run(self, tasks=None, progress=None):
+        # Runs tasks (default: whichever are due) in schedule order; returns [(task, what it did)].
+        # progress(task, done, total) follows the steps of each one.
+        tasks = self.due_tasks() if tasks is None else tasks
+        results = []
+        for task, _ in MAINTENANCE_TASKS:
+            if task not in tasks:
+                continue
+            step = None if progress is None else lambda done, total, task=task: progress(task, done, total)
+            detail = getattr(self, task)(progress=step)
+            self.db_manager.set_setting(f"maintenance.{task}", datetime.now().isoformat(timespec='seconds'))
+            results.append((task, detail))
+        return results
+
+    def optimize(self, progress=None):
+        # Lets SQLite refresh whatever statistics its recent queries showed to be stale
+        with self.db_manager.write_lock:
+            self.db_manager.cursor.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+            self.db_manager.cursor.execute('PRAGMA optimize')
+            self.db_manager.conn.commit()
+        return "planner statistics refreshed where needed"
+
+    def analyze(self, progress=None):
+        # Every index's statistics from scratch, sampled so the write lock is only held briefly
+        with self.db_manager.write_lock:
+            self.db_manager.cursor.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+            self.db_manager.cursor.execute('ANALYZE')
+            self.db_manager.conn.commit()
+        return "planner statistics rebuilt"
+
+    def space(self):
+        # (page_size, page_count, freelist_count, auto_vacuum) of the ledger file
+        cursor = self.db_manager.read_cursor()
+        return tuple(cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                     for name in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum'))
+
+    def vacuum(self, progress=None, pages=VACUUM_STEP_PAGES):
+        # Hands free pages back to the file system a step at a time; each step is its own short write
+        page_size, _, free_pages, auto_vacuum = self.space()
+        if auto_vacuum != 2:
+            return "skipped: the file predates incremental vacuum; run a full compaction once to enable it"
+
+        remaining = free_pages
+        while remaining:
+            with self.db_manager.write_lock:
+                self.db_manager.conn.commit()
+                # execute() would step the pragma once, which frees a single page; a script runs it to the end
+                self.db_manager.conn.executescript(f'PRAGMA incremental_vacuum({pages})')
+                self.db_manager.cursor.execute('PRAGMA freelist_count')
+                left = self.db_manager.cursor.fetchone()[0]
+            if left >= remaining:
+                break  # Nothing more to free
+            remaining = left
+            if progress:
+                progress(free_pages - remaining, free_pages)
+            time.sleep(0)  # Let a waiting writer in between steps
+        self.checkpoint()
+        return f"returned {(free_pages - remaining) * page_size / 1048576:.1f} MB of free pages"
+
+    def compact(self, progress=None):
+        # A full VACUUM rewrites the whole file in one write transaction. It is only run on request: it turns on
+        # incremental vacuum for files created before it existed, and defragments the rest.
+        page_size, pages_before, _, _ = self.space()
+        with self.db_manager.write_lock:
+            self.db_manager.conn.commit()
+            self.db_manager.cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            self.db_manager.cursor.execute('VACUUM')
+        self.checkpoint()
+        pages_after = self.space()[1]
+        return f"compacted {pages_before * page_size / 1048576:.1f} MB to {pages_after * page_size / 1048576:.1f} MB"
+
+    def checkpoint(self):
+        # Copies the WAL into the file, which is when the file itself shrinks; never waits on readers
+        with self.db_manager.write_lock:
+            self.db_manager.cursor.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+
+    def snapshot(self, progress=None, protect=None):
+        # Backs the ledger up to a new compressed snapshot and keeps only the newest self.keep of them, plus
+        # protect when given
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{snapshot_stem(self.db_manager.db_path)}-{datetime.now():%Y%m%d-%H%M%S-%f}{SNAPSHOT_SUFFIX}"
+        target = os.path.join(self.directory, name)
+        scratch = target + ".db"
+        try:
+            if self.db_manager.pool.shared:
+                # An in-memory ledger only exists on the writer connection
+                with self.db_manager.write_lock:
+                    copy_database(self.db_manager.conn, scratch, -1, progress)
+            else:
+                # Its own connection, so the read transaction the backup holds doesn't pin a pooled one
+                source = sqlite3.connect(self.db_manager.db_path, timeout=30, isolation_level=None)
+                try:
+                    copy_database(source, scratch, progress=progress)
+                finally:
+                    source.close()
+            compress(scratch, target)
+        finally:
+            if os.path.exists(scratch):
+                os.remove(scratch)
+
+        removed = self.rotate(protect)
+        size = os.path.getsize(target)
+        detail = f"wrote {os.path.basename(target)} ({size / 1048576:.1f} MB)"
+        if removed:
+            detail += f", removed {len(removed)} older"
+        return detail
+
+    def rotate(self, protect=None):
+        # Deletes all but the newest self.keep snapshots and protect; returns the paths it removed
+        protect = None if protect is None else os.path.abspath(protect)
+        removed = [path for path in list_snapshots(self.directory, self.db_manager.db_path)[self.keep:]
+                   if os.path.abspath(path) != protect]
+        for path in removed:
+            os.remove(path)
+        return removed
+
+    def restore(self, path, progress=None):
+        # Replaces the ledger's contents with a verified snapshot, after snapshotting what is there now.
+        # The copy goes through the backup API into the open writer, so other connections see the restored
+        # data on their next read instead of a file swapped out from under them.
+        scratch = path + ".restore"
+        try:
+            expand(path, scratch)
+            source = sqlite3.connect(scratch)
+            try:
+                try:
+                    check_integrity(source)
+                except sqlite3.DatabaseError as error:
+                    raise SnapshotError(f"{path} is not a Money Tracker database: {error}") from error
+                # The snapshot being restored survives this one's rotation even when it is the oldest kept
+                self.snapshot(protect=path)
+                with self.db_manager.write_lock:
+                    self.db_manager.conn.commit()
+                    source.backup(self.db_manager.conn, pages=BACKUP_STEP_PAGES,
+                                  progress=None if progress is None else lambda status, remaining, total:
+                                  progress(total - remaining, total))
+            finally:
+                source.close()
+        finally:
+            if os.path.exists(scratch):
+                os.remove(scratch)
+
+        # An older snapshot may predate some migrations; the restored rows also replace every cached lookup
+        self.db_manager.migrate()
+        self.db_manager.load_lookups()
+        self.db_manager.notify(Change('insert', ("Income", "Expense"), '0001-01-01', '9999-12-31'))
+        return f"restored {os.path.basename(path)}"
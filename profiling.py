@@ -0,0 +1,240 @@
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from collections import deque
+from functools import wraps
+
+# DatabaseManager plumbing that runs inside the profiled methods or is too small to be worth a record
+UNPROFILED_METHODS = {
+    'read_cursor', 'load_lookups', 'type_id', 'encode_category', 'add_listener', 'remove_listener',
+    'notify', 'invalidate', 'cache_stats', 'close', 'create_tables', 'migrate', 'account_id', 'account_scope',
+    'exchange_rate', 'convert', 'format_amount', 'add_currency',
+}
+
+# At most this many distinct statements are kept per call; executemany traces every row
+MAX_STATEMENTS = 20
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def summarize(samples):
+    # {name: [milliseconds, ...]} -> {name: {count, p50, p95, p99, max, total}}
+    summary = {}
+    for name, timings in samples.items():
+        ordered = sorted(timings)
+        summary[name] = {
+            'count': len(ordered),
+            'p50_ms': round(percentile(ordered, 0.50), 3),
+            'p95_ms': round(percentile(ordered, 0.95), 3),
+            'p99_ms': round(percentile(ordered, 0.99), 3),
+            'max_ms': round(ordered[-1], 3) if ordered else 0.0,
+            'total_ms': round(sum(ordered), 3),
+        }
+    return summary
+
+
+class Profiler:
+    # Opt-in call timing: methods are only wrapped while enabled, so a disabled profiler costs nothing
+    def __init__(self, trace_path=None, max_samples=10000, max_recent=500):
+        self.trace_path = trace_path
+        self.trace_file = None
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.max_samples = max_samples
+        self.samples = {}
+        self.recent = deque(maxlen=max_recent)
+        self.wrapped = []
+        self.pools = []
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        if self.trace_path:
+            self.trace_file = open(self.trace_path, 'a', encoding='utf-8')
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+
+        for target, name in self.wrapped:
+            # Dropping the instance attribute uncovers the class method again
+            target.__dict__.pop(name, None)
+        self.wrapped = []
+        for pool in self.pools:
+            pool.set_trace_callback(None)
+        self.pools = []
+
+        if self.trace_file:
+            self.write({'summary': self.summary()})
+            self.trace_file.close()
+            self.trace_file = None
+
+    def instrument(self, target, prefix, names=None):
+        # Time target's public methods (or just names) as '<prefix>.<method>'; does nothing while disabled
+        if not self.enabled:
+            return
+        if names is None:
+            names = [name for name, value in vars(type(target)).items()
+                     if callable(value) and not name.startswith('_') and name not in UNPROFILED_METHODS]
+        for name in names:
+            if name in target.__dict__:
+                continue  # Already instrumented
+            setattr(target, name, self.timed(f'{prefix}.{name}', getattr(target, name)))
+            self.wrapped.append((target, name))
+
+    def instrument_database(self, db_manager, prefix='db'):
+        # Methods plus the SQL they send, traced on every pooled connection
+        if not self.enabled:
+            return
+        self.instrument(db_manager, prefix)
+        if db_manager.pool not in self.pools:
+            db_manager.pool.set_trace_callback(self.trace_statement)
+            self.pools.append(db_manager.pool)
+
+    def timed(self, name, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            stack = getattr(self.local, 'stack', None)
+            if stack is None:
+                stack = self.local.stack = []
+            call = {'name': name, 'sql': {}, 'statements': 0}
+            stack.append(call)
+            started = time.perf_counter()
+            error = None
+            try:
+                result = function(*args, **kwargs)
+            except Exception as exception:
+                error = f'{type(exception).__name__}: {exception}'
+                raise
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                stack.pop()
+                self.record(call, elapsed, result if error is None else None, error)
+            return result
+        return wrapper
+
+    def trace_statement(self, statement):
+        # Called by SQLite for every statement; attributed to the innermost profiled call on this thread
+        stack = getattr(self.local, 'stack', None)
+        if not stack:
+            return
+        call = stack[-1]
+        call['statements'] += 1
+        if len(call['sql']) < MAX_STATEMENTS:
+            call['sql'].setdefault(' '.join(statement.split()), None)
+
+    def record(self, call, elapsed, result, error):
+        entry = {
+            'ts': round(time.time(), 6),
+            'name': call['name'],
+            'ms': round(elapsed, 3),
+            'rows': len(result) if isinstance(result, list) else None,
+            'statements': call['statements'],
+            'sql': list(call['sql']),
+            'thread': threading.current_thread().name,
+        }
+        if error:
+            entry['error'] = error
+
+        with self.lock:
+            timings = self.samples.get(call['name'])
+            if timings is None:
+                timings = self.samples[call['name']] = deque(maxlen=self.max_samples)
+            timings.append(elapsed)
+            self.recent.append(entry)
+        self.write(entry)
+
+    def write(self, entry):
+        with self.lock:
+            if self.trace_file:
+                self.trace_file.write(json.dumps(entry) + '\n')
+
+    def summary(self):
+        with self.lock:
+            samples = {name: list(timings) for name, timings in self.samples.items()}
+        return summarize(samples)
+
+    def recent_calls(self):
+        with self.lock:
+            return list(self.recent)
+
+    def clear(self):
+        with self.lock:
+            self.samples = {}
+            self.recent.clear()
+
+
+class StartupTimer:
+    # Milliseconds from process start (or from construction) to each named startup step, printed once the
+    # steps a report waits for have all happened
+    def __init__(self, started=None, waits_for=(), file=sys.stderr):
+        self.started = time.perf_counter() if started is None else started
+        self.last = self.started
+        self.steps = []
+        self.waits_for = set(waits_for)
+        self.file = file
+        self.reported = False
+
+    def mark(self, name):
+        # Only the first time each step happens counts
+        if self.reported or any(step == name for step, _, _ in self.steps):
+            return
+        now = time.perf_counter()
+        self.steps.append((name, (now - self.last) * 1000, (now - self.started) * 1000))
+        self.last = now
+        self.waits_for.discard(name)
+        if not self.waits_for:
+            self.report()
+
+    def report(self):
+        self.reported = True
+        print(f"{'Startup step':<36}{'Step ms':>10}{'Total ms':>10}", file=self.file)
+        for name, step_ms, total_ms in self.steps:
+            print(f"{name:<36}{step_ms:>10.1f}{total_ms:>10.1f}", file=self.file)
+
+
+def summarize_trace(path):
+    # Percentiles per call name from a JSONL trace, including traces cut short without a summary line
+    samples = {}
+    with open(path, encoding='utf-8') as trace_file:
+        for line in trace_file:
+            entry = json.loads(line)
+            if 'name' in entry:
+                samples.setdefault(entry['name'], []).append(entry['ms'])
+    return summarize(samples)
+
+
+def print_summary(summary, file=sys.stdout):
+    print(f"{'Call':<44}{'Count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Max ms':>10}", file=file)
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]['total_ms']):
+        print(f"{name:<44}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}", file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a Money Tracker profiling trace")
+    parser.add_argument("trace", help="JSONL trace written with --trace")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    summary = summarize_trace(args.trace)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+from calendar import monthrange
+from datetime import date
+
+FREQUENCIES = ["daily", "weekly", "monthly", "yearly", "last business day"]
+
+# Day-based schedules step through date ordinals, month-based ones through months counted from year 0
+DAY_STEPS = {"daily": 1, "weekly": 7}
+MONTH_STEPS = {"monthly": 1, "yearly": 12, "last business day": 1}
+
+
+def month_days(month_index):
+    # (ordinal of the 1st, number of days) for a year * 12 + month - 1 index
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, 1).toordinal(), monthrange(year, month + 1)[1]
+
+
+def occurrence_ordinals(frequency, every, start, first, last):
+    # Ordinals of a schedule anchored on start that fall between first and last, computed without walking the days
+    first = max(first, start)
+    if first > last:
+        return []
+
+    if frequency in DAY_STEPS:
+        step = DAY_STEPS[frequency] * every
+        skipped = -(-(first - start) // step)
+        return range(start + skipped * step, last + 1, step)
+
+    step = MONTH_STEPS[frequency] * every
+    anchor = date.fromordinal(start)
+    first_month = date.fromordinal(first)
+    last_month = date.fromordinal(last)
+    start_index = anchor.year * 12 + anchor.month - 1
+    skipped = (first_month.year * 12 + first_month.month - 1 - start_index) // step
+
+    ordinals = []
+    for month_index in range(start_index + skipped * step, last_month.year * 12 + last_month.month, step):
+        month_start, length = month_days(month_index)
+        if frequency == "last business day":
+            # Ordinal 1 was a Monday, so (ordinal - 1) % 7 is the weekday; Saturday and Sunday roll back to Friday
+            month_end = month_start + length - 1
+            ordinal = month_end - max(0, (month_end - 1) % 7 - 4)
+        else:
+            # A rule anchored on the 31st lands on the last day of shorter months
+            ordinal = month_start + min(anchor.day, length) - 1
+        if first <= ordinal <= last:
+            ordinals.append(ordinal)
+    return ordinals
+
+
+def occurrences(frequency, every, start_date, first_date, last_date, dates=None):
+    # ISO dates of the rule's occurrences between first_date and last_date; dates memoizes ordinal -> ISO string
+    if dates is None:
+        dates = {}
+    result = []
+    for ordinal in occurrence_ordinals(frequency, every, date.fromisoformat(start_date).toordinal(),
+                                       date.fromisoformat(first_date).toordinal(),
+                                       date.fromisoformat(last_date).toordinal()):
+        day = dates.get(ordinal)
+        if day is None:
+            day = dates[ordinal] = date.fromordinal(ordinal).isoformat()
+        result.append(day)
+    return result
+
+
+def next_occurrence(frequency, every, start_date, from_date, end_date=None):
+    # First occurrence on or after from_date, or None once the rule has ended
+    first = date.fromisoformat(from_date).toordinal()
+    # No schedule goes longer than a year per step without an occurrence, so the next one is within this window
+    horizon = first + 366 * every + 7
+    ordinals = occurrence_ordinals(frequency, every, date.fromisoformat(start_date).toordinal(), first, horizon)
+    if not ordinals:
+        return None
+    day = date.fromordinal(ordinals[0]).isoformat()
+    return day if end_date is None or day <= end_date else None
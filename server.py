@@ -0,0 +1,481 @@
+import sys
+import json
+import math
+import asyncio
+import hashlib
+import sqlite3
+import argparse
+import threading
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from database import (DEFAULT_ACCOUNT_ID, MAX_AMOUNT, DatabaseManager, ExpenseCategories, IncomeCategories,
+                      MissingRateError, QueryCache)
+
+# Loopback only: the API has no authentication, so it must never be reachable from another machine
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+MAX_PAGE = 10000
+STREAM_ROWS = 500  # Rows per chunk of a streamed listing
+MAX_BODY = 64 * 1024 * 1024
+
+REASONS = {
+    200: "OK", 201: "Created", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, target, version, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.version = version
+        self.path = url.path.rstrip('/') or '/'
+        self.query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def param(self, name, convert=str, default=None):
+        value = self.query.get(name)
+        if value is None or value == '':
+            return default
+        try:
+            return convert(value)
+        except ValueError:
+            raise HTTPError(400, f"invalid {name} {value!r}")
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'null')
+        except ValueError as error:
+            raise HTTPError(400, f"invalid JSON body: {error}")
+
+
+class Response:
+    # A JSON body, or with chunks an iterator of encoded pieces sent with chunked transfer encoding
+    def __init__(self, status=200, body=None, etag=None, chunks=None):
+        self.status = status
+        self.body = body
+        self.etag = etag
+        self.chunks = chunks
+
+
+def iso_date(value):
+    return date.fromisoformat(value).isoformat()
+
+
+def iso_month(value):
+    return date.fromisoformat(value + '-01').isoformat()[:7]
+
+
+def encode_cursor(transaction):
+    # Keyset position (date, id) of the last row of a page
+    return f"{transaction[4]},{transaction[0]}"
+
+
+def decode_cursor(value):
+    transaction_date, _, transaction_id = value.partition(',')
+    return iso_date(transaction_date), int(transaction_id)
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+class LedgerServer:
+    # JSON over HTTP/1.1 keep-alive on one asyncio loop; queries run on a fixed pool of threads, each reading
+    # through its own WAL connection from the DatabaseManager's pool, while writes queue on its one writer
+    def __init__(self, db_manager, workers=8):
+        self.db_manager = db_manager
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='api-reader')
+
+        # Encoded aggregate responses and their ETags, dropped by the same changes that drop the query cache
+        self.responses = QueryCache(maxsize=1024)
+        db_manager.add_listener(self.responses.invalidate)
+
+        # Commits from other processes (the desktop window, the CLI) never reach the listeners, so any move of
+        # SQLite's data_version, which counts commits made on other connections, clears every cache instead
+        self.watcher = sqlite3.connect(db_manager.db_path, check_same_thread=False)
+        self.watcher_lock = threading.Lock()
+        self.data_version = self.watcher.execute('PRAGMA data_version').fetchone()[0]
+        # The server's own writer is another connection to the watcher too; its commits are already handled
+        # by the listeners, so they only move the watcher's baseline on. The writer's own data_version, which
+        # its commits leave alone, tells whether another process committed in the meantime.
+        with db_manager.write_lock:
+            self.writer_version = db_manager.conn.execute('PRAGMA data_version').fetchone()[0]
+        db_manager.add_listener(self.own_write_committed)
+
+        self.routes = {
+            '/accounts': {'GET': self.get_accounts},
+            '/transactions': {'GET': self.get_transactions, 'POST': self.post_transactions},
+            '/search': {'GET': self.search},
+            '/totals': {'GET': self.get_totals},
+            '/totals/categories': {'GET': self.get_category_totals},
+            '/totals/monthly': {'GET': self.get_monthly_totals},
+            '/balances/daily': {'GET': self.get_daily_balances},
+        }
+        self.server = None
+
+    def own_write_committed(self, change):
+        with self.watcher_lock:
+            self.data_version = self.watcher.execute('PRAGMA data_version').fetchone()[0]
+        # Read after the new baseline, so any other commit the baseline took in shows up here too
+        with self.db_manager.write_lock:
+            writer_version = self.db_manager.conn.execute('PRAGMA data_version').fetchone()[0]
+            external = writer_version != self.writer_version
+            self.writer_version = writer_version
+        if external:
+            self.clear_caches()
+
+    def check_external_writes(self):
+        with self.watcher_lock:
+            data_version = self.watcher.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self.data_version:
+                return
+            self.data_version = data_version
+        self.clear_caches()
+
+    def clear_caches(self):
+        self.db_manager.cache.clear()
+        self.responses.clear()
+        self.db_manager.load_lookups()
+
+    async def run(self, function):
+        # function(db_manager) on the reader pool, after catching up with writes made elsewhere
+        def call():
+            self.check_external_writes()
+            return function(self.db_manager)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def cached(self, request, types, start_date, end_date, account_id, function):
+        # An aggregate answered from its cached encoding; a matching If-None-Match skips the body altogether
+        key = (request.path, tuple(sorted(request.query.items())))
+
+        def compute():
+            body = dumps(function(self.db_manager))
+            return body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+        body, etag = await self.run(lambda db_manager: self.responses.get(
+            key, types, start_date, end_date, compute, None if account_id is None else (account_id,)))
+        if request.headers.get('if-none-match') == etag:
+            return Response(304, etag=etag)
+        return Response(200, body, etag)
+
+    def account_param(self, request):
+        account_id = request.param('account', int)
+        if account_id is not None and account_id not in self.db_manager.accounts:
+            self.db_manager.load_lookups()
+            if account_id not in self.db_manager.accounts:
+                raise HTTPError(404, f"no account {account_id}")
+        return account_id
+
+    def type_param(self, request, default=None):
+        transaction_type = request.param('type', str.capitalize, default)
+        if transaction_type not in (None, "Income", "Expense"):
+            raise HTTPError(400, "type has to be income or expense")
+        return transaction_type
+
+    def transaction_json(self, transaction):
+        transaction_id, transaction_type, category, amount, transaction_date, description, account_id = transaction
+        return {
+            'id': transaction_id, 'type': transaction_type, 'category': category, 'amount': amount,
+            'currency': self.db_manager.accounts[account_id][1], 'date': transaction_date,
+            'description': description or '', 'account': account_id,
+        }
+
+    def stream_transactions(self, transactions, next_cursor):
+        # {"transactions": [...], "next": cursor} in pieces of STREAM_ROWS rows
+        yield b'{"transactions":['
+        for start in range(0, len(transactions), STREAM_ROWS):
+            rows = (dumps(self.transaction_json(transaction)) for transaction in
+                    transactions[start:start + STREAM_ROWS])
+            yield (b',' if start else b'') + b','.join(rows)
+        yield b'],"next":' + dumps(next_cursor) + b'}'
+
+    async def get_accounts(self, request):
+        accounts = await self.run(lambda db_manager: db_manager.get_accounts())
+        return Response(200, dumps({
+            'base_currency': self.db_manager.base_currency,
+            'accounts': [{'id': account_id, 'name': name, 'currency': currency}
+                         for account_id, name, currency in accounts],
+        }))
+
+    async def get_transactions(self, request):
+        # Newest first; pass the returned next cursor as after= for the following page
+        limit = min(request.param('limit', int, 100), MAX_PAGE)
+        after = request.param('after', decode_cursor)
+        account_id = self.account_param(request)
+        transactions = await self.run(lambda db_manager: db_manager.get_transactions_page(limit, after, account_id))
+        next_cursor = encode_cursor(transactions[-1]) if len(transactions) == limit else None
+        return Response(chunks=self.stream_transactions(transactions, next_cursor))
+
+    async def search(self, request):
+        # Full-text search, newest first; the next cursor is the before= id of the following page
+        text = request.param('q')
+        if not text:
+            raise HTTPError(400, "q is required")
+        limit = min(request.param('limit', int, 100), MAX_PAGE)
+        before_id = request.param('before', int)
+        transaction_type = self.type_param(request)
+        start_date, end_date = request.param('start', iso_date), request.param('end', iso_date)
+        date_range = (start_date or '0001-01-01', end_date or '9999-12-31') if start_date or end_date else None
+        account_id = self.account_param(request)
+        transactions = await self.run(lambda db_manager: db_manager.search_transactions(
+            text, transaction_type, date_range, limit, before_id, account_id))
+        next_cursor = str(transactions[-1][0]) if len(transactions) == limit else None
+        return Response(chunks=self.stream_transactions(transactions, next_cursor))
+
+    async def get_totals(self, request):
+        transaction_type = self.type_param(request, "Expense")
+        start_date, end_date = request.param('start', iso_date), request.param('end', iso_date)
+        account_id = self.account_param(request)
+        return await self.cached(request, (transaction_type,), start_date, end_date, account_id, lambda db_manager: {
+            'currency': db_manager.account_scope(account_id)[1],
+            'total': db_manager.get_total_amount_by_type(transaction_type, start_date, end_date, account_id),
+        })
+
+    async def get_category_totals(self, request):
+        transaction_type = self.type_param(request, "Expense")
+        start_date, end_date = request.param('start', iso_date), request.param('end', iso_date)
+        account_id = self.account_param(request)
+        return await self.cached(request, (transaction_type,), start_date, end_date, account_id, lambda db_manager: {
+            'currency': db_manager.account_scope(account_id)[1],
+            'categories': dict(db_manager.get_category_totals(transaction_type, start_date, end_date, account_id)),
+        })
+
+    async def get_monthly_totals(self, request):
+        start_month, end_month = request.param('start', iso_month), request.param('end', iso_month)
+        account_id = self.account_param(request)
+        return await self.cached(
+            request, ("Income", "Expense"), start_month and start_month + '-01', end_month and end_month + '-31',
+            account_id, lambda db_manager: {
+                'currency': db_manager.account_scope(account_id)[1],
+                'months': [{'month': year_month, 'income': income, 'expense': expense} for year_month, income, expense
+                           in db_manager.get_monthly_totals(start_month, end_month, account_id)],
+            })
+
+    async def get_daily_balances(self, request):
+        start_date, end_date = request.param('start', iso_date), request.param('end', iso_date)
+        account_id = self.account_param(request)
+        # Every earlier transaction is part of a balance, so the range is open at the start
+        return await self.cached(request, ("Income", "Expense"), None, end_date, account_id, lambda db_manager: {
+            'currency': db_manager.account_scope(account_id)[1],
+            'balances': db_manager.get_daily_balances(start_date, end_date, account_id),
+        })
+
+    async def post_transactions(self, request):
+        # One transaction object, or an array of them loaded through bulk_insert
+        payload = request.json()
+        single = isinstance(payload, dict)
+        items = [payload] if single else payload
+        if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+            raise HTTPError(400, "expected a transaction object or a non-empty array of them")
+
+        by_account = {}
+        for number, item in enumerate(items):
+            try:
+                account_id, transaction = self.parse_transaction(item)
+            except (KeyError, TypeError, ValueError) as error:
+                raise HTTPError(400, f"transaction {number}: {error}")
+            by_account.setdefault(account_id, []).append(transaction)
+
+        if single:
+            (account_id, [transaction]), = by_account.items()
+            transaction_id = await self.run(lambda db_manager: db_manager.add_transaction(*transaction, account_id))
+            return Response(201, dumps({'id': transaction_id}))
+
+        def insert(db_manager):
+            return sum(db_manager.bulk_insert(transactions, account_id=account_id)
+                       for account_id, transactions in by_account.items())
+        return Response(201, dumps({'inserted': await self.run(insert)}))
+
+    def parse_transaction(self, item):
+        # (account_id, (type, category, amount, date, description)) from a posted object
+        transaction_type = str(item['type']).capitalize()
+        category_class = {"Income": IncomeCategories, "Expense": ExpenseCategories}.get(transaction_type)
+        if category_class is None:
+            raise ValueError("type has to be income or expense")
+        categories = {category.lower(): category for category in category_class.get_all_categories()}
+        category = categories.get(str(item['category']).lower())
+        if category is None:
+            raise ValueError(f"unknown {transaction_type.lower()} category {item['category']!r}")
+        amount = float(item['amount'])
+        if not math.isfinite(amount):
+            raise ValueError(f"amount has to be a number, not {item['amount']!r}")
+        if not 0 < amount <= MAX_AMOUNT:
+            raise ValueError(f"amount has to be greater than zero and at most {MAX_AMOUNT:,}")
+        account_id = int(item.get('account', DEFAULT_ACCOUNT_ID))
+        if account_id not in self.db_manager.accounts:
+            raise ValueError(f"no account {account_id}")
+        transaction_date = iso_date(item.get('date') or date.today().isoformat())
+        return account_id, (transaction_type, category, amount, transaction_date, str(item.get('description', '')))
+
+    async def dispatch(self, request):
+        methods = self.routes.get(request.path)
+        if methods is None:
+            if request.path.startswith('/transactions/') and request.method == 'GET':
+                return await self.get_transaction(request)
+            raise HTTPError(404, f"no endpoint {request.path}")
+        handler = methods.get(request.method)
+        if handler is None:
+            raise HTTPError(405, f"{request.path} accepts {', '.join(methods)}")
+        return await handler(request)
+
+    async def get_transaction(self, request):
+        try:
+            transaction_id = int(request.path.rsplit('/', 1)[1])
+        except ValueError:
+            raise HTTPError(404, f"no endpoint {request.path}")
+        transaction = await self.run(lambda db_manager: db_manager.get_transaction(transaction_id))
+        if transaction is None:
+            raise HTTPError(404, f"no transaction {transaction_id}")
+        return Response(200, dumps(self.transaction_json(transaction)))
+
+    async def respond(self, request):
+        try:
+            return await self.dispatch(request)
+        except HTTPError as error:
+            return Response(error.status, dumps({'error': str(error)}))
+        except MissingRateError as error:
+            return Response(422, dumps({'error': str(error)}))
+        except ValueError as error:
+            return Response(400, dumps({'error': str(error)}))
+        except sqlite3.Error as error:
+            return Response(500, dumps({'error': str(error)}))
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                if isinstance(request, Response):
+                    await self.write_response(writer, request, False)
+                    break
+
+                response = await self.respond(request)
+                connection = request.headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (request.version == 'HTTP/1.1' or connection == 'keep-alive')
+                await self.write_response(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        # A Request, a Response to send before hanging up on a malformed one, or None once the client is gone
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            return Response(400, dumps({'error': "malformed request line"}))
+
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = header.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return Response(400, dumps({'error': "invalid Content-Length"}))
+        if length > MAX_BODY:
+            return Response(413, dumps({'error': f"bodies are limited to {MAX_BODY:,} bytes"}))
+        body = await reader.readexactly(length) if length else b''
+
+        return Request(method.upper(), target, version.upper(), headers, body)
+
+    async def write_response(self, writer, response, keep_alive):
+        head = [f"HTTP/1.1 {response.status} {REASONS[response.status]}",
+                "Content-Type: application/json",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if response.etag:
+            head += [f"ETag: {response.etag}", "Cache-Control: no-cache"]
+
+        if response.chunks is None:
+            body = response.body or b''
+            head.append(f"Content-Length: {len(body)}")
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+            return
+
+        # Streamed: each piece goes out as soon as it is encoded, so a large page never sits in memory twice
+        head.append("Transfer-Encoding: chunked")
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        for chunk in response.chunks:
+            if chunk:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def start(self, port=DEFAULT_PORT):
+        self.server = await asyncio.start_server(self.handle_connection, HOST, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, port=DEFAULT_PORT):
+        await self.start(port)
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.db_manager.remove_listener(self.responses.invalidate)
+        self.db_manager.remove_listener(self.own_write_committed)
+        self.executor.shutdown(wait=True)
+        self.watcher.close()
+
+
+def serve(db_manager, port=DEFAULT_PORT, workers=8, ready=None):
+    # Runs until interrupted; ready(port) is called once the socket is listening
+    api = LedgerServer(db_manager, workers)
+
+    async def main():
+        bound_port = await api.start(port)
+        if ready:
+            ready(bound_port)
+        async with api.server:
+            await api.server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Money Tracker local JSON API")
+    parser.add_argument("--db", default="money_tracker.db", help="database file (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port on 127.0.0.1 (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=8, help="query threads (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    db_manager = DatabaseManager(args.db)
+    try:
+        serve(db_manager, args.port, args.workers,
+              lambda port: print(f"Serving {args.db} on http://{HOST}:{port}", file=sys.stderr))
+    finally:
+        db_manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
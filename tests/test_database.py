@@ -0,0 +1,244 @@
+import sqlite3
+
+import database
+from database import MIGRATIONS, Change, DatabaseManager, QueryCache
+
+
+def derived_tables(db_manager):
+    # (monthly_rollup, daily_balance) as stored, and as rebuilt from scratch out of the transactions
+    cursor = db_manager.conn.cursor()
+    cursor.execute('''
+    SELECT account_id, type_id, category_id, year_month, total_cents, count FROM monthly_rollup
+    WHERE count > 0 ORDER BY 1, 2, 3, 4
+    ''')
+    rollup = cursor.fetchall()
+    cursor.execute('''
+    SELECT account_id, type_id, category_id, substr(date, 1, 7), SUM(amount_cents), COUNT(*) FROM transactions
+    GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+    ''')
+    expected_rollup = cursor.fetchall()
+
+    # Days left with no transactions keep their row at a zero net amount
+    cursor.execute('''
+    SELECT account_id, day, net_cents, balance_cents FROM daily_balance WHERE net_cents != 0 ORDER BY 1, 2
+    ''')
+    balances = cursor.fetchall()
+    cursor.execute('''
+    SELECT transactions.account_id, transactions.date,
+           SUM(CASE types.name WHEN 'Income' THEN amount_cents WHEN 'Expense' THEN -amount_cents ELSE 0 END)
+    FROM transactions JOIN types ON types.id = transactions.type_id
+    GROUP BY 1, 2 ORDER BY 1, 2
+    ''')
+    expected_balances = []
+    running = {}
+    for account_id, day, net_cents in cursor.fetchall():
+        running[account_id] = running.get(account_id, 0) + net_cents
+        if net_cents:
+            expected_balances.append((account_id, day, net_cents, running[account_id]))
+    return (rollup, balances), (expected_rollup, expected_balances)
+
+
+def ledger():
+    db_manager = DatabaseManager(':memory:')
+    db_manager.bulk_insert([
+        ("Income", "Salary", 3000.0, "2024-01-01", "January pay"),
+        ("Expense", "Food", 42.5, "2024-01-03", "groceries"),
+        ("Expense", "Transport", 12.0, "2024-01-03", "bus pass"),
+        ("Expense", "Food", 18.25, "2024-02-10", "market"),
+        ("Income", "Salary", 3000.0, "2024-02-01", "February pay"),
+        ("Expense", "Utilities", 90.0, "2024-03-15", "power bill"),
+    ])
+    return db_manager
+
+
+def test_migrates_a_version_0_ledger(tmp_path):
+    path = str(tmp_path / "old.db")
+    connection = sqlite3.connect(path)
+    connection.execute('''
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, category TEXT NOT NULL, amount REAL NOT NULL,
+        date TEXT NOT NULL, description TEXT
+    )
+    ''')
+    connection.executemany('''
+    INSERT INTO transactions (type, category, amount, date, description) VALUES (?, ?, ?, ?, ?)
+    ''', [("Income", "Salary", 1000.0, "2023-12-31", "pay"), ("Expense", "Food", 19.99, "2024-01-02", "lunch")])
+    connection.commit()
+    connection.close()
+
+    db_manager = DatabaseManager(path)
+    assert db_manager.conn.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS)
+    assert sorted(db_manager.get_all_transactions()) == [
+        (1, "Income", "Salary", 1000.0, "2023-12-31", "pay", 1),
+        (2, "Expense", "Food", 19.99, "2024-01-02", "lunch", 1),
+    ]
+    assert db_manager.get_balance_at("2024-01-02") == 980.01
+    assert [row[0] for row in db_manager.search_transactions("lunch")] == [2]
+    current, expected = derived_tables(db_manager)
+    assert current == expected
+    db_manager.close()
+
+    # Opening an up-to-date ledger runs nothing again
+    db_manager = DatabaseManager(path)
+    assert db_manager.conn.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS)
+    assert len(db_manager.get_all_transactions()) == 2
+    db_manager.close()
+
+
+def test_failed_migration_keeps_the_previous_version(tmp_path, monkeypatch):
+    path = str(tmp_path / "ledger.db")
+    DatabaseManager(path).close()
+    connection = sqlite3.connect(path)
+    connection.execute(f'PRAGMA user_version = {len(MIGRATIONS) - 1}')
+    connection.commit()
+    connection.close()
+
+    def broken(cursor):
+        cursor.execute('CREATE TABLE half_done (id INTEGER)')
+        raise sqlite3.OperationalError("disk full")
+
+    monkeypatch.setattr(database, 'MIGRATIONS', MIGRATIONS[:-1] + [broken])
+    try:
+        DatabaseManager(path)
+    except sqlite3.OperationalError:
+        pass
+    else:
+        raise AssertionError("the broken migration was not run")
+
+    connection = sqlite3.connect(path)
+    assert connection.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS) - 1
+    assert connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone()[0] == 0
+    connection.close()
+
+
+def test_derived_tables_follow_every_kind_of_write():
+    db_manager = ledger()
+    savings = db_manager.add_account("Savings", "USD")
+    current, expected = derived_tables(db_manager)
+    assert current == expected
+
+    db_manager.add_transaction("Expense", "Food", 7.5, "2024-01-02", "coffee")
+    db_manager.add_transaction("Income", "Gift", 50.0, "2024-02-20", "birthday", account_id=savings)
+    current, expected = derived_tables(db_manager)
+    assert current == expected
+
+    food = [row[0] for row in db_manager.get_all_transactions() if row[2] == "Food"]
+    db_manager.update_transactions(food, category="Entertainment")
+    db_manager.update_transactions(food[:1], date="2023-12-30", account_id=savings)
+    current, expected = derived_tables(db_manager)
+    assert current == expected
+
+    db_manager.delete_transactions(food + [1])
+    current, expected = derived_tables(db_manager)
+    assert current == expected
+    assert db_manager.get_balance_at("2024-03-31") == 3000.0 - 12.0 - 90.0 + 50.0
+    db_manager.close()
+
+
+def test_update_rejects_a_category_of_another_type():
+    db_manager = ledger()
+    salary = [row[0] for row in db_manager.get_all_transactions() if row[1] == "Income"]
+    try:
+        db_manager.update_transactions(salary, category="Food")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Food was accepted as an income category")
+    assert {row[2] for row in db_manager.get_all_transactions() if row[1] == "Income"} == {"Salary"}
+    db_manager.close()
+
+
+def test_keyset_pages_cover_every_row_once():
+    db_manager = DatabaseManager(':memory:')
+    db_manager.bulk_insert([("Expense", "Food", number + 1.0, f"2024-01-{number % 28 + 1:02d}", f"meal {number}")
+                            for number in range(95)])
+    rows = []
+    after = None
+    while True:
+        page = db_manager.get_transactions_page(10, after)
+        rows.extend(page)
+        if len(page) < 10:
+            break
+        after = (page[-1][4], page[-1][0])
+    assert len(rows) == 95
+    assert [(row[4], row[0]) for row in rows] == sorted(((row[4], row[0]) for row in rows), reverse=True)
+
+    found = []
+    before_id = None
+    while True:
+        page = db_manager.search_transactions("meal", limit=10, before_id=before_id)
+        found.extend(page)
+        if len(page) < 10:
+            break
+        before_id = page[-1][0]
+    assert [row[0] for row in found] == list(range(95, 0, -1))
+    db_manager.close()
+
+
+def test_query_cache_drops_only_what_a_change_touches():
+    cache = QueryCache()
+    computed = []
+
+    def lookup(key, types, start_date, end_date):
+        return cache.get(key, types, start_date, end_date, lambda: computed.append(key) or [key])
+
+    lookup("january food", ("Expense",), "2024-01-01", "2024-01-31")
+    lookup("march food", ("Expense",), "2024-03-01", "2024-03-31")
+    lookup("january pay", ("Income",), "2024-01-01", "2024-01-31")
+    assert lookup("january food", ("Expense",), "2024-01-01", "2024-01-31") == ("january food",)
+    assert len(computed) == 3
+
+    cache.invalidate(Change('insert', ("Expense",), "2024-01-15", "2024-01-15"))
+    lookup("january food", ("Expense",), "2024-01-01", "2024-01-31")
+    lookup("march food", ("Expense",), "2024-03-01", "2024-03-31")
+    lookup("january pay", ("Income",), "2024-01-01", "2024-01-31")
+    assert computed == ["january food", "march food", "january pay", "january food"]
+
+
+def test_writes_invalidate_cached_totals():
+    db_manager = ledger()
+    assert dict(db_manager.get_category_totals("Expense", "2024-01-01", "2024-01-31"))["Food"] == 42.5
+    db_manager.add_transaction("Expense", "Food", 7.5, "2024-01-20")
+    assert dict(db_manager.get_category_totals("Expense", "2024-01-01", "2024-01-31"))["Food"] == 50.0
+    db_manager.delete_transactions([2])
+    assert dict(db_manager.get_category_totals("Expense", "2024-01-01", "2024-01-31"))["Food"] == 7.5
+    db_manager.close()
+
+
+def test_foreign_accounts_convert_at_the_rate_in_effect():
+    db_manager = DatabaseManager(':memory:')
+    euro_account = db_manager.add_account("Euro Savings", "EUR")
+    db_manager.set_fx_rate("EUR", "USD", "2024-01-01", 1.1)
+    db_manager.set_fx_rate("EUR", "USD", "2024-02-01", 1.2)
+    db_manager.add_transaction("Expense", "Food", 100.0, "2024-01-15", account_id=euro_account)
+    db_manager.add_transaction("Expense", "Food", 100.0, "2024-02-15", account_id=euro_account)
+    db_manager.add_transaction("Expense", "Food", 10.0, "2024-02-15")
+
+    # Each month's totals convert at its closing rate; the account's own view stays in euros
+    assert db_manager.get_monthly_totals("2024-01", "2024-02") == (("2024-01", 0.0, 110.0), ("2024-02", 0.0, 130.0))
+    assert db_manager.get_total_amount_by_type("Expense", account_id=euro_account) == 200.0
+    assert db_manager.convert(10.0, "USD", "EUR", "2024-02-15") == 8.33
+    db_manager.close()
+
+
+def test_new_first_rate_invalidates_earlier_totals():
+    # A pair's first rate converts all history before it, so a rate that becomes the new first one has to
+    # drop cached totals from before the old first rate as well
+    db_manager = DatabaseManager(':memory:')
+    euro_account = db_manager.add_account("Euro Savings", "EUR")
+    db_manager.set_fx_rate("EUR", "USD", "2024-06-01", 2.0)
+    db_manager.add_transaction("Expense", "Food", 100.0, "2024-01-15", account_id=euro_account)
+
+    assert dict(db_manager.get_category_totals("Expense", "2024-01-01", "2024-01-31"))["Food"] == 200.0
+
+    db_manager.set_fx_rate("EUR", "USD", "2024-03-01", 1.0)
+    assert dict(db_manager.get_category_totals("Expense", "2024-01-01", "2024-01-31"))["Food"] == 100.0
+    db_manager.close()
+
+
+def test_cached_results_cannot_be_changed_by_callers():
+    db_manager = ledger()
+    balances = db_manager.get_daily_balances(None, "2024-02-01")
+    assert isinstance(balances, tuple)
+    assert db_manager.get_daily_balances(None, "2024-02-01") == balances
+    db_manager.close()
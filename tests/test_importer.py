@@ -0,0 +1,66 @@
+import pytest
+
+from database import DatabaseManager
+from importer import import_file, validate_transactions
+
+
+def validate(records):
+    rejected = []
+    accepted = list(validate_transactions(records, rejected))
+    return accepted, rejected
+
+
+def test_normalizes_types_categories_and_signed_amounts():
+    accepted, rejected = validate([
+        (2, "expense", " food ", "12.50", "2024-01-05", "lunch"),
+        (3, "", "Salary", "2500", "2024-01-31", "pay"),
+        (4, "", "Other", "-8", "2024-02-01", "card fee"),
+    ])
+    assert rejected == []
+    assert accepted == [
+        ("Expense", "Food", 12.5, "2024-01-05", "lunch"),
+        ("Income", "Salary", 2500.0, "2024-01-31", "pay"),
+        ("Expense", "Other", 8.0, "2024-02-01", "card fee"),
+    ]
+
+
+@pytest.mark.parametrize("amount", ["abc", "nan", "inf", "-inf", "1e300"])
+def test_rejects_amounts_that_cannot_be_stored(amount):
+    accepted, rejected = validate([(2, "Expense", "Food", amount, "2024-01-05", "")])
+    assert accepted == []
+    assert [line for line, _ in rejected] == [2]
+
+
+def test_reports_every_bad_row_and_keeps_the_rest():
+    accepted, rejected = validate([
+        (2, "Expense", "Food", "0", "2024-01-05", ""),
+        (3, "Transfer", "Food", "5", "2024-01-05", ""),
+        (4, "Income", "Food", "5", "2024-01-05", ""),
+        (5, "Expense", "Food", "5", "2024-02-30", ""),
+        (6, "Expense", "Food", "5", "2024-02-29", ""),
+    ])
+    assert [line for line, _ in rejected] == [2, 3, 4, 5]
+    assert accepted == [("Expense", "Food", 5.0, "2024-02-29", "")]
+
+
+def test_import_file_skips_bad_rows(tmp_path):
+    path = tmp_path / "statement.csv"
+    path.write_text("type,category,amount,date,description\n"
+                    "Expense,Food,12.50,2024-01-05,lunch\n"
+                    "Expense,Food,nan,2024-01-06,broken\n"
+                    "Income,Salary,2500,2024-01-31,pay\n")
+    db_manager = DatabaseManager(':memory:')
+    imported, rejected = import_file(db_manager, str(path))
+    assert imported == 2
+    assert [line for line, _ in rejected] == [3]
+    assert db_manager.get_balance_at("2024-01-31") == 2487.5
+    db_manager.close()
+
+
+def test_import_file_needs_amount_and_date_columns(tmp_path):
+    path = tmp_path / "statement.csv"
+    path.write_text("when,how much\n2024-01-05,12.50\n")
+    db_manager = DatabaseManager(':memory:')
+    with pytest.raises(ValueError):
+        import_file(db_manager, str(path))
+    db_manager.close()
@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from database import Change, DatabaseManager  # noqa: E402
+from main import TransactionTableModel  # noqa: E402
+
+
+class ImmediateExecutor:
+    # Runs every page read inline, so the model can be driven without an event loop
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def submit(self, key, function, callback, failed=None):
+        callback(function(self.db_manager))
+
+
+@pytest.fixture
+def db_manager():
+    db_manager = DatabaseManager(':memory:')
+    db_manager.bulk_insert([("Expense", "Food", number + 1.0, f"2024-01-{number % 28 + 1:02d}", f"meal {number}")
+                            for number in range(95)])
+    yield db_manager
+    db_manager.close()
+
+
+def scrolled_model(db_manager):
+    model = TransactionTableModel(db_manager, ImmediateExecutor(db_manager))
+    model.PAGE_SIZE = 10
+    model.MAX_CACHED_PAGES = 3
+    while model.canFetchMore():
+        model.fetchMore()
+    return model
+
+
+def shown(model):
+    return [model.transaction(row) for row in range(model.rowCount())]
+
+
+def test_pages_through_every_row_keeping_a_few_pages(db_manager):
+    model = scrolled_model(db_manager)
+    assert model.rowCount() == 95
+    assert len(model.cached) == 3
+    assert sum(page[2] is not None for page in model.pages) == 3
+    assert shown(model) == list(db_manager.get_transactions_page(100))
+
+
+def test_evicted_page_is_read_back_when_shown(db_manager):
+    model = scrolled_model(db_manager)
+    assert model.pages[0][2] is None
+    index = model.index(0, 0)
+    model.data(index)  # Blank while the page is read back
+    assert model.pages[0][2] is not None
+    assert model.data(index) == str(db_manager.get_transactions_page(1)[0][0])
+    assert len(model.cached) == 3
+
+
+def test_writes_are_patched_into_loaded_and_evicted_pages(db_manager):
+    model = scrolled_model(db_manager)
+    newest = db_manager.get_transactions_page(1)[0]
+    assert model.pages[0][2] is None
+
+    db_manager.delete_transactions([newest[0]])
+    model.apply_changes([Change.from_rows('delete', [newest])])
+    transaction_id = db_manager.add_transaction("Expense", "Food", 1.0, "2024-01-15", "snack")
+    model.apply_changes([Change.from_rows('insert', [db_manager.get_transaction(transaction_id)])])
+
+    assert model.rowCount() == 95
+    assert shown(model) == list(db_manager.get_transactions_page(100))
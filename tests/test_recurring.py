@@ -0,0 +1,38 @@
+from database import DatabaseManager
+from recurring import next_occurrence, occurrences
+
+
+def test_day_based_schedules_step_from_their_start():
+    assert occurrences("daily", 3, "2024-01-01", "2024-01-05", "2024-01-15") == [
+        "2024-01-07", "2024-01-10", "2024-01-13"]
+    assert occurrences("weekly", 2, "2024-01-01", "2024-01-01", "2024-02-15") == [
+        "2024-01-01", "2024-01-15", "2024-01-29", "2024-02-12"]
+
+
+def test_monthly_schedules_clamp_to_short_months():
+    assert occurrences("monthly", 1, "2024-01-31", "2024-01-01", "2024-05-31") == [
+        "2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30", "2024-05-31"]
+    assert occurrences("yearly", 1, "2024-02-29", "2024-01-01", "2027-12-31") == [
+        "2024-02-29", "2025-02-28", "2026-02-28", "2027-02-28"]
+
+
+def test_last_business_day_rolls_back_from_weekends():
+    # August 2024 ends on a Saturday, June 2024 on a Sunday and May 2024 on a Friday
+    assert occurrences("last business day", 1, "2024-05-01", "2024-05-01", "2024-08-31") == [
+        "2024-05-31", "2024-06-28", "2024-07-31", "2024-08-30"]
+
+
+def test_next_occurrence_stops_at_the_end_date():
+    assert next_occurrence("monthly", 1, "2024-01-15", "2024-01-16") == "2024-02-15"
+    assert next_occurrence("monthly", 1, "2024-01-15", "2024-01-16", "2024-02-14") is None
+    assert next_occurrence("weekly", 1, "2024-01-01", "2023-06-01") == "2024-01-01"
+
+
+def test_booking_catches_up_once():
+    db_manager = DatabaseManager(':memory:')
+    db_manager.add_recurring_rule("Expense", "Utilities", 40.0, "monthly", "2024-01-10", description="internet")
+    assert db_manager.run_recurring_rules("2024-04-09") == 3
+    assert db_manager.run_recurring_rules("2024-04-09") == 0
+    assert sorted(row[4] for row in db_manager.get_all_transactions()) == ["2024-01-10", "2024-02-10", "2024-03-10"]
+    assert db_manager.get_recurring_rules()[0][8] == "2024-04-10"
+    db_manager.close()
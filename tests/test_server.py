@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pytest
+
+from database import DatabaseManager
+from server import HTTPError, LedgerServer, Request
+
+
+@pytest.fixture
+def api(tmp_path):
+    db_manager = DatabaseManager(str(tmp_path / "ledger.db"))
+    db_manager.bulk_insert([
+        ("Expense", "Food", 42.5, "2024-01-03", "groceries"),
+        ("Expense", "Transport", 12.0, "2024-01-03", "bus pass"),
+        ("Expense", "Food", 18.25, "2024-02-10", "market"),
+    ])
+    server = LedgerServer(db_manager, workers=2)
+    yield server
+    server.close()
+    db_manager.close()
+
+
+def call(api, method, target, headers=None, body=None):
+    request = Request(method, target, "HTTP/1.1", headers or {}, body and json.dumps(body).encode())
+    return asyncio.run(api.dispatch(request))
+
+
+def test_unchanged_totals_answer_304(api):
+    first = call(api, "GET", "/totals/categories?start=2024-01-01&end=2024-01-31")
+    assert first.status == 200
+    assert json.loads(first.body)["categories"] == {"Food": 42.5, "Transport": 12.0}
+
+    again = call(api, "GET", "/totals/categories?start=2024-01-01&end=2024-01-31", {"if-none-match": first.etag})
+    assert again.status == 304
+    assert again.body is None
+
+
+def test_a_write_changes_the_etag_of_what_it_touched(api):
+    january = call(api, "GET", "/totals?start=2024-01-01&end=2024-01-31")
+    february = call(api, "GET", "/totals?start=2024-02-01&end=2024-02-29")
+
+    posted = call(api, "POST", "/transactions",
+                  body={"type": "expense", "category": "food", "amount": 5, "date": "2024-01-20"})
+    assert posted.status == 201
+
+    changed = call(api, "GET", "/totals?start=2024-01-01&end=2024-01-31", {"if-none-match": january.etag})
+    assert changed.status == 200
+    assert json.loads(changed.body)["total"] == 59.5
+    assert call(api, "GET", "/totals?start=2024-02-01&end=2024-02-29",
+                {"if-none-match": february.etag}).status == 304
+
+
+def test_another_processs_write_changes_the_etag(api, tmp_path):
+    january = call(api, "GET", "/totals?start=2024-01-01&end=2024-01-31")
+    other = DatabaseManager(str(tmp_path / "ledger.db"))
+    other.add_transaction("Expense", "Food", 5.0, "2024-01-20")
+    other.close()
+
+    changed = call(api, "GET", "/totals?start=2024-01-01&end=2024-01-31", {"if-none-match": january.etag})
+    assert changed.status == 200
+    assert json.loads(changed.body)["total"] == 59.5
+
+
+@pytest.mark.parametrize("amount", ["inf", "nan", 1e300, 0])
+def test_rejects_amounts_that_cannot_be_stored(api, amount):
+    with pytest.raises(HTTPError) as error:
+        call(api, "POST", "/transactions", body={"type": "expense", "category": "food", "amount": amount})
+    assert error.value.status == 400